@@ -0,0 +1,48 @@
+"""Per-poll cost of an unchanged product body, with and without the hash fast path.
+
+Usage: python -m benchmarks.bench_content_hash
+"""
+import json
+import timeit
+
+from benchmarks.fixtures import make_product, product_body
+from utils.http_client import FetchResult
+
+ROUNDS = 2000
+
+
+def decode_and_diff(body: bytes, last_stock_status: dict) -> int:
+    """What every poll did before: decode the body and walk every variant."""
+    product = json.loads(body).get("product", {})
+    changed = 0
+    for variant in product.get("variants", []):
+        variant_id = variant.get("id")
+        available = variant.get("available", False)
+        if variant_id not in last_stock_status or last_stock_status[variant_id] != available:
+            last_stock_status[variant_id] = available
+            changed += 1
+    return changed
+
+
+def hash_fast_path(body: bytes, last_digest: int) -> bool:
+    """What a poll does now: fingerprint the bytes and compare."""
+    return FetchResult(200, body, {}).digest == last_digest
+
+
+def main():
+    body = product_body(make_product(100))
+    last_stock_status = {}
+    decode_and_diff(body, last_stock_status)
+    last_digest = FetchResult(200, body, {}).digest
+
+    before = timeit.timeit(lambda: decode_and_diff(body, last_stock_status), number=ROUNDS) / ROUNDS
+    after = timeit.timeit(lambda: hash_fast_path(body, last_digest), number=ROUNDS) / ROUNDS
+
+    print(f"Body size: {len(body) / 1024:.1f} KiB, 100 variants")
+    print(f"decode + diff: {before * 1e6:8.1f} us/poll")
+    print(f"hash compare:  {after * 1e6:8.1f} us/poll")
+    print(f"speed-up:      {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Restock detection latency with polling on the bot loop versus sharded worker processes.
+
+A local storefront serves every store (one per 127.x.y.z host) from a shared
+template whose ``updated_at`` changes on every request, so every poll decodes
+and diffs a full page. The driver flips one variant on random stores and
+measures how long the bot process takes to receive the stock event. It also
+reports the lag of the bot's own event loop, which is what delays Discord
+gateway heartbeats.
+
+Usage: python -m benchmarks.bench_feed_workers [--products 1000 10000 50000] [--workers 0 1 2 4 8]
+
+``0`` workers polls in-process. Scaling needs spare cores: on a machine with
+fewer cores than workers the numbers only show the IPC overhead.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from benchmarks.fixtures import make_product
+
+PORT = 8790
+PRODUCTS_PER_STORE = 50
+VARIANTS = 10
+INTERVAL = 5.0
+SAMPLES = 20
+SAMPLE_SPACING = 0.25
+
+
+def store_host(store: int) -> str:
+    return f"127.0.{store // 250}.{store % 250 + 1}:{PORT}"
+
+
+def store_index(host: str) -> int:
+    parts = host.split(":")[0].split(".")
+    return int(parts[2]) * 250 + int(parts[3]) - 1
+
+
+def page_templates():
+    """Return (normal, flipped) page bodies split around the ``updated_at`` counter."""
+    products = [make_product(VARIANTS, product_id=7000 + i, handle=f"p{i}") for i in range(PRODUCTS_PER_STORE)]
+    for product in products:
+        product["updated_at"] = "@@COUNTER@@"
+    normal = json.dumps({"products": products}).encode()
+    products[0]["variants"][0]["available"] = not products[0]["variants"][0]["available"]
+    flipped = json.dumps({"products": products}).encode()
+    return normal.split(b"\"@@COUNTER@@\""), flipped.split(b"\"@@COUNTER@@\"")
+
+
+def run_server(flags):
+    from aiohttp import web
+
+    random.seed(1)
+    normal, flipped = page_templates()
+    counter = [0]
+
+    async def products(request):
+        counter[0] += 1
+        template = flipped if flags[store_index(request.host)] else normal
+        stamp = str(counter[0]).encode()
+        return web.Response(body=stamp.join(template), content_type="application/json")
+
+    async def serve():
+        app = web.Application()
+        app.router.add_get("/products.json", products)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", PORT, reuse_port=True).start()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+async def measure(products: int, workers: int, flags, results):
+    from utils.feed_workers import FeedWorkerPool
+    from utils.http_client import session_registry
+    from utils.poll_scheduler import poll_scheduler
+    from utils.product_feed import product_feed
+    from utils.variant_events import STOCK_CHANGED
+
+    stores = products // PRODUCTS_PER_STORE
+    pool = None
+    if workers:
+        pool = FeedWorkerPool(workers)
+        await pool.start()
+        product_feed.use_workers(pool)
+
+    primed = [0]
+    all_primed = asyncio.Event()
+    flipped_at = {}
+    detected = {}
+
+    def watch(store: int, product: int):
+        async def on_update(update):
+            if update.initial:
+                primed[0] += 1
+                if primed[0] == products:
+                    all_primed.set()
+            if product == 0 and store in flipped_at and store not in detected:
+                if any(event.kind == STOCK_CHANGED for event in update.events):
+                    detected[store] = time.time() - flipped_at[store]
+        return on_update
+
+    for store in range(stores):
+        for product in range(PRODUCTS_PER_STORE):
+            product_feed.subscribe(
+                f"http://{store_host(store)}/products/p{product}", watch(store, product),
+                INTERVAL, INTERVAL, INTERVAL
+            )
+
+    lags = []
+
+    async def lag_probe():
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(0.05)
+            lags.append(time.monotonic() - start - 0.05)
+
+    probe = asyncio.get_running_loop().create_task(lag_probe())
+    try:
+        await asyncio.wait_for(all_primed.wait(), timeout=max(60, products / 200))
+    except asyncio.TimeoutError:
+        pass
+    warm = primed[0]
+    lags.clear()
+
+    for store in random.sample(range(stores), min(SAMPLES, stores)):
+        flipped_at[store] = time.time()
+        flags[store] = 1
+        await asyncio.sleep(SAMPLE_SPACING)
+    deadline = time.monotonic() + INTERVAL * 6
+    while len(detected) < len(flipped_at) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+    probe.cancel()
+    if pool:
+        await pool.close()
+    product_feed.close()
+    await poll_scheduler.close()
+    await session_registry.close()
+
+    latencies = sorted(detected.values()) or [float("nan")]
+    lags.sort()
+    results.put({
+        "primed": warm,
+        "detected": f"{len(detected)}/{len(flipped_at)}",
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "lagMax": lags[-1] if lags else 0.0,
+        "lagP99": lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+    })
+
+
+def run_config(products: int, workers: int, flags, results):
+    for store in range(len(flags)):
+        flags[store] = 0
+    asyncio.run(measure(products, workers, flags, results))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    flags = context.Array("b", max(args.products) // PRODUCTS_PER_STORE, lock=False)
+    servers = [
+        context.Process(target=run_server, args=(flags,), daemon=True)
+        for _ in range(min(4, os.cpu_count() or 1))
+    ]
+    for server in servers:
+        server.start()
+    time.sleep(2)
+
+    print(f"{os.cpu_count()} CPUs, {PRODUCTS_PER_STORE} products/store, {VARIANTS} variants/product, "
+          f"{INTERVAL:.0f}s interval, every poll decodes a changed page")
+    print(f"{'products':>8} {'workers':>7} {'primed':>7} {'detected':>8} {'p50 s':>7} {'p95 s':>7} "
+          f"{'loop lag p99 ms':>15} {'max ms':>7}")
+    try:
+        for products in args.products:
+            for workers in args.workers:
+                results = context.Queue()
+                config = context.Process(target=run_config, args=(products, workers, flags, results))
+                config.start()
+                result = results.get()
+                config.join()
+                print(f"{products:>8} {workers:>7} {result['primed']:>7} {result['detected']:>8} "
+                      f"{result['p50']:>7.2f} {result['p95']:>7.2f} "
+                      f"{result['lagP99'] * 1000:>15.1f} {result['lagMax'] * 1000:>7.1f}", flush=True)
+    finally:
+        for server in servers:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Product metadata extraction: old full-page parse vs targeted scanner vs JSON endpoint.
+
+Usage: python -m benchmarks.bench_metadata
+"""
+import json
+import re
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import make_product, product_body
+from utils.product_metadata import extract_product_metadata, extract_variants, scan_meta_json
+
+ROUNDS = 50
+URL = "https://shop.example.com/products/benchmark-product-7001"
+
+
+def make_theme_page(product: dict) -> str:
+    """A large theme page with the product embedded in ``var meta`` like real stores."""
+    meta = {"product": {**product, "type": product["product_type"]}, "page": {"pageType": "product"}}
+    filler = "".join(
+        f'<div class="card card--{i}"><a href="/products/item-{i}"><img src="//cdn/{i}.jpg" alt="Item {i}">'
+        f'<span class="price">$ {i}.00</span></a></div>\n'
+        for i in range(1500)
+    )
+    scripts = "<script>window.theme = {strings: {addToCart: 'Add to cart'}};</script>\n" * 50
+    return (
+        "<!doctype html><html><head><title>Product</title>\n" + scripts +
+        f"<script>var meta = {json.dumps(meta)};\n</script></head><body>\n" + filler + "</body></html>"
+    )
+
+
+def old_path(html: str) -> dict:
+    """The previous ShopifyMonitor._fetch_product_info parsing steps."""
+    json_match = re.search(r'var meta = (.*?);\n', html)
+    product_json = json.loads(json_match.group(1))
+    info = {"title": product_json.get("product", {}).get("title", "Unknown")}
+    BeautifulSoup(html, 'html.parser')
+    variants_match = re.search(r'var meta = ({.*?"variants":\s*\[.*?\]})', html)
+    if variants_match:
+        try:
+            json.loads(variants_match.group(1))
+        except json.JSONDecodeError:
+            pass
+    info["variants"] = product_json["product"]["variants"]
+    return info
+
+
+def scanner_path(html: str) -> dict:
+    product = scan_meta_json(html)["product"]
+    return {**extract_product_metadata(product, URL), "variants": extract_variants(product)}
+
+
+def json_endpoint_path(body: bytes) -> dict:
+    product = json.loads(body)["product"]
+    return {**extract_product_metadata(product, URL), "variants": extract_variants(product)}
+
+
+def main():
+    product = make_product(100)
+    html = make_theme_page(product)
+    body = product_body(product)
+
+    timings = {
+        "old (regex + BeautifulSoup)": timeit.timeit(lambda: old_path(html), number=ROUNDS) / ROUNDS,
+        "meta scanner": timeit.timeit(lambda: scanner_path(html), number=ROUNDS) / ROUNDS,
+        "JSON endpoint": timeit.timeit(lambda: json_endpoint_path(body), number=ROUNDS) / ROUNDS,
+    }
+
+    print(f"Page size: {len(html) / 1024:.0f} KiB, JSON body: {len(body) / 1024:.0f} KiB")
+    baseline = timings["old (regex + BeautifulSoup)"]
+    for name, seconds in timings.items():
+        print(f"{name:30s} {seconds * 1e3:8.2f} ms/call  ({baseline / seconds:6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Offline evaluation of predictive polling against fixed-interval polling.
+
+Replays a stock history: the last week is held out, restock windows are
+learned from the weeks before it, and every product is polled through the
+held-out week under each policy. Reports requests spent against how long
+restocks took to detect and how many sold out before any poll saw them.
+
+Without ``--db`` a synthetic history is generated first: every store drops
+stock at a few fixed times a week, with a few minutes of jitter, on top of
+random restocks at any hour.
+
+Usage: python -m benchmarks.bench_restock_predictor [--db instance/stock_history.db] [--weeks 5] [--stores 50]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import deque
+
+from utils.restock_predictor import WEEK, WEEK_OFFSET, RestockPredictor
+from utils.stock_history import KIND_CODES, StockHistory
+from utils.variant_events import STOCK_CHANGED
+
+PRODUCTS_PER_STORE = 40
+VARIANTS = 5
+DROPS_PER_WEEK = (1, 3)
+DROP_SHARE = 0.6
+DROP_JITTER = 180
+DROP_SELL_OUT = 300
+RANDOM_RESTOCKS_PER_WEEK = 0.5
+RANDOM_SELL_OUT = 1800
+
+
+def synthesize(path: str, weeks: int, stores: int) -> int:
+    """Write a history with weekly store drops plus background restocks."""
+    now = time.time()
+    start = now - weeks * WEEK
+    first_week = (start + WEEK_OFFSET) // WEEK * WEEK - WEEK_OFFSET
+    transitions = []
+    for store in range(stores):
+        drops = [random.randrange(WEEK // 60) * 60 for _ in range(random.randint(*DROPS_PER_WEEK))]
+        for product in range(PRODUCTS_PER_STORE):
+            url = f"https://store{store}.example/products/p{product}"
+            variant_base = (store * PRODUCTS_PER_STORE + product) * VARIANTS
+            restocks = []
+            for week in range(weeks + 1):
+                for drop in drops:
+                    if random.random() < DROP_SHARE:
+                        at = first_week + week * WEEK + drop + random.uniform(0, DROP_JITTER)
+                        restocks.append((at, random.expovariate(1 / DROP_SELL_OUT)))
+            for _ in range(int(weeks * RANDOM_RESTOCKS_PER_WEEK + random.random())):
+                restocks.append((random.uniform(start, now), random.expovariate(1 / RANDOM_SELL_OUT)))
+            for at, lasts in restocks:
+                if start <= at < now:
+                    variant = variant_base + random.randrange(VARIANTS)
+                    transitions.append((url, variant, at, True))
+                    transitions.append((url, variant, min(at + lasts, now - 1), False))
+
+    transitions.sort(key=lambda transition: transition[2])
+    history = StockHistory(path)
+    history._open()
+    rows = deque(
+        (url, variant, at, KIND_CODES[STOCK_CHANGED], int(available), 2500)
+        for url, variant, at, available in transitions
+    )
+    history._write(rows)
+    history._conn.close()
+    return len(transitions)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="Replay this stock history instead of a synthetic one")
+    parser.add_argument("--weeks", type=int, default=5)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=10)
+    parser.add_argument("--floor", type=float, default=2)
+    parser.add_argument("--ceiling", type=float, default=120)
+    args = parser.parse_args()
+    random.seed(1)
+
+    path = args.db
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "history.db")
+        events = synthesize(path, args.weeks, args.stores)
+        print(f"synthetic history: {events:,} stock transitions over {args.weeks} weeks, "
+              f"{args.stores * PRODUCTS_PER_STORE:,} products on {args.stores} stores")
+
+    predictor = RestockPredictor(path)
+    started = time.perf_counter()
+    results = predictor.evaluate(interval=args.interval, floor=args.floor, ceiling=args.ceiling)
+    print(f"replayed the last week in {time.perf_counter() - started:.1f}s")
+    print()
+    print(f"{'policy':<22} {'requests':>10} {'detected':>9} {'missed':>7} {'avg s':>7} {'p50 s':>7} {'p95 s':>7}")
+    labels = {
+        "fixed": f"fixed {args.interval:g}s",
+        "fixedSameRequests": f"fixed {results['fixedSameRequests']['interval']:g}s",
+        "predictive": "predictive"
+    }
+    for policy in ("fixed", "fixedSameRequests", "predictive"):
+        result = results[policy]
+        print(f"{labels[policy]:<22} {result['requests']:>10,} {result['detected']:>9,} {result['missed']:>7,} "
+              f"{result['latencyAvg'] or 0:>7.2f} {result['latencyP50'] or 0:>7.2f} {result['latencyP95'] or 0:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Analytics page latency over a large stock history.
+
+Fills a history database through the real writer with a month of synthetic
+stock transitions, then times the analytics summary cold and cached, against
+computing the same hour-of-day histogram and mean time in stock straight from
+the raw events.
+
+Usage: python -m benchmarks.bench_stock_analytics [--events 2000000] [--stores 200] [--products 20000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import deque
+
+from utils.stock_analytics import StockAnalytics
+from utils.stock_history import KIND_CODES, StockHistory
+from utils.variant_events import STOCK_CHANGED
+
+DAYS = 30
+VARIANTS = 10
+BATCH = 50000
+
+
+def fill(path: str, events: int, stores: int, products: int) -> float:
+    history = StockHistory(path)
+    history._open()
+    now = time.time()
+    start = now - DAYS * 86400
+    step = DAYS * 86400 / events
+    available = {}
+    started = time.perf_counter()
+    rows = deque()
+    for index in range(events):
+        product = random.randrange(products)
+        variant = product * 100 + random.randrange(VARIANTS)
+        state = available[variant] = not available.get(variant, False)
+        rows.append((f"https://store{product % stores}.example/products/p{product}", variant,
+                     start + index * step, KIND_CODES[STOCK_CHANGED], int(state), 2500))
+        if len(rows) == BATCH:
+            history._write(rows)
+            rows = deque()
+    if rows:
+        history._write(rows)
+    history._conn.close()
+    return time.perf_counter() - started
+
+
+def raw_scan(path: str) -> float:
+    """The same histogram and mean time in stock computed from raw events."""
+    since = time.time() - DAYS * 86400
+    started = time.perf_counter()
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "SELECT CAST(ts / 3600 AS INTEGER) % 24, COUNT(*) FROM stock_events "
+            "WHERE ts >= ? AND available = 1 GROUP BY 1", (since,)
+        ).fetchall()
+        conn.execute(
+            "SELECT AVG(next_ts - ts) FROM (SELECT ts, available, LEAD(ts) OVER "
+            "(PARTITION BY variant_id ORDER BY ts) AS next_ts FROM stock_events WHERE ts >= ?) "
+            "WHERE available = 1 AND next_ts IS NOT NULL", (since,)
+        ).fetchall()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000000)
+    parser.add_argument("--stores", type=int, default=200)
+    parser.add_argument("--products", type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    elapsed = fill(path, args.events, args.stores, args.products)
+    with sqlite3.connect(path) as conn:
+        hourly = conn.execute("SELECT COUNT(*) FROM store_hourly").fetchone()[0]
+        daily = conn.execute("SELECT COUNT(*) FROM product_daily").fetchone()[0]
+    print(f"wrote {args.events:,} events in {elapsed:.1f}s ({args.events / elapsed:,.0f}/s on the writer thread); "
+          f"{hourly:,} store-hours, {daily:,} product-days")
+
+    print(f"raw event scan (histogram + mean time in stock): {raw_scan(path) * 1000:,.0f} ms")
+
+    analytics = StockAnalytics(path)
+    for label, store in (("all stores", None), ("one store", "store7.example")):
+        started = time.perf_counter()
+        result = analytics.summary(DAYS, store)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        analytics.summary(DAYS, store)
+        warm = time.perf_counter() - started
+        print(f"summary, {label}: cold {cold * 1000:,.0f} ms, cached {warm * 1000:.3f} ms "
+              f"({result['totals']['restocks']:,} restocks, mean time in stock "
+              f"{result['totals']['meanTimeInStock'] or 0:,.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Sustained stock history ingest: a connection per insert versus the batched WAL writer.
+
+Events are published on the event bus at a fixed rate, as the product feed
+does, while a probe measures how late the event loop wakes up. The baseline
+is the old ``log_stock_change`` pattern (connect, insert, commit per event)
+run directly on the loop.
+
+Usage: python -m benchmarks.bench_stock_history [--rates 1000 5000 20000] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from utils.event_bus import STOCK_TOPIC, event_bus
+from utils.stock_history import StockHistory
+from utils.variant_events import STOCK_CHANGED, VariantEvent
+
+PRODUCTS = 5000
+TICK = 0.01
+BASELINE_EVENTS = 2000
+
+
+def make_event(now: float) -> VariantEvent:
+    product = random.randrange(PRODUCTS)
+    available = random.random() < 0.5
+    return VariantEvent(
+        STOCK_CHANGED, product * 1000 + random.randrange(20), "M / Black", random.randint(2000, 40000),
+        available, not available, available, now, f"https://store{product % 50}.example/products/p{product}"
+    )
+
+
+async def run(rate: int, seconds: float, produce) -> dict:
+    lags = []
+
+    async def probe():
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(TICK)
+            lags.append(time.monotonic() - start - TICK)
+
+    probe_task = asyncio.get_running_loop().create_task(probe())
+    per_tick = max(1, int(rate * TICK))
+    started = time.monotonic()
+    sent = 0
+    while time.monotonic() - started < seconds:
+        tick_start = time.monotonic()
+        now = time.time()
+        for _ in range(per_tick):
+            await produce(make_event(now))
+        sent += per_tick
+        await asyncio.sleep(max(0.0, TICK - (time.monotonic() - tick_start)))
+    elapsed = time.monotonic() - started
+    probe_task.cancel()
+    lags.sort()
+    return {
+        "sent": sent,
+        "offered": sent / elapsed,
+        "lagP99": lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0,
+        "lagMax": lags[-1] if lags else 0.0
+    }
+
+
+async def baseline(path: str) -> float:
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE stock_history (product_url TEXT, quantity INTEGER, timestamp TEXT)")
+    started = time.perf_counter()
+    for _ in range(BASELINE_EVENTS):
+        event = make_event(time.time())
+        with sqlite3.connect(path) as conn:
+            conn.execute("INSERT INTO stock_history (product_url, quantity, timestamp) VALUES (?, ?, ?)",
+                         (event.key, int(event.available), str(event.timestamp)))
+    return BASELINE_EVENTS / (time.perf_counter() - started)
+
+
+async def main(rates, seconds: float):
+    directory = tempfile.mkdtemp()
+    rate = await baseline(os.path.join(directory, "baseline.db"))
+    print(f"connection per insert: {rate:,.0f} events/s max, every insert blocks the loop")
+    print()
+    print(f"{'offered/s':>10} {'written/s':>10} {'dropped':>8} {'flushes':>8} {'flush avg ms':>12} "
+          f"{'flush max ms':>12} {'lag p99 ms':>10} {'lag max ms':>10}")
+
+    for target in rates:
+        history = StockHistory(os.path.join(directory, f"history-{target}.db"))
+        await history.start()
+        result = await run(target, seconds, lambda event: event_bus.publish(STOCK_TOPIC, event))
+        started = time.monotonic()
+        await history.close()
+        drain = time.monotonic() - started
+        stats = history.get_stats()
+        print(f"{result['offered']:>10,.0f} {stats['written'] / (seconds + drain):>10,.0f} {stats['dropped']:>8} "
+              f"{stats['flushes']:>8} {stats['flushAvgMs']:>12.1f} {stats['flushMaxMs']:>12.1f} "
+              f"{result['lagP99'] * 1000:>10.1f} {result['lagMax'] * 1000:>10.1f}", flush=True)
+
+    # Retention over everything just written, as if it had aged past the raw window
+    history = StockHistory(os.path.join(directory, f"history-{rates[-1]}.db"), raw_retention=0)
+    await history.start()
+    started = time.perf_counter()
+    await history.apply_retention(time.time() + 7200)
+    elapsed = time.perf_counter() - started
+    retention = history.last_retention
+    await history.close()
+    await event_bus.close()
+    print()
+    print(f"retention: downsampled {retention['downsampled']:,} events into hourly rollups in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    random.seed(1)
+    asyncio.run(main(args.rates, args.seconds))
@@ -0,0 +1,178 @@
+"""Event loop lag while slash commands read and write user data on a slow disk.
+
+A heartbeat task ticks on the loop the way the gateway heartbeat and event
+dispatch do, and records how late every tick runs. Meanwhile simulated
+commands (``/list_tasks``, ``/cancel_task``, ``/monitor``, ``/profile``) hit
+random users, through a store whose every call first sleeps ``--latency``
+seconds to stand in for a slow or contended disk. Three setups are compared:
+
+- ``blocking store``: the store called directly from the handlers, as the cogs used to
+- ``cache, sync``: the write-behind cache called with the blocking functions, so
+  only misses and flushes reach the disk, but misses still stall the loop
+- ``cache, async``: the ``*_async`` functions the cogs use now, where anything that
+  may touch the disk runs on the storage executor
+
+Usage: python -m benchmarks.bench_storage_loop_lag [--latency 0.05] [--users 2000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_user_store import make_user, new_monitor
+from utils.database import SqliteUserStore, UserDataCache
+
+HEARTBEAT_INTERVAL = 0.05
+
+
+class SlowDisk:
+    """Stand-in for a slow disk: every call to the wrapped store sleeps first."""
+
+    def __init__(self, store, latency: float):
+        self.store = store
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attribute = getattr(self.store, name)
+        if not callable(attribute):
+            return attribute
+
+        def slow(*args, **kwargs):
+            time.sleep(self.latency)
+            return attribute(*args, **kwargs)
+
+        return slow
+
+
+def percentile(values: list, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    expected = time.perf_counter() + HEARTBEAT_INTERVAL
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, expected - time.perf_counter()))
+        now = time.perf_counter()
+        lags.append(now - expected)
+        expected = now + HEARTBEAT_INTERVAL
+
+
+def blocking_commands(store):
+    def list_tasks(user_id):
+        [task for task in store.load_section(user_id, "checkout_tasks") if task.get("active", False)]
+
+    def cancel_task(user_id):
+        tasks = store.load_section(user_id, "checkout_tasks")
+        if tasks:
+            store.update_item(user_id, "checkout_tasks", random.choice(tasks)["id"], {"active": False})
+
+    def monitor(user_id):
+        store.add_item(user_id, "monitoring_tasks", new_monitor())
+
+    def profile(user_id):
+        user_data = store.load(user_id)
+        user_data["profiles"][0]["phone"] = str(random.randrange(10 ** 7))
+        store.save(user_id, user_data, ("profiles",))
+
+    return [list_tasks, cancel_task, monitor, profile]
+
+
+def async_commands(cache: UserDataCache):
+    async def list_tasks(user_id):
+        tasks = await cache.call(cache.load_section, user_id, "checkout_tasks")
+        [task for task in tasks if task.get("active", False)]
+
+    async def cancel_task(user_id):
+        tasks = await cache.call(cache.load_section, user_id, "checkout_tasks")
+        if tasks:
+            await cache.call(cache.update_item, user_id, "checkout_tasks", random.choice(tasks)["id"],
+                             {"active": False}, writes=True)
+
+    async def monitor(user_id):
+        await cache.call(cache.add_item, user_id, "monitoring_tasks", new_monitor(), writes=True)
+
+    async def profile(user_id):
+        user_data = await cache.call(cache.load, user_id)
+        user_data["profiles"][0]["phone"] = str(random.randrange(10 ** 7))
+        await cache.call(cache.save, user_id, user_data, ("profiles",), writes=True)
+
+    return [list_tasks, cancel_task, monitor, profile]
+
+
+async def run(setup: str, store, users: int, seconds: float, concurrency: int, cache_size: int) -> dict:
+    cache = None
+    if setup == "blocking store":
+        blocking = blocking_commands(store)
+        commands = None
+    else:
+        cache = UserDataCache(store, max_users=cache_size, flush_interval=2.0)
+        cache.start()
+        blocking = blocking_commands(cache) if setup == "cache, sync" else None
+        commands = async_commands(cache) if setup == "cache, async" else None
+
+    lags, latencies = [], []
+    stop = asyncio.Event()
+    # Commands mostly come from the same active users
+    hot_users = [str(user_id) for user_id in random.sample(range(users), max(1, users // 5))]
+
+    async def worker():
+        while not stop.is_set():
+            user_id = random.choice(hot_users) if random.random() < 0.8 else str(random.randrange(users))
+            index = random.randrange(4)
+            started = time.perf_counter()
+            if blocking is not None:
+                blocking[index](user_id)
+            else:
+                await commands[index](user_id)
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(random.uniform(0, 0.02))
+
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(beat, *workers)
+    if cache is not None:
+        await cache.close()
+    return {
+        "commands": len(latencies),
+        "lagP50": statistics.median(lags) * 1000,
+        "lagP99": percentile(lags, 0.99) * 1000,
+        "lagMax": max(lags) * 1000,
+        "commandP50": statistics.median(latencies) * 1000,
+        "commandP99": percentile(latencies, 0.99) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every store call sleeps")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--cache-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20, help="Commands in flight at once")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    random.seed(1)
+
+    path = os.path.join(tempfile.mkdtemp(), "users.db")
+    store = SqliteUserStore(path, migrate_from=None)
+    store.save_many({str(user_id): (make_user(20), None) for user_id in range(args.users)})
+    print(f"{args.users:,} users, every store call delayed {args.latency * 1000:.0f} ms, "
+          f"heartbeat every {HEARTBEAT_INTERVAL * 1000:.0f} ms")
+    print()
+    print(f"{'setup':<16} {'commands':>9} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11} "
+          f"{'cmd p50 ms':>11} {'cmd p99 ms':>11}")
+    for setup in ("blocking store", "cache, sync", "cache, async"):
+        result = asyncio.run(run(setup, SlowDisk(store, args.latency), args.users, args.seconds,
+                                 args.concurrency, args.cache_size))
+        print(f"{setup:<16} {result['commands']:>9,} {result['lagP50']:>11.1f} {result['lagP99']:>11.1f} "
+              f"{result['lagMax']:>11.1f} {result['commandP50']:>11.1f} {result['commandP99']:>11.1f}", flush=True)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Slash command latency against user size: one JSON file per user versus SQLite rows.
+
+Each command runs three ways: through ``load_user_data``/``save_user_data``
+on the JSON files (how the cogs used to do it), through the same whole-dict
+functions on SQLite, and through the row-level ``load_user_items`` /
+``add_user_item`` / ``update_user_item`` the cogs now use. ``/cancel_task``
+marks one checkout task inactive, ``/list_tasks`` reads the checkout tasks,
+``/monitor`` appends a monitoring task. The row-level commands are also timed
+through the write-behind ``UserDataCache`` the bot puts in front of the store,
+where a command only changes memory and the writes happen later, off the loop.
+Also times the startup queries over many users.
+
+Usage: python -m benchmarks.bench_user_store [--sizes 10 100 500 2000] [--users 1000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from utils.database import JsonUserStore, SqliteUserStore, UserDataCache
+
+PROFILES = 3
+
+
+def make_user(tasks: int) -> dict:
+    profiles = [{
+        "name": f"profile{index}", "email": f"user{index}@example.com", "first_name": "Ada", "last_name": "Lovelace",
+        "address1": "1 Main St", "city": "London", "zip": "N1", "phone": "5550100", "card_number": "4111111111111111",
+        "card_month": "12", "card_year": "2030", "card_cvv": "123"
+    } for index in range(PROFILES)]
+    return {
+        "profiles": profiles,
+        "monitoring_tasks": [{
+            "id": str(uuid.uuid4()), "product_url": f"https://store{index % 20}.example/products/p{index}",
+            "notify": True, "min_interval": None, "max_interval": None, "active": True
+        } for index in range(tasks)],
+        "checkout_tasks": [{
+            "id": str(uuid.uuid4()), "product_url": f"https://store{index % 20}.example/products/p{index}",
+            "profile_name": "profile0", "size": "M", "quantity": 1, "auto_checkout": False, "active": True
+        } for index in range(tasks)],
+        "price_alerts": [{
+            "product_url": f"https://store{index % 20}.example/products/p{index}", "target_price": 49.99,
+            "variant_id": None, "active": True
+        } for index in range(tasks // 2)],
+        "stores": [f"https://store{index}.example" for index in range(20)]
+    }
+
+
+def cancel_task(store, user_id: str):
+    user_data = store.load(user_id)
+    task = random.choice(user_data["checkout_tasks"])
+    task["active"] = not task["active"]
+    store.save(user_id, user_data)
+
+
+def cancel_task_row(store, user_id: str):
+    store.update_item(user_id, "checkout_tasks", random.choice(TASK_IDS), {"active": random.random() < 0.5})
+
+
+def list_tasks(store, user_id: str):
+    user_data = store.load(user_id)
+    [task for task in user_data["checkout_tasks"] if task.get("active", False)]
+
+
+def list_tasks_row(store, user_id: str):
+    [task for task in store.load_section(user_id, "checkout_tasks") if task.get("active", False)]
+
+
+def new_monitor() -> dict:
+    return {
+        "id": str(uuid.uuid4()), "product_url": "https://store1.example/products/new", "notify": True,
+        "min_interval": None, "max_interval": None, "active": True
+    }
+
+
+def add_monitor(store, user_id: str):
+    user_data = store.load(user_id)
+    user_data["monitoring_tasks"].append(new_monitor())
+    store.save(user_id, user_data)
+
+
+def add_monitor_row(store, user_id: str):
+    store.add_item(user_id, "monitoring_tasks", new_monitor())
+
+
+# Command -> (as the cogs did it through load/save_user_data, as they do it now)
+COMMANDS = {
+    "/cancel_task": (cancel_task, cancel_task_row),
+    "/list_tasks": (list_tasks, list_tasks_row),
+    "/monitor": (add_monitor, add_monitor_row)
+}
+TASK_IDS = []
+
+
+def timed(command, store, user_id: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        command(store, user_id)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def timed_cached(command, store, user_id: str, repeat: int) -> tuple:
+    cache = UserDataCache(store)
+    cache.start()
+    command(cache, user_id)
+    elapsed = timed(command, cache, user_id, repeat)
+    started = time.perf_counter()
+    await cache.close()
+    return elapsed, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500, 2000])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    random.seed(1)
+    directory = tempfile.mkdtemp()
+
+    print(f"{'tasks':>6} {'command':<13} {'json ms':>9} {'sqlite ms':>10} {'sqlite rows ms':>15} {'cached ms':>10} "
+          f"{'flush ms':>9}")
+    for size in args.sizes:
+        json_store = JsonUserStore(os.path.join(directory, f"json-{size}"))
+        sqlite_store = SqliteUserStore(os.path.join(directory, f"users-{size}.db"), migrate_from=None)
+        user = make_user(size)
+        TASK_IDS[:] = [task["id"] for task in user["checkout_tasks"]]
+        json_store.save("1", user)
+        sqlite_store.save("1", user)
+        for name, (whole, row) in COMMANDS.items():
+            json_ms = timed(whole, json_store, "1", args.repeat)
+            sqlite_ms = timed(whole, sqlite_store, "1", args.repeat)
+            row_ms = timed(row, sqlite_store, "1", args.repeat)
+            # The flush writes every change of the repeated command at once
+            cached_ms, flush_ms = asyncio.run(timed_cached(row, sqlite_store, "1", args.repeat))
+            print(f"{size:>6} {name:<13} {json_ms:>9.2f} {sqlite_ms:>10.2f} {row_ms:>15.3f} {cached_ms:>10.4f} "
+                  f"{flush_ms:>9.2f}", flush=True)
+        sqlite_store.close()
+
+    # Startup: which users have active jobs, then everything for restoring them
+    json_store = JsonUserStore(os.path.join(directory, "json-many"))
+    for user_id in range(args.users):
+        json_store.save(str(user_id), make_user(random.choice((0, 5, 20))))
+    sqlite_store = SqliteUserStore(os.path.join(directory, "users-many.db"), migrate_from=json_store.data_dir)
+    started = time.perf_counter()
+    sqlite_store.list_users()
+    migrated = time.perf_counter() - started
+    print()
+    print(f"migrated {args.users:,} JSON users in {migrated:.2f}s")
+    for label, store in (("json", json_store), ("sqlite", sqlite_store)):
+        started = time.perf_counter()
+        active = store.list_active_users()
+        listed = time.perf_counter() - started
+        started = time.perf_counter()
+        store.load_all()
+        loaded = time.perf_counter() - started
+        print(f"{label:<7} list_active_users {listed * 1000:7.1f} ms ({len(active)} users), "
+              f"load_all_user_data {loaded * 1000:7.1f} ms")
+    sqlite_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Memory and diff cost of tracked variant state: dicts versus the compact VariantState.
+
+Usage: python -m benchmarks.bench_variant_state
+"""
+import json
+import timeit
+import tracemalloc
+
+from benchmarks.fixtures import make_product, product_body
+from utils.product_metadata import extract_variants
+from utils.variant_state import VariantState
+
+PRODUCTS = 1000
+VARIANTS = 100
+ROUNDS = 2000
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Cache-Control": "max-age=0"
+}
+
+
+def dict_state(variants: list) -> tuple:
+    """What one monitored product held before: the tracker's raw variant JSON,
+    the monitor's variant dicts, its stock status dict and headers copy."""
+    raw = json.loads(json.dumps(variants))
+    monitor_variants = extract_variants({"variants": variants})
+    last_stock_status = {v["id"]: v["available"] for v in monitor_variants}
+    return raw, monitor_variants, last_stock_status, dict(HEADERS)
+
+
+def compact_state(variants: list) -> tuple:
+    """What it holds now: one VariantState for the tracker and one for the monitor."""
+    return VariantState.from_variants(variants), VariantState.from_variants(variants)
+
+
+def measure(build, payloads: list) -> int:
+    tracemalloc.start()
+    kept = [build(variants) for variants in payloads]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def dict_diff(variants: list, last_stock_status: dict) -> int:
+    changed = 0
+    for variant in variants:
+        if last_stock_status.get(variant["id"]) != variant["available"]:
+            changed += 1
+    return changed
+
+
+def main():
+    # Decoded payloads are transient in both designs, so they are built up front
+    payloads = [
+        json.loads(product_body(make_product(VARIANTS, product_id=7000 + i)))["product"]["variants"]
+        for i in range(PRODUCTS)
+    ]
+
+    before = measure(dict_state, payloads)
+    after = measure(compact_state, payloads)
+    total = PRODUCTS * VARIANTS
+    print(f"{PRODUCTS} products x {VARIANTS} variants = {total} tracked variants")
+    print(f"dict state:    {before / 2 ** 20:8.1f} MiB ({before / total:6.0f} B/variant)")
+    print(f"VariantState:  {after / 2 ** 20:8.1f} MiB ({after / total:6.0f} B/variant)")
+    print(f"reduction:     {before / after:8.1f}x")
+
+    # Stock diff of one product where two variants flipped
+    variants = payloads[0]
+    flipped = [dict(v) for v in variants]
+    for variant in flipped[10:12]:
+        variant["available"] = not variant["available"]
+    last_stock_status = {v["id"]: v["available"] for v in variants}
+    previous, current = VariantState.from_variants(variants), VariantState.from_variants(flipped)
+
+    loop = timeit.timeit(lambda: dict_diff(flipped, last_stock_status), number=ROUNDS) / ROUNDS
+    xor = timeit.timeit(lambda: current.diff(previous), number=ROUNDS) / ROUNDS
+    print(f"dict diff:     {loop * 1e6:8.1f} us/product")
+    print(f"bitset diff:   {xor * 1e6:8.1f} us/product")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Synthetic Shopify payloads shared by the benchmark scripts."""
+import json
+import random
+
+
+def make_variant(product_id: int, index: int, available: bool = True) -> dict:
+    """Build a variant shaped like the ones in a storefront ``<product>.json``."""
+    size = ["XS", "S", "M", "L", "XL", "XXL", "3XL", "4XL", "5XL", "6XL"][index % 10]
+    color = f"Colour {index // 10}"
+    return {
+        "id": product_id * 1000 + index,
+        "product_id": product_id,
+        "title": f"{size} / {color}",
+        "price": f"{random.randint(20, 400)}.{random.choice(['00', '50', '99'])}",
+        "sku": f"SKU-{product_id}-{index:04d}",
+        "position": index + 1,
+        "inventory_policy": "deny",
+        "compare_at_price": None,
+        "fulfillment_service": "manual",
+        "inventory_management": "shopify",
+        "option1": size,
+        "option2": color,
+        "option3": None,
+        "created_at": "2025-03-01T10:00:00-05:00",
+        "updated_at": "2025-04-20T08:15:42-05:00",
+        "taxable": True,
+        "barcode": f"0{product_id:06d}{index:05d}",
+        "grams": 450,
+        "image_id": None,
+        "weight": 0.45,
+        "weight_unit": "kg",
+        "requires_shipping": True,
+        "available": available
+    }
+
+
+def make_product(variant_count: int = 100, product_id: int = 7001, handle: str = None) -> dict:
+    """Build a product shaped like the ``product`` object of ``<product>.json``."""
+    return {
+        "id": product_id,
+        "title": f"Benchmark Product {product_id}",
+        "handle": handle or f"benchmark-product-{product_id}",
+        "body_html": "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>",
+        "vendor": "Benchmark Vendor",
+        "product_type": "Sneakers",
+        "created_at": "2025-03-01T10:00:00-05:00",
+        "updated_at": "2025-04-20T08:15:42-05:00",
+        "published_at": "2025-03-01T10:00:00-05:00",
+        "tags": "drop, limited, restock",
+        "variants": [make_variant(product_id, i, available=i % 3 == 0) for i in range(variant_count)],
+        "options": [
+            {"name": "Size", "position": 1},
+            {"name": "Color", "position": 2}
+        ],
+        "images": [
+            {"id": product_id * 10 + i, "src": f"https://cdn.shopify.com/s/files/1/{product_id}/{i}.jpg",
+             "width": 2048, "height": 2048}
+            for i in range(8)
+        ]
+    }
+
+
+def product_body(product: dict) -> bytes:
+    """Serialise a product the way ``<product>.json`` returns it."""
+    return json.dumps({"product": product}).encode()
@@ -6,6 +6,17 @@ from discord import app_commands
 from discord.ext import commands
 import asyncio
 import sqlite3
+from utils.feed_workers import FeedWorkerPool
+from utils.database import get_user_store, list_active_users_async, load_all_user_data_async
+from utils.event_bus import event_bus
+from utils.http_client import session_registry
+from utils.notifier import notifier, restock_coalescer
+from utils.poll_scheduler import poll_scheduler
+from utils.restock_predictor import restock_predictor
+from utils.stock_history import stock_history
+from utils.product_feed import product_feed
+from utils.user_resolver import user_resolver
+from utils.warm_restart import FeedCheckpoint, restore_staggered
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,6 +25,15 @@ logger = logging.getLogger(__name__)
 # Ensure database directory exists
 os.makedirs('instance', exist_ok=True)
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///instance/ninjabot.db')
+# Number of processes to shard product polling across; 0 polls on the bot's own loop
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', '0') or 0)
+# Seconds a restock DM waits for more variants of the same product, and its hard cap
+RESTOCK_WINDOW = float(os.getenv('RESTOCK_WINDOW', '2') or 2)
+RESTOCK_MAX_DELAY = float(os.getenv('RESTOCK_MAX_DELAY', '5') or 5)
+# Seconds over which saved monitors, alerts and tasks are restarted after a restart
+RESTORE_SPREAD = float(os.getenv('RESTORE_SPREAD', '5') or 5)
+# Poll harder around each store's usual restock times, learned from stock history
+PREDICTIVE_POLLING = os.getenv('PREDICTIVE_POLLING', '1') != '0'
 
 def init_db():
     """Initialize the database if using SQLite"""
@@ -42,7 +62,9 @@ class ShopifyBot(commands.Bot):
         super().__init__(
             command_prefix="/",
             intents=intents,
-            application_id=application_id
+            application_id=application_id,
+            # Longer rate limits raise instead of sleeping so the notifier can reschedule the DM
+            max_ratelimit_timeout=30
         )
         
         # Initialize bot state
@@ -52,6 +74,10 @@ class ShopifyBot(commands.Bot):
         self.success_count = 0
         self.total_tasks = 0
         self.response_times = []
+        self.feed_workers = None
+        self._prewarm_task = None
+        self._restore_task = None
+        self.checkpoint = FeedCheckpoint(product_feed)
         
     def get_uptime(self):
         """Get bot uptime in HH:MM:SS format."""
@@ -84,10 +110,53 @@ class ShopifyBot(commands.Bot):
         return set(task.get('user_id', 0) for task in self.active_tasks)
         
     async def setup_hook(self):
-        """Load all cogs when the bot starts."""
+        """Start the user data cache, notifier, stock history and feed workers if configured, then load all cogs."""
+        get_user_store().start()
+        notifier.start(self)
+        await stock_history.start()
+        restock_coalescer.window = RESTOCK_WINDOW
+        restock_coalescer.max_delay = RESTOCK_MAX_DELAY
+        if FEED_WORKERS > 0:
+            self.feed_workers = FeedWorkerPool(FEED_WORKERS)
+            await self.feed_workers.start()
+            product_feed.use_workers(self.feed_workers)
         await self.load_cogs()
+        loop = asyncio.get_running_loop()
+        self._restore_task = loop.create_task(self.restore_jobs())
+        self._prewarm_task = loop.create_task(self.prewarm_dm_channels())
         logger.info("Bot setup completed")
     
+    async def restore_jobs(self):
+        """Resume every monitor, price alert and auto-checkout task saved as active.
+        
+        The feed is seeded from the last checkpoint first, so resumed jobs only
+        hear about changes made while the bot was down.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            product_feed.restore(await loop.run_in_executor(None, self.checkpoint.load))
+            users = await load_all_user_data_async()
+            jobs = []
+            for cog in self.cogs.values():
+                restore = getattr(cog, "restore_jobs", None)
+                if restore is not None:
+                    jobs.extend(restore(users))
+            await restore_staggered(jobs, RESTORE_SPREAD)
+        except Exception as e:
+            logger.error(f"Failed to restore saved jobs: {e}")
+        # Not reached when shut down mid-restore, which keeps the old checkpoint intact
+        self.checkpoint.start()
+        if PREDICTIVE_POLLING:
+            restock_predictor.start(product_feed)
+    
+    async def prewarm_dm_channels(self):
+        """Open the DM channels of every user with something active, so their first alert is one API call."""
+        try:
+            user_ids = await list_active_users_async()
+            await user_resolver.prewarm(user_ids)
+        except Exception as e:
+            logger.error(f"Failed to prewarm DM channels: {e}")
+    
     async def load_cogs(self):
         """Load all command cogs."""
         for filename in os.listdir("./cogs"):
@@ -110,6 +179,29 @@ class ShopifyBot(commands.Bot):
         logger.info(f"Bot is ready! Logged in as {self.user} (ID: {self.user.id})")
         logger.info(f"Connected to {len(self.guilds)} guilds")
 
+    async def close(self):
+        """Release shared resources before disconnecting."""
+        for task in (self._prewarm_task, self._restore_task):
+            if task is not None:
+                task.cancel()
+        await restock_predictor.stop()
+        # Save the latest stock state before the feed forgets it
+        await self.checkpoint.stop()
+        product_feed.close()
+        if self.feed_workers is not None:
+            await self.feed_workers.close()
+            self.feed_workers = None
+        await restock_coalescer.flush_all()
+        await notifier.drain()
+        await notifier.stop()
+        # Last, since draining notifications can still deactivate price alerts
+        await get_user_store().close()
+        await stock_history.close()
+        await event_bus.close()
+        await poll_scheduler.close()
+        await session_registry.close()
+        await super().close()
+
     async def on_interaction(self, interaction: discord.Interaction):
         """Handle interaction errors."""
         if interaction.type == discord.InteractionType.application_command:
@@ -7,7 +7,7 @@ import re
 from typing import Dict, List, Optional
 import uuid
 import asyncio
-from utils.database import save_user_data, load_user_data
+from utils.database import add_user_item_async, load_user_items_async, update_user_item_async
 from utils.shopify_monitor import ShopifyMonitor
 from utils.task_scheduler import TaskScheduler
 
@@ -38,7 +38,13 @@ class MonitorCommands(commands.Cog):
         self.monitors = {}  # Dictionary to store active monitors: {monitor_id: ShopifyMonitor}
     
     @app_commands.command(name="monitor", description="Monitor a Shopify product for availability")
-    async def monitor(self, interaction: discord.Interaction, product_url: str, notify: bool = True):
+    @app_commands.describe(
+        min_interval="Fastest polling interval in seconds while the product is restocking",
+        max_interval="Slowest polling interval in seconds once the product goes quiet"
+    )
+    async def monitor(self, interaction: discord.Interaction, product_url: str, notify: bool = True,
+                      min_interval: Optional[app_commands.Range[float, 1, 3600]] = None,
+                      max_interval: Optional[app_commands.Range[float, 1, 3600]] = None):
         """Command to start monitoring a Shopify product."""
         # Validate the URL is a Shopify URL
         if not self._is_valid_shopify_url(product_url):
@@ -58,19 +64,17 @@ class MonitorCommands(commands.Cog):
             "id": monitor_id,
             "product_url": product_url,
             "notify": notify,
+            "min_interval": min_interval,
+            "max_interval": max_interval,
             "active": True
         }
         
         # Update user data with the new monitor task
-        user_data = load_user_data(user_id)
-        if not user_data:
-            user_data = {"profiles": [], "monitoring_tasks": [], "checkout_tasks": []}
-        
-        user_data["monitoring_tasks"].append(monitor_task)
-        save_user_data(user_id, user_data)
+        await add_user_item_async(user_id, "monitoring_tasks", monitor_task)
         
         # Start the monitor
-        monitor = ShopifyMonitor(product_url, self.bot, interaction.user.id, notify)
+        monitor = ShopifyMonitor(product_url, self.bot, interaction.user.id, notify,
+                                 min_interval=min_interval, max_interval=max_interval)
         self.monitors[monitor_id] = monitor
         asyncio.create_task(monitor.start_monitoring())
         
@@ -88,33 +92,20 @@ class MonitorCommands(commands.Cog):
     async def stop_monitor(self, interaction: discord.Interaction, monitor_id: str):
         """Command to stop monitoring a specific product."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
         
-        if not user_data or not user_data.get("monitoring_tasks"):
+        # Update the task in user data
+        if await update_user_item_async(user_id, "monitoring_tasks", monitor_id, {"active": False}):
+            # Stop the monitor if it exists
+            if monitor_id in self.monitors:
+                self.monitors[monitor_id].stop_monitoring()
+                del self.monitors[monitor_id]
+            
             await interaction.response.send_message(
-                "You don't have any active monitoring tasks.",
+                f"Successfully stopped monitoring task {monitor_id}.",
                 ephemeral=True
             )
             return
         
-        # Find the monitoring task
-        for i, task in enumerate(user_data["monitoring_tasks"]):
-            if task["id"] == monitor_id:
-                # Update the task in user data
-                user_data["monitoring_tasks"][i]["active"] = False
-                save_user_data(user_id, user_data)
-                
-                # Stop the monitor if it exists
-                if monitor_id in self.monitors:
-                    self.monitors[monitor_id].stop_monitoring()
-                    del self.monitors[monitor_id]
-                
-                await interaction.response.send_message(
-                    f"Successfully stopped monitoring task {monitor_id}.",
-                    ephemeral=True
-                )
-                return
-        
         await interaction.response.send_message(
             f"Monitor task with ID {monitor_id} not found.",
             ephemeral=True
@@ -124,9 +115,9 @@ class MonitorCommands(commands.Cog):
     async def list_monitors(self, interaction: discord.Interaction):
         """Command to list all active monitors for the user."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        monitoring_tasks = await load_user_items_async(user_id, "monitoring_tasks")
         
-        if not user_data or not user_data.get("monitoring_tasks"):
+        if not monitoring_tasks:
             await interaction.response.send_message(
                 "You don't have any monitoring tasks set up.",
                 ephemeral=True
@@ -134,7 +125,7 @@ class MonitorCommands(commands.Cog):
             return
         
         # Filter active tasks
-        active_tasks = [task for task in user_data["monitoring_tasks"] if task.get("active", False)]
+        active_tasks = [task for task in monitoring_tasks if task.get("active", False)]
         
         if not active_tasks:
             await interaction.response.send_message(
@@ -158,6 +149,26 @@ class MonitorCommands(commands.Cog):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
     
+    def restore_jobs(self, users: Dict[str, Dict]) -> List:
+        """Recreate every active monitor saved in user data after a restart.
+        
+        Args:
+            users: User ID -> user data
+        
+        Returns:
+            List: Callables resuming one monitor each
+        """
+        jobs = []
+        for user_id, user_data in users.items():
+            for task in user_data.get("monitoring_tasks", []):
+                if not task.get("active", False) or task["id"] in self.monitors:
+                    continue
+                monitor = ShopifyMonitor(task["product_url"], self.bot, int(user_id), task.get("notify", True),
+                                         min_interval=task.get("min_interval"), max_interval=task.get("max_interval"))
+                self.monitors[task["id"]] = monitor
+                jobs.append(monitor.resume_monitoring)
+        return jobs
+    
     def _is_valid_shopify_url(self, url: str) -> bool:
         """Check if a URL is a valid Shopify product URL."""
         # Basic validation for Shopify URLs
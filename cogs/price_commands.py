@@ -2,78 +2,93 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import asyncio
+import functools
 import uuid
 import logging
-from utils.database import save_user_data, load_user_data
-from utils.shopify_monitor import ShopifyMonitor
+from typing import Dict, List, Optional
+from utils.database import add_user_item_async, load_user_items_async, update_user_item_async
+from utils.notifier import notify
+from utils.price_alerts import PriceAlert, PriceAlertIndex
+from utils.variant_state import cents_to_price, price_to_cents
 
 logger = logging.getLogger(__name__)
 
 class PriceCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.alerts = {}
-        self.monitoring_tasks = {}
+        # Every alert lives in one index; alerts on a product share a single feed subscription
+        self.alert_index = PriceAlertIndex(self._on_alert_reached, interval=60, min_interval=15, max_interval=300)
         
-    async def monitor_price(self, alert_id: str, user_id: str, product_url: str, target_price: float):
-        """Monitor product price and alert when target is reached."""
-        monitor = ShopifyMonitor(product_url, self.bot, int(user_id))
+    async def _on_alert_reached(self, alert: PriceAlert, price_cents: int):
+        """Tell the user their target was reached and deactivate the stored alert."""
+        current_price = cents_to_price(price_cents)
+        target_price = cents_to_price(alert.target_cents)
+        embed = discord.Embed(
+            title="🎯 Price Target Reached!",
+            description=f"Product price has reached your target!\nCurrent Price: ${current_price}\nTarget Price: ${target_price}",
+            color=discord.Color.green(),
+            url=alert.product_url
+        )
+        if alert.variant_id is not None:
+            embed.add_field(name="Variant ID", value=str(alert.variant_id))
+        await notify(alert.user_id, embed=embed)
         
-        while True:
-            try:
-                success = await monitor._fetch_product_info()
-                if success and monitor.variants:
-                    current_price = float(monitor.variants[0].get('price', 0))
-                    
-                    if current_price <= target_price:
-                        user = await self.bot.fetch_user(int(user_id))
-                        embed = discord.Embed(
-                            title="🎯 Price Target Reached!",
-                            description=f"Product price has reached your target!\nCurrent Price: ${current_price}\nTarget Price: ${target_price}",
-                            color=discord.Color.green(),
-                            url=product_url
-                        )
-                        await user.send(embed=embed)
-                        
-                        # Deactivate alert
-                        user_data = load_user_data(user_id)
-                        for alert in user_data.get("price_alerts", []):
-                            if alert["id"] == alert_id:
-                                alert["active"] = False
-                                break
-                        save_user_data(user_id, user_data)
-                        return
-                        
-            except Exception as e:
-                logger.error(f"Error monitoring price: {e}")
-            
-            await asyncio.sleep(60)  # Check every minute
+        # Deactivate alert
+        await update_user_item_async(alert.user_id, "price_alerts", alert.alert_id, {"active": False})
 
+    def restore_jobs(self, users: Dict[str, Dict]) -> List:
+        """Re-index every active price alert saved in user data after a restart.
+        
+        Args:
+            users: User ID -> user data
+        
+        Returns:
+            List: Callables adding one alert each to the index
+        """
+        jobs = []
+        for user_id, user_data in users.items():
+            for stored in user_data.get("price_alerts", []):
+                if not stored.get("active", True):
+                    continue
+                target_cents = stored.get("target_cents")
+                if target_cents is None:
+                    # Alerts saved before prices were kept in cents
+                    target_cents = price_to_cents(f"{float(stored['target_price']):.2f}")
+                variant_id = stored.get("variant_id")
+                alert = PriceAlert(stored["id"], user_id, stored["product_url"], target_cents,
+                                   int(variant_id) if variant_id is not None else None)
+                jobs.append(functools.partial(self.alert_index.add, alert))
+        return jobs
+    
     @app_commands.command(name="price_alert", description="Set a price alert for a product")
-    async def price_alert(self, interaction: discord.Interaction, product_url: str, target_price: float):
+    @app_commands.describe(variant_id="Variant to watch; defaults to the product's first variant")
+    async def price_alert(self, interaction: discord.Interaction, product_url: str, target_price: float,
+                          variant_id: Optional[str] = None):
         user_id = str(interaction.user.id)
         alert_id = str(uuid.uuid4())
         
+        if variant_id is not None and not variant_id.isdigit():
+            await interaction.response.send_message("Variant ID must be a number.", ephemeral=True)
+            return
+        
+        # Exact cents from the decimal the user typed, not from float arithmetic
+        target_cents = price_to_cents(f"{target_price:.2f}")
         alert = {
             "id": alert_id,
             "product_url": product_url,
             "target_price": target_price,
+            "target_cents": target_cents,
+            "variant_id": variant_id,
             "active": True
         }
         
-        user_data = load_user_data(user_id)
-        if not user_data:
-            user_data = {}
-        if "price_alerts" not in user_data:
-            user_data["price_alerts"] = []
+        await add_user_item_async(user_id, "price_alerts", alert)
         
-        user_data["price_alerts"].append(alert)
-        save_user_data(user_id, user_data)
-        
-        # Start monitoring task
-        task = asyncio.create_task(self.monitor_price(alert_id, user_id, product_url, target_price))
-        self.monitoring_tasks[alert_id] = task
+        # Start monitoring
+        self.alert_index.add(PriceAlert(
+            alert_id, user_id, product_url, target_cents,
+            int(variant_id) if variant_id is not None else None
+        ))
         
         embed = discord.Embed(
             title="Price Alert Set",
@@ -81,6 +96,8 @@ class PriceCommands(commands.Cog):
             color=discord.Color.blue()
         )
         embed.add_field(name="Product URL", value=product_url)
+        if variant_id is not None:
+            embed.add_field(name="Variant ID", value=variant_id)
         embed.add_field(name="Alert ID", value=alert_id)
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -88,13 +105,13 @@ class PriceCommands(commands.Cog):
     @app_commands.command(name="list_alerts", description="List your active price alerts")
     async def list_alerts(self, interaction: discord.Interaction):
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        price_alerts = await load_user_items_async(user_id, "price_alerts")
         
-        if not user_data or "price_alerts" not in user_data:
+        if not price_alerts:
             await interaction.response.send_message("You don't have any price alerts.", ephemeral=True)
             return
             
-        active_alerts = [alert for alert in user_data["price_alerts"] if alert.get("active", True)]
+        active_alerts = [alert for alert in price_alerts if alert.get("active", True)]
         
         if not active_alerts:
             await interaction.response.send_message("You don't have any active price alerts.", ephemeral=True)
@@ -107,9 +124,12 @@ class PriceCommands(commands.Cog):
         )
         
         for alert in active_alerts:
+            value = f"URL: {alert['product_url']}\nTarget Price: ${alert['target_price']}"
+            if alert.get("variant_id"):
+                value += f"\nVariant ID: {alert['variant_id']}"
             embed.add_field(
                 name=f"Alert ID: {alert['id']}",
-                value=f"URL: {alert['product_url']}\nTarget Price: ${alert['target_price']}",
+                value=value,
                 inline=False
             )
             
@@ -118,25 +138,14 @@ class PriceCommands(commands.Cog):
     @app_commands.command(name="cancel_alert", description="Cancel a price alert")
     async def cancel_alert(self, interaction: discord.Interaction, alert_id: str):
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
         
-        if not user_data or "price_alerts" not in user_data:
-            await interaction.response.send_message("Alert not found.", ephemeral=True)
+        if await update_user_item_async(user_id, "price_alerts", alert_id, {"active": False}):
+            # Cancel monitoring
+            self.alert_index.remove(alert_id)
+            
+            await interaction.response.send_message(f"Price alert {alert_id} cancelled.", ephemeral=True)
             return
             
-        for alert in user_data["price_alerts"]:
-            if alert["id"] == alert_id:
-                alert["active"] = False
-                save_user_data(user_id, user_data)
-                
-                # Cancel monitoring task
-                if alert_id in self.monitoring_tasks:
-                    self.monitoring_tasks[alert_id].cancel()
-                    del self.monitoring_tasks[alert_id]
-                
-                await interaction.response.send_message(f"Price alert {alert_id} cancelled.", ephemeral=True)
-                return
-                
         await interaction.response.send_message("Alert not found.", ephemeral=True)
 
 async def setup(bot):
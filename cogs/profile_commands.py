@@ -5,7 +5,7 @@ import logging
 import json
 import asyncio
 from typing import Dict, List, Optional
-from utils.database import save_user_data, load_user_data
+from utils.database import load_user_data_async, save_user_data_async
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +24,14 @@ class ProfileCommands(commands.Cog):
             user_id = str(interaction.user.id)
             
             # Load existing user data or create new
-            user_data = load_user_data(user_id)
+            user_data = await load_user_data_async(user_id)
             if not user_data:
                 user_data = {
                     "profiles": [],
                     "monitoring_tasks": [],
                     "checkout_tasks": []
                 }
-                save_user_data(user_id, user_data)
+                await save_user_data_async(user_id, user_data)
             
             embed = discord.Embed(
                 title="Welcome to Shopify Bot",
@@ -221,7 +221,7 @@ class ProfileCommands(commands.Cog):
         profile_cache = self.profile_creation_cache[user_id]
         
         # Load user data
-        user_data = load_user_data(user_id)
+        user_data = await load_user_data_async(user_id)
         if not user_data:
             user_data = {"profiles": [], "monitoring_tasks": [], "checkout_tasks": []}
         
@@ -243,7 +243,7 @@ class ProfileCommands(commands.Cog):
             user_data["profiles"].append(new_profile)
         
         # Save updated user data
-        save_user_data(user_id, user_data)
+        await save_user_data_async(user_id, user_data, sections=("profiles",))
         
         # Clean up the cache
         del self.profile_creation_cache[user_id]
@@ -260,7 +260,7 @@ class ProfileCommands(commands.Cog):
     async def list_profiles(self, interaction: discord.Interaction):
         """Command to list all saved profiles for the user."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        user_data = await load_user_data_async(user_id)
         
         if not user_data or not user_data.get("profiles"):
             await interaction.response.send_message("You don't have any saved profiles yet.", ephemeral=True)
@@ -294,7 +294,7 @@ class ProfileCommands(commands.Cog):
             await interaction.response.defer(ephemeral=True)
             
             user_id = str(interaction.user.id)
-            user_data = load_user_data(user_id)
+            user_data = await load_user_data_async(user_id)
             
             if not user_data or not user_data.get("profiles"):
                 await interaction.followup.send("You don't have any profiles to edit.", ephemeral=True)
@@ -363,7 +363,7 @@ class ProfileCommands(commands.Cog):
     async def delete_profile(self, interaction: discord.Interaction, profile_name: str):
         """Command to delete a saved profile."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        user_data = await load_user_data_async(user_id)
         
         if not user_data or not user_data.get("profiles"):
             await interaction.response.send_message("You don't have any saved profiles.", ephemeral=True)
@@ -374,7 +374,7 @@ class ProfileCommands(commands.Cog):
         for i, profile in enumerate(user_data["profiles"]):
             if profile["name"] == profile_name:
                 del user_data["profiles"][i]
-                save_user_data(user_id, user_data)
+                await save_user_data_async(user_id, user_data, sections=("profiles",))
                 profile_found = True
                 break
         
@@ -2,10 +2,11 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import asyncio
+import functools
 import logging
 import uuid
 from typing import Dict, List, Optional
-from utils.database import save_user_data, load_user_data
+from utils.database import add_user_item_async, load_user_items_async, update_user_item_async
 from utils.shopify_checkout import ShopifyCheckout
 
 logger = logging.getLogger(__name__)
@@ -15,14 +16,24 @@ class TaskCommands(commands.Cog):
         self.bot = bot
         self.checkout_tasks = {}  # Dictionary to store active checkout tasks
     
+    async def _on_task_completed(self, user_id: str, task_id: str):
+        """Mark a task whose checkout succeeded as finished, so a restart does not buy it again."""
+        self.checkout_tasks.pop(task_id, None)
+        await update_user_item_async(user_id, "checkout_tasks", task_id, {"active": False, "completed": True})
+    
+    async def _run_once(self, checkout: ShopifyCheckout, user_id: str, task_id: str):
+        """Run a single checkout attempt for ``/run_task``."""
+        if await checkout.checkout():
+            await self._on_task_completed(user_id, task_id)
+    
     @app_commands.command(name="add_task", description="Add a checkout task for a Shopify product")
     async def add_task(self, interaction: discord.Interaction, product_url: str, profile_name: str, 
                        quantity: int = 1, auto_checkout: bool = False):
         """Command to add a checkout task for a Shopify product."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        profiles = await load_user_items_async(user_id, "profiles")
         
-        if not user_data:
+        if not profiles:
             await interaction.response.send_message(
                 "You need to create a profile first. Use the `/profile` command.",
                 ephemeral=True
@@ -31,7 +42,7 @@ class TaskCommands(commands.Cog):
         
         # Find the profile
         profile = None
-        for p in user_data.get("profiles", []):
+        for p in profiles:
             if p["name"] == profile_name:
                 profile = p
                 break
@@ -57,11 +68,7 @@ class TaskCommands(commands.Cog):
         }
         
         # Update user data
-        if "checkout_tasks" not in user_data:
-            user_data["checkout_tasks"] = []
-        
-        user_data["checkout_tasks"].append(task)
-        save_user_data(user_id, user_data)
+        await add_user_item_async(user_id, "checkout_tasks", task)
         
         # Start the checkout task if auto_checkout is enabled
         if auto_checkout:
@@ -70,7 +77,8 @@ class TaskCommands(commands.Cog):
                 profile=profile,
                 quantity=quantity,
                 bot=self.bot,
-                user_id=interaction.user.id
+                user_id=interaction.user.id,
+                on_success=functools.partial(self._on_task_completed, user_id, task_id)
             )
             self.checkout_tasks[task_id] = checkout
             asyncio.create_task(checkout.monitor_and_checkout())
@@ -87,13 +95,51 @@ class TaskCommands(commands.Cog):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
     
+    def restore_jobs(self, users: Dict[str, Dict]) -> List:
+        """Recreate every active auto-checkout task saved in user data after a restart.
+        
+        One-off tasks started with ``/run_task`` are not resumed, nor are tasks
+        whose checkout already succeeded.
+        
+        Args:
+            users: User ID -> user data
+        
+        Returns:
+            List: Callables restarting one checkout task each
+        """
+        jobs = []
+        for user_id, user_data in users.items():
+            profiles = {p["name"]: p for p in user_data.get("profiles", [])}
+            for task in user_data.get("checkout_tasks", []):
+                if not (task.get("active", False) and task.get("auto_checkout", False)):
+                    continue
+                if task.get("completed", False):
+                    continue
+                if task["id"] in self.checkout_tasks:
+                    continue
+                profile = profiles.get(task["profile_name"])
+                if not profile:
+                    logger.warning(f"Not resuming task {task['id']}: profile '{task['profile_name']}' is missing")
+                    continue
+                checkout = ShopifyCheckout(
+                    product_url=task["product_url"],
+                    profile=profile,
+                    quantity=task["quantity"],
+                    bot=self.bot,
+                    user_id=int(user_id),
+                    on_success=functools.partial(self._on_task_completed, user_id, task["id"])
+                )
+                self.checkout_tasks[task["id"]] = checkout
+                jobs.append(checkout.monitor_and_checkout)
+        return jobs
+    
     @app_commands.command(name="run_task", description="Run a specific checkout task")
     async def run_task(self, interaction: discord.Interaction, task_id: str):
         """Command to run a specific checkout task."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        checkout_tasks = await load_user_items_async(user_id, "checkout_tasks")
         
-        if not user_data or not user_data.get("checkout_tasks"):
+        if not checkout_tasks:
             await interaction.response.send_message(
                 "You don't have any checkout tasks.",
                 ephemeral=True
@@ -102,7 +148,7 @@ class TaskCommands(commands.Cog):
         
         # Find the task
         task = None
-        for t in user_data["checkout_tasks"]:
+        for t in checkout_tasks:
             if t["id"] == task_id and t.get("active", False):
                 task = t
                 break
@@ -116,7 +162,7 @@ class TaskCommands(commands.Cog):
         
         # Find the profile
         profile = None
-        for p in user_data.get("profiles", []):
+        for p in await load_user_items_async(user_id, "profiles"):
             if p["name"] == task["profile_name"]:
                 profile = p
                 break
@@ -143,38 +189,26 @@ class TaskCommands(commands.Cog):
         )
         
         self.checkout_tasks[task_id] = checkout
-        asyncio.create_task(checkout.checkout())
+        asyncio.create_task(self._run_once(checkout, user_id, task_id))
     
     @app_commands.command(name="cancel_task", description="Cancel a checkout task")
     async def cancel_task(self, interaction: discord.Interaction, task_id: str):
         """Command to cancel a checkout task."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
         
-        if not user_data or not user_data.get("checkout_tasks"):
+        # Only the task's own row is rewritten
+        if await update_user_item_async(user_id, "checkout_tasks", task_id, {"active": False}):
+            # Stop the checkout task if it's running
+            if task_id in self.checkout_tasks:
+                self.checkout_tasks[task_id].stop()
+                del self.checkout_tasks[task_id]
+            
             await interaction.response.send_message(
-                "You don't have any checkout tasks.",
+                f"Task {task_id} has been cancelled.",
                 ephemeral=True
             )
             return
         
-        # Find and update the task
-        for i, task in enumerate(user_data["checkout_tasks"]):
-            if task["id"] == task_id:
-                user_data["checkout_tasks"][i]["active"] = False
-                save_user_data(user_id, user_data)
-                
-                # Stop the checkout task if it's running
-                if task_id in self.checkout_tasks:
-                    self.checkout_tasks[task_id].stop()
-                    del self.checkout_tasks[task_id]
-                
-                await interaction.response.send_message(
-                    f"Task {task_id} has been cancelled.",
-                    ephemeral=True
-                )
-                return
-        
         await interaction.response.send_message(
             f"Task with ID {task_id} not found.",
             ephemeral=True
@@ -185,25 +219,17 @@ class TaskCommands(commands.Cog):
                        profile_name: str = None, quantity: int = None):
         """Command to edit an existing task."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
-        
-        if not user_data or not user_data.get("checkout_tasks"):
-            await interaction.response.send_message("You don't have any tasks to edit.", ephemeral=True)
-            return
+        changes = {}
+        if product_url:
+            changes["product_url"] = product_url
+        if profile_name:
+            changes["profile_name"] = profile_name
+        if quantity:
+            changes["quantity"] = quantity
             
-        # Find and update the task
-        for task in user_data["checkout_tasks"]:
-            if task["id"] == task_id:
-                if product_url:
-                    task["product_url"] = product_url
-                if profile_name:
-                    task["profile_name"] = profile_name
-                if quantity:
-                    task["quantity"] = quantity
-                    
-                save_user_data(user_id, user_data)
-                await interaction.response.send_message(f"Task {task_id} has been updated.", ephemeral=True)
-                return
+        if await update_user_item_async(user_id, "checkout_tasks", task_id, changes):
+            await interaction.response.send_message(f"Task {task_id} has been updated.", ephemeral=True)
+            return
                 
         await interaction.response.send_message(f"Task {task_id} not found.", ephemeral=True)
 
@@ -211,9 +237,9 @@ class TaskCommands(commands.Cog):
     async def list_tasks(self, interaction: discord.Interaction):
         """Command to list all checkout tasks for the user."""
         user_id = str(interaction.user.id)
-        user_data = load_user_data(user_id)
+        checkout_tasks = await load_user_items_async(user_id, "checkout_tasks")
         
-        if not user_data or not user_data.get("checkout_tasks"):
+        if not checkout_tasks:
             await interaction.response.send_message(
                 "You don't have any checkout tasks set up.",
                 ephemeral=True
@@ -221,7 +247,7 @@ class TaskCommands(commands.Cog):
             return
         
         # Filter active tasks
-        active_tasks = [task for task in user_data["checkout_tasks"] if task.get("active", False)]
+        active_tasks = [task for task in checkout_tasks if task.get("active", False)]
         
         if not active_tasks:
             await interaction.response.send_message(
@@ -7,6 +7,18 @@ from dotenv import load_dotenv
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from bot import ShopifyBot
+from utils.circuit_breaker import circuit_breakers
+from utils.database import get_user_store, load_all_user_data
+from utils.event_bus import event_bus
+from utils.http_client import session_registry
+from utils.notifier import notifier, restock_coalescer
+from utils.poll_scheduler import poll_scheduler
+from utils.rate_limiter import rate_limiter
+from utils.restock_predictor import restock_predictor
+from utils.stock_analytics import stock_analytics
+from utils.stock_history import stock_history
+from utils.user_resolver import user_resolver
+from utils.product_feed import product_feed
 import threading
 import models
 from models import Setting, Task, Profile, db
@@ -173,26 +185,20 @@ def stop_bot():
 
 @app.route('/api/tasks')
 def get_tasks():
-    """Get all tasks from both database and user_data files"""
+    """Get all tasks from both database and saved user data"""
     try:
         tasks = []
-        # Get tasks from user_data files
-        user_data_dir = 'user_data'
-        if os.path.exists(user_data_dir):
-            for filename in os.listdir(user_data_dir):
-                if filename.endswith('.json'):
-                    with open(os.path.join(user_data_dir, filename)) as f:
-                        user_data = json.load(f)
-                        if 'checkout_tasks' in user_data:
-                            for task in user_data['checkout_tasks']:
-                                if task.get('active', True):  # Only include active tasks
-                                    tasks.append({
-                                        'id': task['id'],
-                                        'product_url': task['product_url'],
-                                        'quantity': task.get('quantity', 1),
-                                        'active': True,
-                                        'profile_name': task.get('profile_name', 'N/A')
-                                    })
+        # Get tasks from saved user data
+        for user_data in load_all_user_data().values():
+            for task in user_data.get('checkout_tasks', []):
+                if task.get('active', True):  # Only include active tasks
+                    tasks.append({
+                        'id': task['id'],
+                        'product_url': task['product_url'],
+                        'quantity': task.get('quantity', 1),
+                        'active': True,
+                        'profile_name': task.get('profile_name', 'N/A')
+                    })
 
         # Also get tasks from database
         with app.app_context():
@@ -293,7 +299,21 @@ def get_stats():
             'memoryUsage': f"{bot_instance.get_memory_usage():.1f}MB",
             'successRate': f"{bot_instance.get_success_rate():.1f}%",
             'avgResponse': f"{bot_instance.get_avg_response_time():.0f}ms",
-            'activeUsers': len(bot_instance.get_active_users()) if hasattr(bot_instance, 'get_active_users') else 0
+            'activeUsers': len(bot_instance.get_active_users()) if hasattr(bot_instance, 'get_active_users') else 0,
+            'http': session_registry.get_stats(),
+            'feed': product_feed.get_stats(),
+            'scheduler': poll_scheduler.get_stats(),
+            'rateLimits': rate_limiter.get_stats(),
+            'circuitBreakers': circuit_breakers.get_stats(),
+            'eventBus': event_bus.get_stats(),
+            'notifications': notifier.get_stats(),
+            'restockCoalescing': restock_coalescer.get_stats(),
+            'dmChannels': user_resolver.get_stats(),
+            'checkpoint': bot_instance.checkpoint.get_stats(),
+            'stockHistory': stock_history.get_stats(),
+            'analytics': stock_analytics.get_stats(),
+            'restockPredictor': restock_predictor.get_stats(),
+            'userData': get_user_store().get_stats()
         }
     else:
         stats = {
@@ -326,6 +346,13 @@ def analytics():
     """Analytics page"""
     return render_template('analytics.html')
 
+@app.route('/api/analytics/summary')
+def analytics_summary():
+    """Restock frequency, histograms, time in stock and drop calendars"""
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    store = request.args.get('store') or None
+    return jsonify(stock_analytics.summary(days, store))
+
 
 def main():
     """Main entry point for the application."""
@@ -0,0 +1,78 @@
+import time
+from typing import Optional
+
+
+class AdaptiveInterval:
+    def __init__(self, base: float, floor: float, ceiling: float,
+                 hot_window: float = 600, backoff: float = 1.5):
+        """Polling interval controller driven by how often a product changes.
+
+        A product that just changed (or has an active drop) is polled at the
+        floor for ``hot_window`` seconds. Once it has been static for longer than
+        that, every unchanged poll stretches the interval by ``backoff`` until it
+        reaches the ceiling. A product expected to stay quiet for a while can be
+        relaxed straight to the ceiling; a change still makes it hot again.
+
+        Args:
+            base: Interval the subscribers asked for, used when leaving the hot phase
+            floor: Fastest allowed interval in seconds
+            ceiling: Slowest allowed interval in seconds
+            hot_window: Seconds after a change during which the floor is used
+            backoff: Growth factor applied per unchanged poll once cold
+        """
+        self.hot_window = hot_window
+        self.backoff = backoff
+        self.samples = 0
+        self.configure(base, floor, ceiling)
+        self.current = self.base
+        self.last_change: Optional[float] = None
+        self.boost_until = 0.0
+        self.relax_until = 0.0
+
+    def configure(self, base: float, floor: float, ceiling: float):
+        """Update the bounds, keeping ``floor <= base <= ceiling``."""
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.base = min(max(base, self.floor), self.ceiling)
+        if self.samples:
+            self.current = min(max(self.current, self.floor), self.ceiling)
+
+    def boost(self, duration: float, now: Optional[float] = None):
+        """Poll at the floor for the next ``duration`` seconds, e.g. during a drop."""
+        now = time.monotonic() if now is None else now
+        self.boost_until = max(self.boost_until, now + duration)
+        self.current = self.floor
+
+    def relax(self, duration: float, now: Optional[float] = None):
+        """Poll at the ceiling for the next ``duration`` seconds unless the product changes."""
+        now = time.monotonic() if now is None else now
+        self.relax_until = max(self.relax_until, now + duration)
+
+    @property
+    def boosted(self) -> bool:
+        return time.monotonic() < self.boost_until
+
+    def record(self, changed: bool, now: Optional[float] = None) -> float:
+        """Record the outcome of a poll and return the interval until the next one.
+
+        Args:
+            changed: Whether the product changed since the previous poll
+            now: Monotonic timestamp of the poll, defaults to now
+
+        Returns:
+            float: Seconds to wait before the next poll
+        """
+        now = time.monotonic() if now is None else now
+        # The first snapshot is always "new" and says nothing about activity
+        if changed and self.samples:
+            self.last_change = now
+        self.samples += 1
+
+        hot = self.last_change is not None and now - self.last_change < self.hot_window
+        if hot or now < self.boost_until:
+            self.current = self.floor
+        elif now < self.relax_until:
+            self.current = self.ceiling
+        else:
+            self.current = min(self.ceiling, max(self.base, self.current * self.backoff))
+        return self.current
@@ -0,0 +1,170 @@
+import logging
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a store whose breaker is open."""
+
+    def __init__(self, store: str, retry_in: float):
+        super().__init__(f"Circuit open for {store}, retrying in {retry_in:.0f}s")
+        self.store = store
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    __slots__ = ("state", "failures", "opened_at", "reset_timeout", "probing", "last_error")
+
+    def __init__(self, reset_timeout: float):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.reset_timeout = reset_timeout
+        # True while the single half-open probe request is in flight
+        self.probing = False
+        self.last_error = ""
+
+    def retry_in(self, now: float) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - now)
+
+
+class StoreCircuitBreakers:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30,
+                 max_reset_timeout: float = 600):
+        """Circuit breakers for every store the bot talks to.
+
+        A store's breaker opens after ``failure_threshold`` consecutive
+        connection errors or 5xx responses. While it is open, requests to the
+        store are refused without touching the network. Once ``reset_timeout``
+        has passed the breaker goes half-open and lets exactly one probe request
+        through: success closes it, failure opens it again for twice as long, up
+        to ``max_reset_timeout``.
+
+        Args:
+            failure_threshold: Consecutive failures that open a breaker
+            reset_timeout: Seconds an opened breaker waits before probing
+            max_reset_timeout: Upper bound for the back-off between failed probes
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.open_count = 0
+        self.rejected = 0
+
+    def _breaker(self, store: str) -> CircuitBreaker:
+        breaker = self._breakers.get(store)
+        if breaker is None:
+            breaker = CircuitBreaker(self.reset_timeout)
+            self._breakers[store] = breaker
+        return breaker
+
+    def is_closed(self, store: str) -> bool:
+        breaker = self._breakers.get(store)
+        return breaker is None or breaker.state == CLOSED
+
+    def retry_in(self, store: str) -> float:
+        """Seconds until ``store`` may be probed again, 0 if requests may be sent."""
+        breaker = self._breakers.get(store)
+        return breaker.retry_in(time.monotonic()) if breaker else 0.0
+
+    def before_request(self, store: str) -> bool:
+        """Check that a request to ``store`` may be sent.
+
+        Returns:
+            bool: True if the request is the half-open probe, which must end with
+            ``record_success``, ``record_failure`` or ``release``
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with its probe
+                already in flight
+        """
+        breaker = self._breakers.get(store)
+        if breaker is None or breaker.state == CLOSED:
+            return False
+
+        if breaker.state == OPEN:
+            wait = breaker.retry_in(time.monotonic())
+            if wait > 0:
+                self.rejected += 1
+                raise CircuitOpenError(store, wait)
+            breaker.state = HALF_OPEN
+            logger.info(f"Probing {store} for recovery")
+
+        if breaker.probing:
+            self.rejected += 1
+            raise CircuitOpenError(store, 0)
+        breaker.probing = True
+        return True
+
+    def record_success(self, store: str):
+        breaker = self._breakers.get(store)
+        if breaker is None:
+            return
+        if breaker.state != CLOSED:
+            logger.info(f"Store {store} recovered, resuming requests")
+            # Drop the entry so healthy stores cost nothing
+            del self._breakers[store]
+            return
+        breaker.failures = 0
+
+    def record_failure(self, store: str, error: str):
+        """Count a connection error or 5xx response against ``store``.
+
+        Args:
+            store: Store host
+            error: Short description of the failure, shown in the stats
+        """
+        breaker = self._breaker(store)
+        breaker.failures += 1
+        breaker.last_error = error
+        now = time.monotonic()
+
+        if breaker.state == HALF_OPEN:
+            breaker.probing = False
+            breaker.reset_timeout = min(breaker.reset_timeout * 2, self.max_reset_timeout)
+            breaker.state = OPEN
+            breaker.opened_at = now
+            logger.warning(f"Store {store} still failing ({error}), next probe in {breaker.reset_timeout:.0f}s")
+        elif breaker.state == CLOSED and breaker.failures >= self.failure_threshold:
+            breaker.state = OPEN
+            breaker.opened_at = now
+            self.open_count += 1
+            logger.error(f"Store {store} failed {breaker.failures} times in a row ({error}), "
+                         f"pausing requests for {breaker.reset_timeout:.0f}s")
+
+    def release(self, store: str):
+        """End a half-open probe that neither succeeded nor failed, e.g. one that was cancelled."""
+        breaker = self._breakers.get(store)
+        if breaker is not None:
+            breaker.probing = False
+
+    def get_stats(self) -> Dict:
+        """Return the stores whose breaker is not closed, for the dashboard."""
+        now = time.monotonic()
+        return {
+            "opened": self.open_count,
+            "rejected": self.rejected,
+            "degraded": {
+                store: {
+                    "state": HALF_OPEN if breaker.state == OPEN and not breaker.retry_in(now) else breaker.state,
+                    "failures": breaker.failures,
+                    "retryIn": round(breaker.retry_in(now)),
+                    "lastError": breaker.last_error
+                }
+                for store, breaker in self._breakers.items()
+                if breaker.state != CLOSED
+            }
+        }
+
+
+# Shared bot-wide breakers
+circuit_breakers = StoreCircuitBreakers()
@@ -1,97 +1,1038 @@
+import asyncio
+import copy
 import json
 import os
 import logging
-from typing import Dict, Any, Optional
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Dict, Any, Callable, Iterable, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
 # Directory for storing user data
 DATA_DIR = "user_data"
+# Database holding user data once migrated off the JSON files
+USER_DB_PATH = os.path.join("instance", "user_data.db")
 
-def ensure_data_dir():
-    """Ensure the data directory exists."""
-    if not os.path.exists(DATA_DIR):
+# Sections of a user's data whose items may be active jobs
+ACTIVE_SECTIONS = ("monitoring_tasks", "price_alerts", "checkout_tasks")
+
+USER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    sections TEXT NOT NULL,
+    extra TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_items (
+    user_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item_id TEXT,
+    active INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, section, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_items_active ON user_items (section, active);
+CREATE INDEX IF NOT EXISTS user_items_item_id ON user_items (user_id, section, item_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# A user created by adding a first item gets the sections the cogs expect
+DEFAULT_SECTIONS = ("profiles", "monitoring_tasks", "checkout_tasks")
+
+INSERT_ITEM_SQL = """
+INSERT OR REPLACE INTO user_items (user_id, section, position, item_id, active, data) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# Compact and deterministic: a list encodes to "[" + ",".join(its items' encodings) + "]"
+_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def _item_row(user_id: str, section: str, position: int, item: Any, text: str) -> tuple:
+    if isinstance(item, dict):
+        item_id = item.get("id")
+        return (user_id, section, position, None if item_id is None else str(item_id),
+                int(bool(item.get("active", False))), text)
+    return (user_id, section, position, None, 0, text)
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix of two strings, by bisection on C-level slice compares."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.startswith(b[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a: str, b: str) -> int:
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.endswith(b[len(b) - middle:]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class JsonUserStore:
+    def __init__(self, data_dir: str = DATA_DIR):
+        """User data kept as one JSON document per user, rewritten on every save.
+
+        Args:
+            data_dir: Directory holding ``<user id>.json`` files
+        """
+        self.data_dir = data_dir
+
+    def ensure_data_dir(self):
+        """Ensure the data directory exists."""
+        if not os.path.exists(self.data_dir):
+            try:
+                os.makedirs(self.data_dir)
+            except Exception as e:
+                logger.error(f"Failed to create data directory: {e}")
+                raise
+
+    def save(self, user_id: str, data: Dict[str, Any], sections: Optional[Iterable[str]] = None) -> bool:
+        # The whole document is rewritten, whichever sections changed
+        self.ensure_data_dir()
+        file_path = os.path.join(self.data_dir, f"{user_id}.json")
+        try:
+            with open(file_path, 'w') as f:
+                json.dump(data, f, indent=4)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+            return False
+
+    def save_many(self, records: Dict[str, Tuple[Dict[str, Any], Optional[Set[str]]]]) -> List[str]:
+        return [user_id for user_id, (data, sections) in records.items() if not self.save(user_id, data, sections)]
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        self.ensure_data_dir()
+        file_path = os.path.join(self.data_dir, f"{user_id}.json")
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading user data: {e}")
+            return None
+
+    def delete(self, user_id: str) -> bool:
+        file_path = os.path.join(self.data_dir, f"{user_id}.json")
+        if not os.path.exists(file_path):
+            return True
+        try:
+            os.remove(file_path)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting user data: {e}")
+            return False
+
+    def load_section(self, user_id: str, section: str) -> list:
+        return (self.load(user_id) or {}).get(section, [])
+
+    def add_item(self, user_id: str, section: str, item: Any) -> bool:
+        data = self.load(user_id) or {name: [] for name in DEFAULT_SECTIONS}
+        data.setdefault(section, []).append(item)
+        return self.save(user_id, data)
+
+    def update_item(self, user_id: str, section: str, item_id: str, changes: Dict[str, Any]) -> Optional[Dict]:
+        data = self.load(user_id)
+        for item in (data or {}).get(section, []):
+            if isinstance(item, dict) and str(item.get("id")) == str(item_id):
+                item.update(changes)
+                return item if self.save(user_id, data) else None
+        return None
+
+    def list_users(self) -> list:
+        self.ensure_data_dir()
+        try:
+            files = os.listdir(self.data_dir)
+            return [f.replace('.json', '') for f in files if f.endswith('.json')]
+        except Exception as e:
+            logger.error(f"Error listing users: {e}")
+            return []
+
+    def list_active_users(self) -> list:
+        active = []
+        for user_id in self.list_users():
+            data = self.load(user_id) or {}
+            for section in ACTIVE_SECTIONS:
+                if any(item.get("active", False) for item in data.get(section, [])):
+                    active.append(user_id)
+                    break
+        return active
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        users = {}
+        for user_id in self.list_users():
+            data = self.load(user_id)
+            if data:
+                users[user_id] = data
+        return users
+
+
+class SqliteUserStore:
+    def __init__(self, db_path: str = USER_DB_PATH, migrate_from: Optional[str] = DATA_DIR):
+        """User data kept as indexed rows in a WAL-mode SQLite database.
+
+        Every list in a user's data (profiles, monitoring_tasks,
+        checkout_tasks, price_alerts, stores, ...) is stored one row per item,
+        keyed by user, section and position. A save only rewrites the items
+        whose JSON changed, and commands touching a single item can read or
+        write just its row through ``add_item`` / ``update_item``. Other
+        top-level values are kept as one JSON document per user. Items are
+        indexed by id, and active jobs for the startup queries.
+
+        The first time the database is opened, users found in the JSON
+        directory are imported once; the files are left in place.
+
+        Args:
+            db_path: Database file
+            migrate_from: JSON directory imported on first open, None to skip
+        """
+        self.db_path = db_path
+        self.migrate_from = migrate_from
+        self._conn: Optional[sqlite3.Connection] = None
+        # Commands run on the loop, startup queries in executor threads
+        self._lock = threading.RLock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(USER_SCHEMA)
+            self._conn = conn
+            if self.migrate_from:
+                self.migrate(JsonUserStore(self.migrate_from))
+        return self._conn
+
+    def migrate(self, source: JsonUserStore) -> int:
+        """Import every user of a JSON store once.
+
+        Users already in the database are kept as they are. The import is
+        recorded, so later calls do nothing.
+
+        Returns:
+            int: Number of users imported
+        """
+        with self._lock:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            if not os.path.isdir(source.data_dir):
+                users = {}
+            else:
+                users = source.load_all()
+            existing = {row[0] for row in conn.execute("SELECT user_id FROM users")}
+            imported = 0
+            with conn:
+                for user_id, data in users.items():
+                    if user_id not in existing:
+                        self._write(conn, user_id, data)
+                        imported += 1
+                conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (source.data_dir,))
+            if users:
+                logger.info(f"Migrated {imported} users from {source.data_dir} to {self.db_path}")
+            return imported
+
+    def _write(self, conn: sqlite3.Connection, user_id: str, data: Dict[str, Any],
+               changed: Optional[Iterable[str]] = None):
+        sections = [key for key, value in data.items() if isinstance(value, list)]
+        extra = {key: value for key, value in data.items() if not isinstance(value, list)}
+        conn.execute(
+            "INSERT INTO users (user_id, sections, extra) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET sections = excluded.sections, extra = excluded.extra "
+            "WHERE sections != excluded.sections OR extra != excluded.extra",
+            (user_id, _encoder.encode(sections), _encoder.encode(extra))
+        )
+        # Sections the caller did not change are not even compared
+        for section in (sections if changed is None else [section for section in sections if section in changed]):
+            self._write_section(conn, user_id, section, data[section])
+        conn.execute(
+            f"DELETE FROM user_items WHERE user_id = ? AND section NOT IN ({','.join('?' * len(sections))})",
+            [user_id] + sections
+        )
+
+    def _write_section(self, conn: sqlite3.Connection, user_id: str, section: str, items: list):
+        """Rewrite only the rows of a section that differ from what is stored.
+
+        The section is encoded in one pass and compared with the stored rows
+        joined the same way. Items inside the common prefix keep their rows,
+        as do items inside the common suffix when the count did not change;
+        everything in between is written.
+        """
+        old = [row[0] for row in conn.execute(
+            "SELECT data FROM user_items WHERE user_id = ? AND section = ? ORDER BY position", (user_id, section)
+        )]
+        new_text = _encoder.encode(items)
+        old_text = f"[{','.join(old)}]"
+        if new_text == old_text:
+            return
+
+        # Leading items whose text and following separator are unchanged
+        prefix = _common_prefix(old_text, new_text)
+        first = 0
+        end = 1
+        while first < len(old) and first < len(items) and end + len(old[first]) + 1 <= prefix:
+            end += len(old[first]) + 1
+            first += 1
+        # Trailing items, only reusable in place when nothing was inserted or removed
+        last = len(items)
+        if len(old) == len(items):
+            suffix = _common_suffix(old_text, new_text)
+            start = len(old_text) - 1
+            while last > first and start - len(old[last - 1]) - 1 >= len(old_text) - suffix:
+                start -= len(old[last - 1]) + 1
+                last -= 1
+
+        texts = [_encoder.encode(item) for item in items[first:last]]
+        if last < len(items) and old_text[:end] + ",".join(texts) + old_text[start:] != new_text:
+            # The common suffix did not fall on item boundaries
+            last = len(items)
+            texts = [_encoder.encode(item) for item in items[first:]]
+        conn.executemany(INSERT_ITEM_SQL, (
+            _item_row(user_id, section, position, items[position], text)
+            for position, text in zip(range(first, last), texts)
+        ))
+        if len(items) < len(old):
+            conn.execute("DELETE FROM user_items WHERE user_id = ? AND section = ? AND position >= ?",
+                         (user_id, section, len(items)))
+
+    def save(self, user_id: str, data: Dict[str, Any], sections: Optional[Iterable[str]] = None) -> bool:
+        return not self.save_many({str(user_id): (data, sections)})
+
+    def save_many(self, records: Dict[str, Tuple[Dict[str, Any], Optional[Set[str]]]]) -> List[str]:
+        """Save several users in one transaction.
+
+        Args:
+            records: User ID -> (user data, sections that changed or None for all of them)
+
+        Returns:
+            List[str]: User IDs that were not saved
+        """
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    for user_id, (data, sections) in records.items():
+                        self._write(conn, str(user_id), data, sections)
+            return []
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+            return list(records)
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT sections, extra FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+                if row is None:
+                    return None
+                items = conn.execute(
+                    "SELECT section, data FROM user_items WHERE user_id = ? ORDER BY section, position",
+                    (str(user_id),)
+                ).fetchall()
+            return self._assemble(row[0], row[1], items)
+        except Exception as e:
+            logger.error(f"Error loading user data: {e}")
+            return None
+
+    @staticmethod
+    def _assemble(sections: str, extra: str, items) -> Dict[str, Any]:
+        texts = {section: [] for section in json.loads(sections)}
+        for section, item in items:
+            texts[section].append(item)
+        # One parse per section rather than one per item
+        data = {section: json.loads(f"[{','.join(section_items)}]") for section, section_items in texts.items()}
+        data.update(json.loads(extra))
+        return data
+
+    def load_section(self, user_id: str, section: str) -> list:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT data FROM user_items WHERE user_id = ? AND section = ? ORDER BY position",
+                (str(user_id), section)
+            ).fetchall()
+        return json.loads(f"[{','.join(row[0] for row in rows)}]")
+
+    def add_item(self, user_id: str, section: str, item: Any) -> bool:
+        user_id = str(user_id)
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    row = conn.execute("SELECT sections FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                    sections = json.loads(row[0]) if row else list(DEFAULT_SECTIONS)
+                    if row is None or section not in sections:
+                        if section not in sections:
+                            sections.append(section)
+                        conn.execute(
+                            "INSERT INTO users (user_id, sections, extra) VALUES (?, ?, '{}') "
+                            "ON CONFLICT (user_id) DO UPDATE SET sections = excluded.sections",
+                            (user_id, _encoder.encode(sections))
+                        )
+                    position = conn.execute(
+                        "SELECT COALESCE(MAX(position) + 1, 0) FROM user_items WHERE user_id = ? AND section = ?",
+                        (user_id, section)
+                    ).fetchone()[0]
+                    conn.execute(INSERT_ITEM_SQL, _item_row(user_id, section, position, item, _encoder.encode(item)))
+            return True
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+            return False
+
+    def update_item(self, user_id: str, section: str, item_id: str, changes: Dict[str, Any]) -> Optional[Dict]:
+        user_id = str(user_id)
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    row = conn.execute(
+                        "SELECT position, data FROM user_items WHERE user_id = ? AND section = ? AND item_id = ? "
+                        "ORDER BY position LIMIT 1", (user_id, section, str(item_id))
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    item = json.loads(row[1])
+                    item.update(changes)
+                    conn.execute(INSERT_ITEM_SQL, _item_row(user_id, section, row[0], item, _encoder.encode(item)))
+            return item
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+            return None
+
+    def delete(self, user_id: str) -> bool:
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute("DELETE FROM user_items WHERE user_id = ?", (str(user_id),))
+                    conn.execute("DELETE FROM users WHERE user_id = ?", (str(user_id),))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting user data: {e}")
+            return False
+
+    def list_users(self) -> list:
         try:
-            os.makedirs(DATA_DIR)
+            with self._lock:
+                return [row[0] for row in self._connection().execute("SELECT user_id FROM users")]
         except Exception as e:
-            logger.error(f"Failed to create data directory: {e}")
-            raise
+            logger.error(f"Error listing users: {e}")
+            return []
+
+    def list_active_users(self) -> list:
+        with self._lock:
+            return [row[0] for row in self._connection().execute(
+                f"SELECT DISTINCT user_id FROM user_items "
+                f"WHERE active = 1 AND section IN ({','.join('?' * len(ACTIVE_SECTIONS))})",
+                ACTIVE_SECTIONS
+            )]
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            conn = self._connection()
+            users = conn.execute("SELECT user_id, sections, extra FROM users").fetchall()
+            items = {}
+            for user_id, section, item in conn.execute(
+                "SELECT user_id, section, data FROM user_items ORDER BY user_id, section, position"
+            ):
+                items.setdefault(user_id, []).append((section, item))
+        loaded = {}
+        for user_id, sections, extra in users:
+            data = self._assemble(sections, extra, items.get(user_id, ()))
+            if data:
+                loaded[user_id] = data
+        return loaded
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _has_active_items(data: Dict[str, Any]) -> bool:
+    return any(
+        isinstance(item, dict) and item.get("active", False)
+        for section in ACTIVE_SECTIONS for item in data.get(section, [])
+    )
+
+
+def _snapshot(data: Dict[str, Any], sections: Optional[Set[str]]) -> Dict[str, Any]:
+    """Copy what a flush is about to write, so the record can keep changing meanwhile.
+
+    Items of the changed sections are copied one level deep; other sections
+    are only looked at for their names.
+    """
+    # list() takes the items in one step, even if another thread adds a key
+    return {
+        key: ([copy.copy(item) for item in value] if sections is None or key in sections else value)
+        if isinstance(value, list) else copy.deepcopy(value)
+        for key, value in list(data.items())
+    }
+
+
+class UserDataCache:
+    def __init__(self, store, max_users: int = 1000, flush_interval: float = 2.0, batch_size: int = 200):
+        """Write-behind cache of user data in front of a store.
+
+        Recently used users are kept in memory, least recently used evicted
+        first. Reads of a cached user never touch the store. Changes update
+        the cached record and mark the user dirty, along with the sections
+        that changed; a background task writes every dirty user in one batch
+        at most ``flush_interval`` seconds after it changed, so a burst of
+        commands from one user costs a single write of the sections they
+        touched. Dirty users are never evicted before they are written, and
+        ``close`` writes whatever is left.
+
+        Until ``start`` is called, and after ``close``, every change is
+        written before the call returns.
+
+        Records returned by ``load`` and ``load_section`` are the cached
+        objects themselves, so a caller that changes one must save it.
+
+        Code on the event loop goes through ``call``: requests that only
+        touch memory are answered on the spot, and anything that may block
+        on the store runs on the cache's own executor.
+
+        Args:
+            store: ``SqliteUserStore`` or ``JsonUserStore`` behind the cache
+            max_users: Users kept in memory
+            flush_interval: Longest a change waits before being written, in seconds
+            batch_size: Dirty users that trigger an early flush
+        """
+        self.store = store
+        self.max_users = max_users
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # user id -> data, least recently used first
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # user id -> sections changed since the last flush, None when the whole record may have
+        self._dirty: Dict[str, Optional[Set[str]]] = {}
+        self._dirty_since: Dict[str, float] = {}
+        # Users of the batch being written, which must stay cached until it is committed
+        self._writing: Set[str] = set()
+        # Bumped by every delete, so a load racing one does not cache what was deleted
+        self._deletes = 0
+        # Commands run on the loop, startup queries and the web UI in other threads
+        self._lock = threading.RLock()
+        # Held while a batch is written, so a delete cannot be overtaken by an older write
+        self._io_lock = threading.Lock()
+        # Store reads and writes for the async API and the flushes; flushes take turns on the I/O lock
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="user-data")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.offloaded = 0
+        self.changes = 0
+        self.flushes = 0
+        self.written = 0
+        self.failed_writes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.max_staleness = 0.0
+
+    def start(self):
+        """Start writing changes behind, from a background task on the running loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task = self._loop.create_task(self._flush_loop())
+        logger.info(f"User data cache started ({self.max_users} users, flushed every {self.flush_interval}s)")
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write every dirty user now, off the loop.
+
+        Returns:
+            int: Number of users written
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self.write_dirty)
+        except Exception as e:
+            logger.error(f"Error flushing user data: {e}")
+            return 0
+
+    def write_dirty(self) -> int:
+        """Write every dirty user in one batch, from the calling thread.
+
+        Users that fail to save stay dirty and are retried by the next flush.
+
+        Returns:
+            int: Number of users written
+        """
+        with self._io_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                batch = {
+                    user_id: (_snapshot(self._records[user_id], sections), sections)
+                    for user_id, sections in self._dirty.items()
+                }
+                since = self._dirty_since
+                self._dirty = {}
+                self._dirty_since = {}
+                self._writing = set(batch)
+            started = time.perf_counter()
+            try:
+                failed = self.store.save_many(batch)
+            except Exception as e:
+                logger.error(f"Error saving user data: {e}")
+                failed = list(batch)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._writing = set()
+                for user_id in failed:
+                    # Still cached unless deleted meanwhile, which wins
+                    if user_id in self._records:
+                        self._mark(user_id, batch[user_id][1])
+                        self._dirty_since[user_id] = min(self._dirty_since[user_id], since[user_id])
+                self._evict()
+        self.flushes += 1
+        self.written += len(batch) - len(failed)
+        self.failed_writes += len(failed)
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.max_staleness = max(self.max_staleness, time.monotonic() - min(since.values()))
+        return len(batch) - len(failed)
+
+    def in_memory(self, user_id: str, writes: bool = False) -> bool:
+        """Whether a request for this user is served from memory alone.
+
+        Args:
+            user_id: Discord user ID
+            writes: The request changes the user, which only stays in memory once started
+        """
+        return str(user_id) in self._records and (not writes or self._task is not None)
+
+    async def call(self, method: Callable, user_id: Optional[str] = None, *args, writes: bool = False) -> Any:
+        """Run one of the cache's methods without blocking the loop.
+
+        Args:
+            method: Bound method of this cache, e.g. ``cache.load``
+            user_id: First argument of the method, None for methods without one
+            *args: Remaining arguments
+            writes: The method changes the user
+
+        Returns:
+            Any: What the method returned
+        """
+        if user_id is None:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, method)
+        if self.in_memory(user_id, writes):
+            # The user could be evicted in between, which at worst makes this one call load it
+            return method(user_id, *args)
+        self.offloaded += 1
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(method, user_id, *args))
+
+    def _get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached record of a user, loading it from the store on a miss.
+
+        The store is read without holding the lock, so a slow load does not
+        hold up callers whose users are cached.
+        """
+        with self._lock:
+            data = self._records.get(user_id)
+            if data is not None:
+                self._records.move_to_end(user_id)
+                self.hits += 1
+                return data
+            self.misses += 1
+            deletes = self._deletes
+        data = self.store.load(user_id)
+        with self._lock:
+            cached = self._records.get(user_id)
+            if cached is not None:
+                # Loaded or created by someone else meanwhile
+                return cached
+            if data is not None and deletes == self._deletes:
+                self._records[user_id] = data
+                self._evict()
+            return data
+
+    def _change(self, user_id: str, change: Callable[[Optional[Dict[str, Any]]], Any]) -> Any:
+        """Apply ``change`` to a user's cached record (None if there is none) under the lock."""
+        while True:
+            data = self._get(user_id)
+            with self._lock:
+                # Retry in the unlikely case the record was evicted or replaced since
+                if self._records.get(user_id) is data:
+                    return change(data)
+
+    def _mark(self, user_id: str, sections: Optional[Iterable[str]]):
+        # Called with the lock held
+        if user_id not in self._dirty:
+            self._dirty[user_id] = None if sections is None else set(sections)
+            self._dirty_since[user_id] = time.monotonic()
+        elif sections is None:
+            self._dirty[user_id] = None
+        elif self._dirty[user_id] is not None:
+            self._dirty[user_id].update(sections)
+
+    def _evict(self):
+        # Called with the lock held; the least recently used clean users go first, never the one just used
+        excess = len(self._records) - self.max_users
+        if excess <= 0:
+            return
+        evicted = []
+        for user_id in islice(self._records, len(self._records) - 1):
+            if user_id not in self._dirty and user_id not in self._writing:
+                evicted.append(user_id)
+                if len(evicted) == excess:
+                    break
+        for user_id in evicted:
+            del self._records[user_id]
+        self.evictions += len(evicted)
+
+    def _changed(self, user_id: str) -> bool:
+        """Write a change through when not started, else wake the flush early on a large batch."""
+        self.changes += 1
+        if self._task is None:
+            self.write_dirty()
+            return user_id not in self._dirty
+        if len(self._dirty) >= self.batch_size:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return True
+
+    def save(self, user_id: str, data: Dict[str, Any], sections: Optional[Iterable[str]] = None) -> bool:
+        user_id = str(user_id)
+        with self._lock:
+            # The sections hint only holds for changes made to the cached record itself
+            if self._records.get(user_id) is not data:
+                sections = None
+            self._records[user_id] = data
+            self._records.move_to_end(user_id)
+            self._mark(user_id, sections)
+            self._evict()
+        return self._changed(user_id)
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._get(str(user_id))
+        except Exception as e:
+            logger.error(f"Error loading user data: {e}")
+            return None
+
+    def load_section(self, user_id: str, section: str) -> list:
+        return (self.load(user_id) or {}).get(section, [])
+
+    def add_item(self, user_id: str, section: str, item: Any) -> bool:
+        user_id = str(user_id)
+
+        def change(data):
+            if data is None:
+                data = {name: [] for name in DEFAULT_SECTIONS}
+                self._records[user_id] = data
+            data.setdefault(section, []).append(item)
+            self._mark(user_id, (section,))
+            self._evict()
+
+        self._change(user_id, change)
+        return self._changed(user_id)
+
+    def update_item(self, user_id: str, section: str, item_id: str, changes: Dict[str, Any]) -> Optional[Dict]:
+        user_id = str(user_id)
+
+        def change(data):
+            for item in (data or {}).get(section, []):
+                if isinstance(item, dict) and str(item.get("id")) == str(item_id):
+                    item.update(changes)
+                    self._mark(user_id, (section,))
+                    return dict(item)
+            return None
+
+        updated = self._change(user_id, change)
+        if updated is None:
+            return None
+        return updated if self._changed(user_id) else None
+
+    def delete(self, user_id: str) -> bool:
+        user_id = str(user_id)
+        with self._lock:
+            self._records.pop(user_id, None)
+            self._dirty.pop(user_id, None)
+            self._dirty_since.pop(user_id, None)
+            self._deletes += 1
+        with self._io_lock:
+            return self.store.delete(user_id)
+
+    def _pending(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Users whose latest data may not be in the store yet, with a copy of their cached record."""
+        with self._lock:
+            return {
+                user_id: _snapshot(self._records[user_id], None) if user_id in self._records else None
+                for user_id in set(self._dirty) | self._writing
+            }
+
+    def list_users(self) -> list:
+        pending = self._pending()
+        users = self.store.list_users()
+        listed = set(users)
+        users.extend(user_id for user_id in pending if user_id not in listed)
+        return users
+
+    def list_active_users(self) -> list:
+        pending = self._pending()
+        active = [user_id for user_id in self.store.list_active_users() if user_id not in pending]
+        active.extend(user_id for user_id, data in pending.items() if data is not None and _has_active_items(data))
+        return active
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        pending = self._pending()
+        users = self.store.load_all()
+        for user_id, data in pending.items():
+            if data is not None:
+                users[user_id] = data
+        return users
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            oldest = min(self._dirty_since.values(), default=None)
+            dirty = len(self._dirty)
+            cached = len(self._records)
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.store).__name__,
+            'cached': cached,
+            'maxUsers': self.max_users,
+            'dirty': dirty,
+            'oldestDirtySeconds': round(time.monotonic() - oldest, 2) if oldest is not None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups * 100, 1) if lookups else None,
+            'evictions': self.evictions,
+            'offloaded': self.offloaded,
+            'changes': self.changes,
+            'flushes': self.flushes,
+            'written': self.written,
+            'failedWrites': self.failed_writes,
+            'avgFlushMs': round(self.flush_seconds / self.flushes * 1000, 2) if self.flushes else None,
+            'maxFlushMs': round(self.max_flush_seconds * 1000, 2),
+            'maxStalenessSeconds': round(self.max_staleness, 2),
+            'flushInterval': self.flush_interval
+        }
+
+    async def close(self):
+        """Stop the background task and write every change still in memory."""
+        if self._task is not None:
+            # Let the task finish its last flush rather than cancelling it mid-write
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        written = await self.flush()
+        if self._dirty:
+            logger.error(f"{len(self._dirty)} users could not be saved on shutdown")
+        elif written:
+            logger.info(f"Saved {written} users on shutdown")
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, close)
+
+
+def create_user_store(backend: str):
+    """Return the user data store for ``backend``: ``sqlite`` or ``json``."""
+    if backend == "json":
+        return JsonUserStore(DATA_DIR)
+    if backend == "sqlite":
+        return SqliteUserStore(USER_DB_PATH, DATA_DIR)
+    raise ValueError(f"Unknown user data backend: {backend}")
+
+
+_user_store = None
+
+
+def get_user_store() -> UserDataCache:
+    """Return the bot-wide user data cache, over the store chosen by ``USER_DATA_BACKEND`` on first use.
+
+    ``USER_DATA_CACHE_SIZE`` sets how many users are kept in memory and
+    ``USER_DATA_FLUSH_INTERVAL`` how many seconds a change may wait before it is written.
+    """
+    global _user_store
+    if _user_store is None:
+        _user_store = UserDataCache(
+            create_user_store(os.getenv("USER_DATA_BACKEND", "sqlite")),
+            max_users=int(os.getenv("USER_DATA_CACHE_SIZE", "1000")),
+            flush_interval=float(os.getenv("USER_DATA_FLUSH_INTERVAL", "2"))
+        )
+    return _user_store
+
+def ensure_data_dir():
+    """Ensure the data directory exists."""
+    JsonUserStore(DATA_DIR).ensure_data_dir()
+
+def save_user_data(user_id: str, data: Dict[str, Any], sections: Optional[Iterable[str]] = None) -> bool:
+    """Save user data.
 
-def save_user_data(user_id: str, data: Dict[str, Any]) -> bool:
-    """Save user data to file.
-    
     Args:
         user_id: Discord user ID
         data: User data dictionary to save
-        
+        sections: Sections that changed, when ``data`` is the dictionary ``load_user_data`` returned;
+            None to compare all of them
+
     Returns:
         bool: True if successful, False otherwise
     """
-    ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-    
-    try:
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=4)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving user data: {e}")
-        return False
+    return get_user_store().save(user_id, data, sections)
 
 def load_user_data(user_id: str) -> Optional[Dict[str, Any]]:
-    """Load user data from file.
-    
+    """Load user data.
+
     Args:
         user_id: Discord user ID
-        
+
     Returns:
-        Optional[Dict[str, Any]]: User data or None if not found
+        Optional[Dict[str, Any]]: User data or None if not found; the cached record itself,
+        so save it after changing it
     """
-    ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-    
-    if not os.path.exists(file_path):
-        return None
-    
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading user data: {e}")
-        return None
+    return get_user_store().load(user_id)
+
+def load_user_items(user_id: str, section: str) -> list:
+    """Load one section of a user's data, e.g. their checkout tasks.
+
+    Args:
+        user_id: Discord user ID
+        section: Section name such as ``"checkout_tasks"``
+
+    Returns:
+        list: Items of the section, empty if the user or section does not exist
+    """
+    return get_user_store().load_section(user_id, section)
+
+def add_user_item(user_id: str, section: str, item: Any) -> bool:
+    """Append an item to a section of a user's data, creating the user if needed.
+
+    Args:
+        user_id: Discord user ID
+        section: Section name such as ``"monitoring_tasks"``
+        item: Item to append
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    return get_user_store().add_item(user_id, section, item)
+
+def update_user_item(user_id: str, section: str, item_id: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Update the fields of one item, found by its ``id``, in a section of a user's data.
+
+    Args:
+        user_id: Discord user ID
+        section: Section name such as ``"checkout_tasks"``
+        item_id: ``id`` of the item
+        changes: Fields to set
+
+    Returns:
+        Optional[Dict[str, Any]]: The updated item, or None if it was not found or could not be saved
+    """
+    return get_user_store().update_item(user_id, section, item_id, changes)
 
 def delete_user_data(user_id: str) -> bool:
-    """Delete user data file.
-    
+    """Delete user data.
+
     Args:
         user_id: Discord user ID
-        
+
     Returns:
         bool: True if successful, False otherwise
     """
-    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-    
-    if not os.path.exists(file_path):
-        return True
-    
-    try:
-        os.remove(file_path)
-        return True
-    except Exception as e:
-        logger.error(f"Error deleting user data: {e}")
-        return False
+    return get_user_store().delete(user_id)
 
 def list_users() -> list:
     """List all user IDs with saved data.
-    
+
     Returns:
         list: List of user IDs
     """
-    ensure_data_dir()
-    
-    try:
-        files = os.listdir(DATA_DIR)
-        return [f.replace('.json', '') for f in files if f.endswith('.json')]
-    except Exception as e:
-        logger.error(f"Error listing users: {e}")
-        return []
+    return get_user_store().list_users()
+
+def list_active_users() -> list:
+    """List the user IDs with at least one active monitor, price alert or checkout task.
+
+    Returns:
+        list: List of user IDs
+    """
+    return get_user_store().list_active_users()
+
+def load_all_user_data() -> Dict[str, Dict[str, Any]]:
+    """Load the saved data of every user.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: User ID -> user data, skipping unreadable entries
+    """
+    return get_user_store().load_all()
+
+async def save_user_data_async(user_id: str, data: Dict[str, Any], sections: Optional[Iterable[str]] = None) -> bool:
+    """``save_user_data`` for the event loop: blocking store writes run on the storage executor."""
+    store = get_user_store()
+    return await store.call(store.save, user_id, data, sections, writes=True)
+
+async def load_user_data_async(user_id: str) -> Optional[Dict[str, Any]]:
+    """``load_user_data`` for the event loop: a user who is not cached is loaded on the storage executor."""
+    store = get_user_store()
+    return await store.call(store.load, user_id)
+
+async def load_user_items_async(user_id: str, section: str) -> list:
+    """``load_user_items`` for the event loop."""
+    store = get_user_store()
+    return await store.call(store.load_section, user_id, section)
+
+async def add_user_item_async(user_id: str, section: str, item: Any) -> bool:
+    """``add_user_item`` for the event loop."""
+    store = get_user_store()
+    return await store.call(store.add_item, user_id, section, item, writes=True)
+
+async def update_user_item_async(user_id: str, section: str, item_id: str,
+                                 changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """``update_user_item`` for the event loop."""
+    store = get_user_store()
+    return await store.call(store.update_item, user_id, section, item_id, changes, writes=True)
+
+async def delete_user_data_async(user_id: str) -> bool:
+    """``delete_user_data`` for the event loop; always runs on the storage executor."""
+    store = get_user_store()
+    return await store.call(partial(store.delete, user_id))
+
+async def list_active_users_async() -> list:
+    """``list_active_users`` for the event loop, run on the storage executor."""
+    store = get_user_store()
+    return await store.call(store.list_active_users)
+
+async def load_all_user_data_async() -> Dict[str, Dict[str, Any]]:
+    """``load_all_user_data`` for the event loop, run on the storage executor."""
+    store = get_user_store()
+    return await store.call(store.load_all)
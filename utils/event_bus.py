@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Topics
+STOCK_TOPIC = "stock"
+PRICE_TOPIC = "price"
+NOTIFY_TOPIC = "notifications"
+
+# Backpressure policies applied when a consumer's queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+class BusConsumer:
+    def __init__(self, topic: str, handler: Handler, name: str, maxsize: int, policy: str,
+                 key: Optional[Callable[[Any], Hashable]], concurrency: int, lag_samples: int = 1000):
+        """One subscriber of a topic with its own bounded queue and worker tasks.
+
+        Args:
+            topic: Topic consumed
+            handler: Coroutine called with each message
+            name: Name shown in the stats
+            maxsize: Queue capacity
+            policy: ``BLOCK`` makes publishers wait for room, ``DROP_OLDEST``
+                discards the oldest queued message, ``COALESCE`` replaces a
+                queued message with the same ``key`` and otherwise drops the oldest
+            key: Coalescing key of a message, required for ``COALESCE``
+            concurrency: Number of messages handled at the same time
+            lag_samples: Number of recent queueing delays kept for stats
+        """
+        if policy not in (BLOCK, DROP_OLDEST, COALESCE):
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        if policy == COALESCE and key is None:
+            raise ValueError("The coalesce policy needs a key function")
+        self.topic = topic
+        self.handler = handler
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.concurrency = concurrency
+        # Entries are (enqueued at, message); coalescing queues are keyed
+        self._items = OrderedDict() if policy == COALESCE else deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._lag = deque(maxlen=lag_samples)
+        self.max_lag = 0.0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def put(self, message):
+        self.published += 1
+        entry = (time.monotonic(), message)
+        if self.policy == BLOCK:
+            while len(self._items) >= self.maxsize:
+                self._space.clear()
+                await self._space.wait()
+            self._items.append(entry)
+        elif self.policy == DROP_OLDEST:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(entry)
+        else:
+            key = self.key(message)
+            if key in self._items:
+                # Keep the original position and enqueue time, so lag stays honest
+                self._items[key] = (self._items[key][0], message)
+                self.coalesced += 1
+            else:
+                if len(self._items) >= self.maxsize:
+                    self._items.popitem(last=False)
+                    self.dropped += 1
+                self._items[key] = entry
+        self._ready.set()
+
+    def _take(self):
+        if self.policy == COALESCE:
+            return self._items.popitem(last=False)[1]
+        return self._items.popleft()
+
+    async def _run(self):
+        while True:
+            while not self._items:
+                self._ready.clear()
+                await self._ready.wait()
+            enqueued, message = self._take()
+            self._space.set()
+
+            lag = time.monotonic() - enqueued
+            self._lag.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                await self.handler(message)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error in event bus consumer {self.name}: {e}")
+            self.delivered += 1
+
+    def get_stats(self) -> Dict:
+        samples = list(self._lag) or [0.0]
+        return {
+            "topic": self.topic,
+            "policy": self.policy,
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "lagAvgMs": round(sum(samples) / len(samples) * 1000, 1),
+            "lagMaxMs": round(self.max_lag * 1000, 1)
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+class EventBus:
+    def __init__(self):
+        """In-process publish/subscribe between pollers and the work they trigger.
+
+        Producers (the product feed's diff, monitors) publish to a topic and
+        return as soon as every consumer has queued the message; each consumer
+        drains its own bounded queue on its own tasks. A slow consumer, e.g. one
+        sending Discord DMs, therefore never holds up polling or the other
+        consumers, except through its explicit ``BLOCK`` backpressure.
+        """
+        self._consumers: Dict[str, List[BusConsumer]] = {}
+
+    def subscribe(self, topic: str, handler: Handler, name: Optional[str] = None, maxsize: int = 1000,
+                  policy: str = BLOCK, key: Optional[Callable[[Any], Hashable]] = None,
+                  concurrency: int = 1) -> BusConsumer:
+        """Add a consumer to a topic and start its worker tasks.
+
+        Args:
+            topic: Topic to consume
+            handler: Coroutine called with each message
+            name: Name shown in the stats, defaults to the handler's name
+            maxsize: Queue capacity
+            policy: ``BLOCK``, ``DROP_OLDEST`` or ``COALESCE``
+            key: Coalescing key of a message, required for ``COALESCE``
+            concurrency: Number of messages handled at the same time
+
+        Returns:
+            BusConsumer: Handle to pass to ``unsubscribe``
+        """
+        consumer = BusConsumer(topic, handler, name or getattr(handler, "__qualname__", topic),
+                               maxsize, policy, key, concurrency)
+        consumer.start()
+        self._consumers.setdefault(topic, []).append(consumer)
+        logger.info(f"Event bus consumer {consumer.name} subscribed to {topic} ({policy}, max {maxsize})")
+        return consumer
+
+    async def unsubscribe(self, consumer: BusConsumer):
+        consumers = self._consumers.get(consumer.topic, [])
+        if consumer in consumers:
+            consumers.remove(consumer)
+        await consumer.close()
+
+    def has_consumers(self, topic: str) -> bool:
+        return bool(self._consumers.get(topic))
+
+    async def publish(self, topic: str, message):
+        """Queue a message for every consumer of a topic.
+
+        Returns immediately unless a ``BLOCK`` consumer's queue is full.
+        Messages for a topic without consumers are discarded.
+        """
+        for consumer in self._consumers.get(topic, ()):
+            await consumer.put(message)
+
+    def get_stats(self) -> Dict:
+        """Return queue depth, counters and lag of every consumer."""
+        return {
+            consumer.name: consumer.get_stats()
+            for consumers in self._consumers.values() for consumer in consumers
+        }
+
+    async def close(self):
+        """Stop every consumer; queued messages are discarded."""
+        consumers = [consumer for consumers in self._consumers.values() for consumer in consumers]
+        self._consumers.clear()
+        await asyncio.gather(*(consumer.close() for consumer in consumers))
+
+
+class KeyRouter:
+    def __init__(self, topics: Tuple[str, ...], name: str, route: Callable[[Any], Hashable],
+                 policy: str = BLOCK, key: Optional[Callable[[Any], Hashable]] = None,
+                 maxsize: int = 1000):
+        """One consumer per topic shared by many handlers, each interested in one key.
+
+        Per-product consumers would each queue a copy of every message on the
+        topic; a router queues it once and hands it only to the handlers
+        registered for the message's route key, e.g. its product URL. The bus
+        consumers are subscribed with the first handler.
+
+        Args:
+            topics: Topics consumed
+            name: Name prefix shown in the stats
+            route: Returns the route key of a message
+            policy: Backpressure policy of the consumers
+            key: Coalescing key of a message, required for ``COALESCE``
+            maxsize: Queue capacity of each consumer
+        """
+        self.topics = topics
+        self.name = name
+        self.route = route
+        self.policy = policy
+        self.key = key
+        self.maxsize = maxsize
+        self._handlers: Dict[Hashable, List[Handler]] = {}
+        self._consumers: List[BusConsumer] = []
+
+    def add(self, route_key: Hashable, handler: Handler):
+        """Deliver the messages routed to ``route_key`` to a handler; needs a running loop."""
+        if not self._consumers:
+            self._consumers = [
+                event_bus.subscribe(topic, self._dispatch, name=f"{self.name}-{topic}",
+                                    maxsize=self.maxsize, policy=self.policy, key=self.key)
+                for topic in self.topics
+            ]
+        self._handlers.setdefault(route_key, []).append(handler)
+
+    def remove(self, route_key: Hashable, handler: Handler):
+        handlers = self._handlers.get(route_key)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+            if not handlers:
+                del self._handlers[route_key]
+
+    async def _dispatch(self, message):
+        handlers = self._handlers.get(self.route(message))
+        if not handlers:
+            return
+        results = await asyncio.gather(*(handler(message) for handler in list(handlers)),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error in {self.name} handler: {result}")
+
+
+# Shared bot-wide bus
+event_bus = EventBus()
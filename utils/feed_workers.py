@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from bisect import bisect
+from collections import deque
+from typing import Dict, List, Optional
+from utils.product_feed import publish_events
+from utils.product_metadata import slim_product
+from utils.rate_limiter import store_of
+from utils.variant_events import ProductUpdate
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the stats snapshots each worker pushes to the bot process
+STATS_INTERVAL = 5
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: int, replicas: int = 64):
+        """Consistent hash ring mapping store hosts to worker indexes.
+
+        Each worker owns ``replicas`` points on the ring, so resizing the pool
+        only moves about ``1/nodes`` of the stores to another worker.
+
+        Args:
+            nodes: Number of workers
+            replicas: Virtual points per worker
+        """
+        points = sorted(
+            (_hash(f"worker-{node}-{replica}"), node)
+            for node in range(nodes) for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, store: str) -> int:
+        index = bisect(self._hashes, _hash(store)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def _pump(conn, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+    """Move messages from a pipe onto a loop's queue from a dedicated thread.
+
+    Reading never waits on the loop, so a side blocked sending into a full
+    pipe cannot deadlock against the other side doing the same.
+    """
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            message = None
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+        except RuntimeError:
+            # Loop already closed
+            return
+        if message is None:
+            return
+
+
+async def _serve(conn):
+    """Worker process loop: poll the products it is given and stream updates back."""
+    # Imported here so each worker builds its own feed, scheduler and connection pool
+    from utils.http_client import session_registry
+    from utils.poll_scheduler import poll_scheduler
+    from utils.product_feed import product_feed
+
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+    threading.Thread(target=_pump, args=(conn, loop, inbox), daemon=True).start()
+    subscriptions = {}
+    outbox = []
+
+    def flush():
+        batch, outbox[:] = list(outbox), []
+        slimmed = {}
+        messages = []
+        for remote_id, update in batch:
+            # One slim copy per product; pickle then sends it once per batch
+            product = slimmed.get(id(update.product))
+            if product is None:
+                product = slimmed[id(update.product)] = slim_product(update.product)
+            messages.append((remote_id, ProductUpdate(
+                update.key, product, update.state, update.events, update.initial
+            )))
+        conn.send(("updates", messages))
+
+    def deliver_to(remote_id: int):
+        async def deliver(update: ProductUpdate):
+            if not outbox:
+                loop.call_soon(flush)
+            outbox.append((remote_id, update))
+        return deliver
+
+    async def push_stats():
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            conn.send(("stats", {
+                **product_feed.get_stats(),
+                "http": session_registry.get_stats(),
+                "scheduler": poll_scheduler.get_stats()
+            }))
+
+    stats_task = loop.create_task(push_stats())
+    try:
+        while True:
+            message = await inbox.get()
+            if message is None:
+                break
+            command, args = message[0], message[1:]
+            if command == "subscribe":
+                remote_id, key, interval, min_interval, max_interval, seed = args
+                if seed is not None:
+                    product_feed.restore({key: seed})
+                subscriptions[remote_id] = product_feed.subscribe(
+                    key, deliver_to(remote_id), interval, min_interval, max_interval
+                )
+            elif command == "unsubscribe":
+                subscription = subscriptions.pop(args[0], None)
+                if subscription:
+                    product_feed.unsubscribe(subscription)
+            elif command == "snapshot":
+                subscription = subscriptions.get(args[0])
+                if subscription:
+                    product_feed.request_snapshot(subscription)
+            elif command == "boost":
+                product_feed.boost(*args)
+            elif command == "relax":
+                product_feed.relax(*args)
+            elif command == "stop":
+                break
+    finally:
+        stats_task.cancel()
+        product_feed.close()
+        await poll_scheduler.close()
+        await session_registry.close()
+
+
+def _worker_main(conn, index: int):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s"
+    )
+    try:
+        asyncio.run(_serve(conn))
+    except KeyboardInterrupt:
+        pass
+
+
+class FeedWorkerPool:
+    def __init__(self, workers: int, replicas: int = 64, latency_samples: int = 1000):
+        """Runs product polling in separate processes, sharded by store.
+
+        Each store is assigned to one worker by consistent hashing of its host.
+        A worker is a full copy of the polling stack (feed, scheduler,
+        connection pool, rate limiter and circuit breakers) on its own event
+        loop and core. Subscriptions are forwarded to the owning worker and the
+        ``ProductUpdate``s it produces are streamed back over a pipe and handed
+        to the subscribers on the bot's loop. A worker that dies is restarted
+        and its subscriptions are replayed.
+
+        Args:
+            workers: Number of worker processes
+            replicas: Virtual nodes per worker on the hash ring
+            latency_samples: Number of recent event delivery delays kept for stats
+        """
+        self.workers = workers
+        self.ring = HashRing(workers, replicas)
+        self.feed = None
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._conns: List = [None] * workers
+        self._readers: List[asyncio.Task] = []
+        self._ids = itertools.count(1)
+        # remote id -> (subscription, worker index)
+        self._subscriptions: Dict[int, tuple] = {}
+        self._keys: Dict[str, int] = {}
+        self._worker_stats: List[Dict] = [{} for _ in range(workers)]
+        self._latency = deque(maxlen=latency_samples)
+        self.restarts = 0
+        self.closing = False
+
+    async def start(self):
+        """Start every worker process and the tasks reading from them."""
+        self.closing = False
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Started {self.workers} feed worker processes")
+
+    def _spawn(self, index: int):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child, index), name=f"feed-worker-{index}", daemon=True
+        )
+        process.start()
+        child.close()
+        self._processes[index] = process
+        self._conns[index] = parent
+        loop = asyncio.get_running_loop()
+        inbox = asyncio.Queue()
+        threading.Thread(
+            target=_pump, args=(parent, loop, inbox), name=f"feed-worker-{index}-pipe", daemon=True
+        ).start()
+        self._readers.append(loop.create_task(self._read(index, inbox)))
+
+    def _send(self, index: int, *message):
+        try:
+            self._conns[index].send(message)
+        except (OSError, AttributeError) as e:
+            logger.error(f"Could not reach feed worker {index}: {e}")
+
+    def subscribe(self, subscription, seed: Optional[Dict] = None):
+        remote_id = next(self._ids)
+        index = self.ring.node_for(store_of(subscription.key))
+        subscription.remote_id = remote_id
+        self._subscriptions[remote_id] = (subscription, index)
+        self._keys[subscription.key] = self._keys.get(subscription.key, 0) + 1
+        self._send(index, "subscribe", remote_id, subscription.key, subscription.interval,
+                   subscription.min_interval, subscription.max_interval, seed)
+
+    def unsubscribe(self, subscription):
+        entry = self._subscriptions.pop(subscription.remote_id, None)
+        if entry is None:
+            return
+        self._send(entry[1], "unsubscribe", subscription.remote_id)
+        remaining = self._keys.get(subscription.key, 1) - 1
+        if remaining:
+            self._keys[subscription.key] = remaining
+        else:
+            del self._keys[subscription.key]
+            self.feed._forget(subscription.key)
+
+    def request_snapshot(self, subscription):
+        entry = self._subscriptions.get(subscription.remote_id)
+        if entry is not None:
+            self._send(entry[1], "snapshot", subscription.remote_id)
+
+    def boost(self, key: str, duration: float, preconnect: bool = False):
+        self._send(self.ring.node_for(store_of(key)), "boost", key, duration, preconnect)
+
+    def relax(self, key: str, duration: float):
+        self._send(self.ring.node_for(store_of(key)), "relax", key, duration)
+
+    def is_subscribed(self, key: str) -> bool:
+        return key in self._keys
+
+    def watched(self) -> List[str]:
+        return list(self._keys)
+
+    async def _read(self, index: int, inbox: asyncio.Queue):
+        while True:
+            message = await inbox.get()
+            if message is None:
+                break
+            command, payload = message
+            if command == "updates":
+                await self._deliver(payload)
+            elif command == "stats":
+                self._worker_stats[index] = payload
+
+        if not self.closing:
+            logger.error(f"Feed worker {index} exited, restarting it")
+            self.restarts += 1
+            self._spawn(index)
+            for remote_id, (subscription, owner) in self._subscriptions.items():
+                if owner == index:
+                    # The bot's cached copy keeps the restarted worker from re-announcing old stock
+                    self._send(index, "subscribe", remote_id, subscription.key, subscription.interval,
+                               subscription.min_interval, subscription.max_interval,
+                               self.feed.get_cached(subscription.key))
+
+    async def _deliver(self, messages: List[tuple]):
+        now = time.time()
+        calls = []
+        published = set()
+        for remote_id, update in messages:
+            entry = self._subscriptions.get(remote_id)
+            active = entry is not None and entry[0].active
+            if active:
+                # Cached before publishing, so bus consumers see the state their events describe
+                self.feed._store_remote(update)
+            # Subscribers of one product share the update's event list; publish it once
+            if update.events and id(update.events) not in published:
+                published.add(id(update.events))
+                for event in update.events:
+                    self._latency.append(now - event.timestamp)
+                await publish_events(update.events)
+            if not active:
+                continue
+            subscription = entry[0]
+            subscription.primed = True
+            if subscription.callback is not None:
+                calls.append(subscription.callback(update))
+
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error in product feed subscriber: {result}")
+
+    def get_stats(self) -> Dict:
+        """Return pool statistics, with IPC delivery delay in milliseconds."""
+        samples = sorted(self._latency) or [0.0]
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in self._processes if process is not None and process.is_alive()),
+            "restarts": self.restarts,
+            "subscriptions": len(self._subscriptions),
+            "deliveryAvgMs": round(sum(samples) / len(samples) * 1000, 1),
+            "deliveryP95Ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+            "perWorker": self._worker_stats
+        }
+
+    async def close(self):
+        """Stop every worker process."""
+        self.closing = True
+        for index in range(self.workers):
+            self._send(index, "stop")
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is not None:
+                await loop.run_in_executor(None, process.join, 5)
+                if process.is_alive():
+                    process.terminate()
+        for task in self._readers:
+            task.cancel()
+        await asyncio.gather(*self._readers, return_exceptions=True)
+        for conn in self._conns:
+            if conn is not None:
+                conn.close()
+        self._readers = []
+        self._subscriptions.clear()
+        self._keys.clear()
+        logger.info("Stopped feed worker processes")
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import time
+import aiohttp
+import zlib
+from typing import Dict, Optional
+from urllib.parse import urlencode
+from utils.circuit_breaker import circuit_breakers
+from utils.rate_limiter import rate_limiter, store_of
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "application/json,text/html;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive"
+}
+
+# Sent when a storefront HTML page is fetched instead of a JSON endpoint
+PAGE_HEADERS = {
+    **DEFAULT_HEADERS,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Upgrade-Insecure-Requests": "1",
+    "Cache-Control": "max-age=0"
+}
+
+
+class FetchResult:
+    def __init__(self, status: int, body: Optional[bytes], headers):
+        """Outcome of a conditional GET.
+
+        Args:
+            status: HTTP status code
+            body: Raw response body, or None for a 304
+            headers: Response headers
+        """
+        self.status = status
+        self.body = body
+        self.headers = headers
+        self._digest = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+    @property
+    def digest(self) -> Optional[int]:
+        """Cheap fingerprint of the body (CRC-32 combined with its length).
+
+        Comparing it with the previous poll's fingerprint lets callers skip
+        ``json.loads`` when a server without validators returns identical bytes.
+        """
+        if self._digest is None and self.body is not None:
+            self._digest = (len(self.body) << 32) | zlib.crc32(self.body)
+        return self._digest
+
+
+class StoreRequest:
+    def __init__(self, store: str):
+        """Guard for one request to a store: its circuit breaker, then its rate limit.
+
+        Used as ``async with StoreRequest(store) as request:`` around sending
+        the request. Entering checks the breaker before waiting for a rate
+        limit token, so a request to a failing store is refused at once
+        without spending a token; the breaker is checked again after a wait in
+        case it tripped meanwhile. Call ``record`` with the response once it is
+        known to be complete. Connection errors and timeouts raised inside the
+        block count against the breaker, and a half-open probe is always ended.
+
+        Args:
+            store: Store host
+
+        Raises:
+            CircuitOpenError: On entering, if the store's circuit breaker is open
+        """
+        self.store = store
+        self.probe = False
+
+    async def __aenter__(self) -> "StoreRequest":
+        self.probe = circuit_breakers.before_request(self.store)
+        try:
+            await rate_limiter.acquire(self.store)
+            if not self.probe:
+                # The breaker may have tripped while this request waited for its token
+                self.probe = circuit_breakers.before_request(self.store)
+        except BaseException:
+            # __aexit__ is not called when entering fails, e.g. on a cancelled wait
+            if self.probe:
+                circuit_breakers.release(self.store)
+            raise
+        return self
+
+    def record(self, response: aiohttp.ClientResponse):
+        """Throttle the store on a 429/503 and count the response for its breaker."""
+        if response.status in (429, 503):
+            rate_limiter.penalize(self.store, response.headers.get("Retry-After"))
+        if response.status >= 500:
+            circuit_breakers.record_failure(self.store, f"HTTP {response.status}")
+        else:
+            circuit_breakers.record_success(self.store)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is not None and issubclass(exc_type, (aiohttp.ClientError, asyncio.TimeoutError)):
+                circuit_breakers.record_failure(self.store, str(exc) or exc_type.__name__)
+        finally:
+            if self.probe:
+                circuit_breakers.release(self.store)
+        return False
+
+
+class SessionRegistry:
+    def __init__(self, limit: int = 200, limit_per_host: int = 8, dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 60, request_timeout: float = 20):
+        """Bot-wide registry of HTTP connections used for every Shopify request.
+
+        All sessions share one connector, so TCP/TLS connections are kept alive
+        and reused across polls and DNS lookups are cached.
+
+        Args:
+            limit: Maximum number of open connections overall
+            limit_per_host: Maximum number of open connections per store
+            dns_cache_ttl: Seconds to cache DNS lookups
+            keepalive_timeout: Seconds an idle connection is kept open
+            request_timeout: Total timeout for a single request in seconds
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout)
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # url -> (etag, last_modified, body size) from the last 200 response
+        self._validators: Dict[str, tuple] = {}
+        # store -> monotonic time of the last preconnect
+        self._preconnected: Dict[str, float] = {}
+        self.stats = {
+            "requests": 0,
+            "preconnects": 0,
+            "notModified": 0,
+            "bytesReceived": 0,
+            "bytesSaved": 0
+        }
+
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        loop = asyncio.get_running_loop()
+        if self._connector is None or self._connector.closed or self._loop is not loop:
+            # A connector is bound to the loop it was created on; a restarted
+            # bot runs on a fresh loop and needs a fresh pool.
+            self._session = None
+            self._loop = loop
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+        return self._connector
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session for anonymous product fetches.
+
+        The session ignores cookies so that one store's cookies never leak into
+        requests made on behalf of another user.
+        """
+        connector = self._get_connector()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                connector_owner=False,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                headers=DEFAULT_HEADERS,
+                timeout=self.timeout
+            )
+        return self._session
+
+    def create_session(self, **kwargs) -> aiohttp.ClientSession:
+        """Create a session with its own cookie jar on the shared connection pool.
+
+        Used for stateful flows such as checkout, where cart cookies must stay
+        private to one task. The caller closes it; closing does not close the
+        shared pool.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return aiohttp.ClientSession(
+            connector=self._get_connector(),
+            connector_owner=False,
+            **kwargs
+        )
+
+    async def fetch(self, url: str, params: Optional[Dict] = None, conditional: bool = True) -> FetchResult:
+        """GET a URL on the shared session, revalidating it when possible.
+
+        The ETag/Last-Modified validators of the last 200 response are sent as
+        ``If-None-Match``/``If-Modified-Since``. A 304 comes back with no body so
+        callers can skip decoding and diffing entirely. Every request draws from
+        the store's rate limit bucket, and a 429/503 throttles the store.
+        Connection errors and 5xx responses count against the store's circuit
+        breaker.
+
+        Args:
+            url: URL to fetch
+            params: Optional query parameters
+            conditional: Send stored validators; pass False when the caller no
+                longer has the previous body to fall back on
+
+        Returns:
+            FetchResult: Status, raw body and headers of the response
+
+        Raises:
+            CircuitOpenError: If the store's circuit breaker is open
+        """
+        cache_key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        validators = self._validators.get(cache_key) if conditional else None
+        headers = {}
+        if validators:
+            etag, last_modified, _ = validators
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        async with StoreRequest(store_of(url)) as request:
+            session = self.get_session()
+            async with session.get(url, params=params, headers=headers) as response:
+                self.stats["requests"] += 1
+                if response.status == 304 and validators:
+                    self.stats["notModified"] += 1
+                    self.stats["bytesSaved"] += validators[2]
+                    request.record(response)
+                    return FetchResult(304, None, response.headers)
+
+                body = await response.read()
+                self.stats["bytesReceived"] += len(body)
+                request.record(response)
+                if response.status == 200:
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    if etag or last_modified:
+                        self._validators[cache_key] = (etag, last_modified, len(body))
+                    else:
+                        self._validators.pop(cache_key, None)
+                return FetchResult(response.status, body, response.headers)
+
+    async def preconnect(self, url: str):
+        """Open a kept-alive connection to the store of ``url`` ahead of a burst of polls.
+
+        Sends a ``HEAD`` for the store's front page, which costs the store one
+        cheap request and leaves a warm TCP/TLS connection in the pool. Skipped
+        when the store was preconnected within the keep-alive timeout or is
+        throttled or failing; errors are only logged.
+        """
+        store = store_of(url)
+        now = time.monotonic()
+        if now - self._preconnected.get(store, float("-inf")) < self.keepalive_timeout:
+            return
+        if rate_limiter.throttled_for(store) > 0 or not circuit_breakers.is_closed(store):
+            return
+        self._preconnected[store] = now
+        await rate_limiter.acquire(store)
+        try:
+            async with self.get_session().head(f"https://{store}/", allow_redirects=False):
+                self.stats["preconnects"] += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Could not preconnect to {store}: {e}")
+
+    def forget(self, url: str):
+        """Drop stored validators for a URL."""
+        self._validators.pop(url, None)
+
+    def get_stats(self) -> Dict:
+        """Return conditional request counters for the dashboard."""
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "cacheHitRate": round(self.stats["notModified"] / requests * 100, 1) if requests else 0.0
+        }
+
+    async def close(self):
+        """Close the shared session and connection pool."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        self._session = None
+        self._connector = None
+        self._preconnected.clear()
+        logger.info("Closed shared HTTP connection pool")
+
+
+# Shared bot-wide registry
+session_registry = SessionRegistry()
@@ -0,0 +1,474 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import discord
+from utils.event_bus import BLOCK, NOTIFY_TOPIC, event_bus
+from utils.rate_limiter import TokenBucket
+from utils.user_resolver import user_resolver
+
+logger = logging.getLogger(__name__)
+
+
+# Priority lanes, most urgent first
+URGENT = 0  # restocks and checkout results
+NORMAL = 1  # price alerts, sell-outs, failures
+INFO = 2  # confirmations and checkout progress
+LANE_NAMES = ("urgent", "normal", "info")
+
+# Discord rejects messages longer than this
+MAX_CONTENT = 2000
+
+
+class Notification:
+    __slots__ = ("user_id", "content", "embed", "priority", "enqueued_at", "merged")
+
+    def __init__(self, user_id: int, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                 priority: int = NORMAL):
+        """A direct message waiting to be sent.
+
+        Args:
+            user_id: Discord user id of the recipient
+            content: Message text
+            embed: Message embed
+            priority: ``URGENT``, ``NORMAL`` or ``INFO``
+        """
+        self.user_id = int(user_id)
+        self.content = content
+        self.embed = embed
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.merged = 1
+
+    def merge(self, other: "Notification") -> bool:
+        """Append another text message for the same user, if both are plain text and fit."""
+        if self.embed is not None or other.embed is not None or not self.content or not other.content:
+            return False
+        if len(self.content) + len(other.content) + 1 > MAX_CONTENT:
+            return False
+        self.content = f"{self.content}\n{other.content}"
+        self.merged += other.merged
+        return True
+
+
+class Notifier:
+    def __init__(self, concurrency: int = 4, maxsize: int = 1000, lane_sizes: Tuple[int, ...] = (0, 500, 200),
+                 route_rate: float = 1.0, route_burst: float = 5, global_rate: float = 40,
+                 wait_samples: int = 1000):
+        """Prioritised outbound queue that delivers ``Notification``s as Discord DMs.
+
+        Monitors, alerts and checkout tasks publish notifications on the event
+        bus and carry on. The notifier sorts them into priority lanes and
+        ``concurrency`` senders always take the most urgent message whose route
+        (the recipient's DM channel) may be used, so restocks overtake queued
+        confirmations. Routes are paced with token buckets sized to Discord's
+        per-channel and global limits; when Discord still answers with a long
+        rate limit the route is parked for the ``retry_after`` it returned.
+        Each lane is a queue of messages ready to go. A message whose route is
+        not free is parked with the route's other waiting messages, and the
+        route waits in a heap keyed by the time it frees up, so taking the
+        next message never rescans the ones that are waiting.
+
+        While a text message waits in the ``NORMAL`` or ``INFO`` lane, further
+        text for the same user is appended to it instead of becoming another
+        call, and a full ``INFO`` or ``NORMAL`` lane drops its oldest message.
+
+        Args:
+            concurrency: Number of DMs sent at the same time
+            maxsize: Capacity of the bus queue feeding the lanes
+            lane_sizes: Capacity of each lane, 0 for unbounded
+            route_rate: Sustained DMs per second to one user
+            route_burst: DMs one user can receive in a burst
+            global_rate: DMs per second across all users
+            wait_samples: Number of recent time-in-queue samples kept per lane
+        """
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.lane_sizes = lane_sizes
+        self.route_rate = route_rate
+        self.route_burst = route_burst
+        self.bot = None
+        self._consumer = None
+        self._lanes: List[deque] = [deque() for _ in LANE_NAMES]
+        # user id -> heap of (lane, order, message) waiting for the user's route
+        self._waiting: Dict[int, List[Tuple[int, int, Notification]]] = {}
+        # (time the route frees up, order, user id) for every route with waiting messages
+        self._parked: List[Tuple[float, int, int]] = []
+        # (lane, order, user id) of the next waiting message of routes that came due
+        self._due: List[Tuple[int, int, int]] = []
+        self._parked_depth = [0] * len(LANE_NAMES)
+        self._order = itertools.count()
+        # (lane, user id) -> queued text message further text can be merged into
+        self._mergeable: Dict[Tuple[int, int], Notification] = {}
+        self._routes: Dict[int, TokenBucket] = {}
+        self._global = TokenBucket(global_rate, global_rate)
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._waits = [deque(maxlen=wait_samples) for _ in LANE_NAMES]
+        self.sent = 0
+        self.merged = 0
+        self.dropped = [0] * len(LANE_NAMES)
+        self.rate_limited = 0
+
+    def start(self, bot):
+        """Subscribe to the notification topic; needs the bot's running loop."""
+        self.bot = bot
+        user_resolver.bind(bot)
+        if self._consumer is None:
+            self._wake = asyncio.Event()
+            self._consumer = event_bus.subscribe(
+                NOTIFY_TOPIC, self._enqueue, name="discord-dm", maxsize=self.maxsize, policy=BLOCK
+            )
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def drain(self, timeout: float = 10):
+        """Wait until every queued DM has been sent, or ``timeout`` passes.
+
+        Returns:
+            bool: True if nothing was left unsent
+        """
+        deadline = time.monotonic() + timeout
+        while self._consumer is not None and time.monotonic() < deadline:
+            pending = self._consumer.get_stats()["depth"] + self._depth() + self._in_flight
+            if not pending:
+                return True
+            await asyncio.sleep(0.05)
+        left = self._depth()
+        if left:
+            logger.warning(f"Shutting down with {left} DMs unsent")
+        return not left
+
+    async def stop(self):
+        if self._consumer is not None:
+            await event_bus.unsubscribe(self._consumer)
+            self._consumer = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _enqueue(self, notification: Notification):
+        lane = notification.priority = min(max(notification.priority, URGENT), INFO)
+        if lane != URGENT:
+            pending = self._mergeable.get((lane, notification.user_id))
+            if pending is not None and pending.merge(notification):
+                self.merged += 1
+                return
+        queue = self._lanes[lane]
+        limit = self.lane_sizes[lane]
+        if limit and len(queue) + self._parked_depth[lane] >= limit:
+            self.dropped[lane] += 1
+            if not queue:
+                # Everything queued is older and waiting on its route; the newcomer goes
+                return
+            oldest = queue.popleft()
+            self._forget(lane, oldest)
+        queue.append(notification)
+        if lane != URGENT and notification.embed is None:
+            self._mergeable[(lane, notification.user_id)] = notification
+        self._wake.set()
+
+    def _forget(self, lane: int, notification: Notification):
+        if self._mergeable.get((lane, notification.user_id)) is notification:
+            del self._mergeable[(lane, notification.user_id)]
+
+    def _route(self, user_id: int) -> TokenBucket:
+        bucket = self._routes.get(user_id)
+        if bucket is None:
+            bucket = self._routes[user_id] = TokenBucket(self.route_rate, self.route_burst)
+        return bucket
+
+    def _depth(self) -> int:
+        return sum(map(len, self._lanes)) + sum(self._parked_depth)
+
+    def _route_wait(self, bucket: TokenBucket, now: float) -> float:
+        """Refill a route's bucket and return how long until it may send."""
+        # A route created during this call was stamped after ``now``
+        elapsed = max(0.0, now - bucket.updated)
+        bucket.tokens = min(bucket.capacity, bucket.tokens + elapsed * bucket.rate)
+        bucket.updated = max(bucket.updated, now)
+        return max(bucket.blocked_until - now, (1 - bucket.tokens) / bucket.rate, 0.0)
+
+    def _park(self, notification: Notification, until: float, first: bool = False):
+        """Hold a message until its route frees up at ``until``.
+
+        A route that already has waiting messages keeps its place in the heap;
+        ``first`` puts the message ahead of the route's other waiting messages
+        of its lane, for a send Discord turned away.
+        """
+        order = next(self._order)
+        entry = (notification.priority, -order if first else order, notification)
+        waiting = self._waiting.get(notification.user_id)
+        if waiting is None:
+            self._waiting[notification.user_id] = [entry]
+            heapq.heappush(self._parked, (until, order, notification.user_id))
+        else:
+            heapq.heappush(waiting, entry)
+        self._parked_depth[notification.priority] += 1
+
+    def _take(self) -> Tuple[Optional[Notification], Optional[float]]:
+        """Pop the most urgent message whose route is free.
+
+        Lanes are popped from the front and a message whose route is paced or
+        rate limited is parked, so each message is looked at once per wait.
+        Routes that came due compete with the lanes by their most urgent
+        waiting message, and win ties since that message arrived first.
+
+        Returns:
+            tuple: The message, or None and how long until a route frees up
+        """
+        now = time.monotonic()
+        while self._parked and self._parked[0][0] <= now:
+            _, _, user_id = heapq.heappop(self._parked)
+            lane, order, _ = self._waiting[user_id][0]
+            heapq.heappush(self._due, (lane, order, user_id))
+
+        while True:
+            lane = next((lane for lane, queue in enumerate(self._lanes) if queue), None)
+            if self._due and (lane is None or self._due[0][0] <= lane):
+                _, _, user_id = heapq.heappop(self._due)
+                bucket = self._route(user_id)
+                wait = self._route_wait(bucket, now)
+                if wait > 0:
+                    heapq.heappush(self._parked, (now + wait, next(self._order), user_id))
+                    continue
+                bucket.tokens -= 1
+                waiting = self._waiting[user_id]
+                _, _, notification = heapq.heappop(waiting)
+                self._parked_depth[notification.priority] -= 1
+                if waiting:
+                    heapq.heappush(self._parked, (now + self._route_wait(bucket, now), next(self._order), user_id))
+                else:
+                    del self._waiting[user_id]
+            elif lane is not None:
+                notification = self._lanes[lane].popleft()
+                if notification.user_id in self._waiting:
+                    # Queue behind the user's waiting messages; their route is already scheduled
+                    self._park(notification, now)
+                    continue
+                bucket = self._route(notification.user_id)
+                wait = self._route_wait(bucket, now)
+                if wait > 0:
+                    self._park(notification, now + wait)
+                    continue
+                bucket.tokens -= 1
+            else:
+                return None, (self._parked[0][0] - now if self._parked else None)
+            self._forget(notification.priority, notification)
+            return notification, 0.0
+
+    async def _run(self):
+        while True:
+            notification, wait = self._take()
+            if notification is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.reserve(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._waits[notification.priority].append(time.monotonic() - notification.enqueued_at)
+            self._in_flight += 1
+            try:
+                await self._send(notification)
+            finally:
+                self._in_flight -= 1
+
+    async def _send(self, notification: Notification):
+        try:
+            channel = await user_resolver.get_dm_channel(notification.user_id)
+            await channel.send(content=notification.content, embed=notification.embed)
+            self.sent += 1
+        except discord.errors.RateLimited as e:
+            # Discord asked for a longer pause than the client sleeps through; park the route
+            self.rate_limited += 1
+            bucket = self._route(notification.user_id)
+            bucket.blocked_until = time.monotonic() + e.retry_after
+            self._park(notification, bucket.blocked_until, first=True)
+            self._wake.set()
+        except discord.errors.NotFound:
+            user_resolver.invalidate(notification.user_id)
+            logger.warning(f"Could not find user with ID {notification.user_id}")
+        except discord.errors.Forbidden:
+            user_resolver.invalidate(notification.user_id)
+            logger.warning(f"Cannot send DM to user {notification.user_id}")
+        except Exception as e:
+            logger.error(f"Error sending DM to user {notification.user_id}: {e}")
+
+    def get_stats(self) -> Dict:
+        """Return queue depth, drops and time-in-queue per lane."""
+        lanes = {}
+        for lane, name in enumerate(LANE_NAMES):
+            samples = sorted(self._waits[lane]) or [0.0]
+            lanes[name] = {
+                "depth": len(self._lanes[lane]) + self._parked_depth[lane],
+                "dropped": self.dropped[lane],
+                "waitAvgMs": round(sum(samples) / len(samples) * 1000, 1),
+                "waitP95Ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1)
+            }
+        return {
+            "sent": self.sent,
+            "merged": self.merged,
+            "rateLimited": self.rate_limited,
+            "lanes": lanes
+        }
+
+
+async def notify(user_id: int, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                 priority: int = NORMAL):
+    """Queue a DM to a user without waiting for Discord.
+
+    Args:
+        user_id: Discord user id of the recipient
+        content: Message text
+        embed: Message embed
+        priority: ``URGENT``, ``NORMAL`` or ``INFO``
+    """
+    if not event_bus.has_consumers(NOTIFY_TOPIC):
+        logger.warning(f"No notifier running, dropping DM to user {user_id}")
+        return
+    await event_bus.publish(NOTIFY_TOPIC, Notification(user_id, content, embed, priority))
+
+
+class _RestockBatch:
+    __slots__ = ("product_title", "product_url", "variants", "first_at", "timer")
+
+    def __init__(self, product_title: str, product_url: str):
+        self.product_title = product_title
+        self.product_url = product_url
+        # variant id -> variant title, in the order the restocks were seen
+        self.variants: Dict[int, str] = {}
+        self.first_at = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class RestockCoalescer:
+    # Variants listed in one embed before the rest are summarised
+    MAX_LISTED = 25
+
+    def __init__(self, window: float = 2.0, max_delay: float = 5.0):
+        """Merges a product's variant restocks into one DM per user.
+
+        A batch is opened by a user's first restock of a product and sent once
+        no further variant of that product has restocked for ``window``
+        seconds, and never later than ``max_delay`` seconds after it opened,
+        so a drop of twelve sizes costs one Discord call instead of twelve.
+
+        Args:
+            window: Quiet period that closes a batch, in seconds
+            max_delay: Longest a restock waits for its batch to be sent, in seconds
+        """
+        self.window = window
+        self.max_delay = max_delay
+        self._batches: Dict[Tuple[int, str], _RestockBatch] = {}
+        self._sending = set()
+        self.restocks = 0
+        self.discarded = 0
+        self.sent = 0
+
+    def add(self, user_id: int, key: str, product_title: str, product_url: str,
+            variant_id: int, variant_title: str):
+        """Add a restocked variant to the user's pending batch for the product.
+
+        Args:
+            user_id: Discord user id of the recipient
+            key: Canonical product URL
+            product_title: Product title shown in the embed
+            product_url: Link shown in the embed
+            variant_id: Restocked variant id
+            variant_title: Restocked variant title
+        """
+        self.restocks += 1
+        batch_key = (user_id, key)
+        batch = self._batches.get(batch_key)
+        if batch is None:
+            batch = self._batches[batch_key] = _RestockBatch(product_title, product_url)
+        batch.variants[variant_id] = variant_title
+
+        if batch.timer is not None:
+            batch.timer.cancel()
+        now = time.monotonic()
+        delay = max(0.0, min(now + self.window, batch.first_at + self.max_delay) - now)
+        batch.timer = asyncio.get_running_loop().call_later(delay, self._send_later, batch_key)
+
+    def discard(self, user_id: int, key: str, variant_id: int) -> bool:
+        """Drop a variant that sold out again before its batch was sent.
+
+        Returns:
+            bool: True if the variant was still pending
+        """
+        batch = self._batches.get((user_id, key))
+        if batch is None or batch.variants.pop(variant_id, None) is None:
+            return False
+        self.discarded += 1
+        if not batch.variants:
+            batch.timer.cancel()
+            del self._batches[(user_id, key)]
+        return True
+
+    def _send_later(self, batch_key: Tuple[int, str]):
+        task = asyncio.get_running_loop().create_task(self.flush(*batch_key))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def flush(self, user_id: int, key: str):
+        """Send the user's pending batch for a product now, if there is one."""
+        batch = self._batches.pop((user_id, key), None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self.sent += 1
+        await notify(user_id, embed=self._build_embed(batch), priority=URGENT)
+
+    async def flush_all(self):
+        """Send every pending batch, e.g. before shutting down."""
+        for batch_key in list(self._batches):
+            await self.flush(*batch_key)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def _build_embed(self, batch: _RestockBatch) -> discord.Embed:
+        titles: List[str] = list(batch.variants.values())
+        lines = [f"• {title}" for title in titles[:self.MAX_LISTED]]
+        if len(titles) > self.MAX_LISTED:
+            lines.append(f"…and {len(titles) - self.MAX_LISTED} more")
+        label = "Variant" if len(titles) == 1 else f"Variants ({len(titles)})"
+        embed = discord.Embed(
+            title="🚨 Product In Stock!",
+            description=f"**{batch.product_title}**\n{label}:\n" + "\n".join(lines),
+            color=discord.Color.green(),
+            url=batch.product_url
+        )
+        embed.add_field(name="Status", value="In Stock!", inline=True)
+        embed.add_field(name="Action", value="Use `/add_task` to checkout", inline=True)
+        embed.set_footer(text=f"Monitored by Shopify Bot | {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        return embed
+
+    def get_stats(self) -> Dict:
+        """Return how many restocks were merged into how many DMs."""
+        return {
+            "window": self.window,
+            "maxDelay": self.max_delay,
+            "pending": len(self._batches),
+            "restocks": self.restocks,
+            "discarded": self.discarded,
+            "sent": self.sent,
+            "saved": self.restocks - self.discarded - self.sent - sum(len(b.variants) for b in self._batches.values())
+        }
+
+
+# Shared bot-wide notifier
+notifier = Notifier()
+
+# Shared restock batching, configured by the bot from the environment
+restock_coalescer = RestockCoalescer()
@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# A job returns the delay until its next run, or None when it is finished
+JobCallback = Callable[[], Awaitable[Optional[float]]]
+
+
+class ScheduledJob:
+    __slots__ = ("key", "callback", "due", "generation", "running", "cancelled", "wake_at")
+
+    def __init__(self, key: str, callback: JobCallback):
+        self.key = key
+        self.callback = callback
+        self.due = 0.0
+        self.generation = 0
+        self.running = False
+        self.cancelled = False
+        # Earliest next run requested while the job was running
+        self.wake_at: Optional[float] = None
+
+
+class PollScheduler:
+    def __init__(self, workers: int = 32, start_jitter: float = 1.0, error_delay: float = 30,
+                 lateness_samples: int = 1000):
+        """Single scheduler that owns every polling job on the event loop.
+
+        Jobs sit in a heap ordered by due time. One dispatcher coroutine sleeps
+        until the earliest job is due and hands due jobs to a fixed pool of worker
+        coroutines, so thousands of jobs cost one timer and ``workers`` coroutines
+        instead of one sleeping coroutine each.
+
+        Args:
+            workers: Number of jobs that may run concurrently
+            start_jitter: Upper bound of the random delay added to a job's first
+                run so jobs created together do not fire in lockstep
+            error_delay: Seconds before a job that raised is run again
+            lateness_samples: Number of recent lateness samples kept for stats
+        """
+        self.workers = workers
+        self.start_jitter = start_jitter
+        self.error_delay = error_delay
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lateness = deque(maxlen=lateness_samples)
+        self.runs = 0
+        self.max_lateness = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._heap = []
+        self._jobs = {}
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks = [loop.create_task(self._dispatch())]
+        self._tasks += [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def schedule(self, key: str, callback: JobCallback, delay: float = 0,
+                 jitter: Optional[float] = None) -> ScheduledJob:
+        """Add a job, replacing any job with the same key.
+
+        Args:
+            key: Unique job key
+            callback: Coroutine function run when the job is due
+            delay: Seconds before the first run
+            jitter: Maximum random delay added to the first run, defaults to ``start_jitter``
+
+        Returns:
+            ScheduledJob: The scheduled job
+        """
+        self._ensure_started()
+        self.cancel(key)
+        job = ScheduledJob(key, callback)
+        self._jobs[key] = job
+        jitter = self.start_jitter if jitter is None else jitter
+        self._push(job, time.monotonic() + delay + random.uniform(0, jitter))
+        return job
+
+    def reschedule(self, key: str, delay: float = 0):
+        """Bring a job's next run forward to at most ``delay`` seconds from now."""
+        job = self._jobs.get(key)
+        if job is None:
+            return
+        due = time.monotonic() + delay
+        if job.running:
+            job.wake_at = due if job.wake_at is None else min(job.wake_at, due)
+        elif due < job.due:
+            self._push(job, due)
+
+    def cancel(self, key: str):
+        """Remove a job; a run already in progress is allowed to finish."""
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            job.cancelled = True
+
+    def _push(self, job: ScheduledJob, due: float):
+        job.due = due
+        job.generation += 1
+        heapq.heappush(self._heap, (due, next(self._seq), job.generation, job))
+        if self._heap[0][3] is job:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, generation, job = heapq.heappop(self._heap)
+                # Skip cancelled jobs and entries superseded by a reschedule
+                if job.cancelled or generation != job.generation:
+                    continue
+                job.running = True
+                self._queue.put_nowait(job)
+
+            delay = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            lateness = time.monotonic() - job.due
+            self._lateness.append(lateness)
+            self.max_lateness = max(self.max_lateness, lateness)
+            self.runs += 1
+
+            try:
+                delay = await job.callback()
+            except Exception as e:
+                logger.error(f"Error in scheduled job {job.key}: {e}")
+                delay = self.error_delay
+            finally:
+                job.running = False
+
+            if job.cancelled or delay is None:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                continue
+
+            due = time.monotonic() + delay
+            if job.wake_at is not None:
+                due = min(due, job.wake_at)
+                job.wake_at = None
+            self._push(job, due)
+
+    def get_stats(self) -> Dict:
+        """Return scheduler statistics, with lateness in milliseconds."""
+        samples = sorted(self._lateness) or [0.0]
+        return {
+            "jobs": len(self._jobs),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "runs": self.runs,
+            "latenessAvgMs": round(sum(samples) / len(samples) * 1000, 1),
+            "latenessP95Ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+            "latenessMaxMs": round(self.max_lateness * 1000, 1)
+        }
+
+    async def close(self):
+        """Cancel every job and stop the dispatcher and workers."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._jobs = {}
+        self._heap = []
+        self._loop = None
+
+
+# Shared bot-wide scheduler
+poll_scheduler = PollScheduler()
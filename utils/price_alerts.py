@@ -0,0 +1,216 @@
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.event_bus import BLOCK, PRICE_TOPIC, STOCK_TOPIC, KeyRouter
+from utils.product_feed import FeedSubscription, canonical_product_url, product_feed
+from utils.variant_events import PRICE_CHANGED, STOCK_CHANGED, VARIANT_ADDED, ProductUpdate, VariantEvent
+from utils.variant_state import VariantState
+
+logger = logging.getLogger(__name__)
+
+
+class PriceAlert:
+    __slots__ = ("alert_id", "user_id", "product_url", "key", "variant_id", "target_cents")
+
+    def __init__(self, alert_id: str, user_id: str, product_url: str, target_cents: int,
+                 variant_id: Optional[int] = None):
+        """A request to be told when a product drops to a price.
+
+        Args:
+            alert_id: Unique alert id
+            user_id: Discord user id of the owner
+            product_url: URL the alert was created with
+            target_cents: Fire once the price is at or below this many cents
+            variant_id: Variant to watch; None watches the product's first variant
+        """
+        self.alert_id = alert_id
+        self.user_id = user_id
+        self.product_url = product_url
+        self.key = canonical_product_url(product_url)
+        self.variant_id = variant_id
+        self.target_cents = target_cents
+
+
+class _ThresholdBook:
+    __slots__ = ("targets", "alerts")
+
+    def __init__(self):
+        # Parallel lists sorted by target price
+        self.targets: List[int] = []
+        self.alerts: List[PriceAlert] = []
+
+    def add(self, alert: PriceAlert):
+        index = bisect_left(self.targets, alert.target_cents)
+        self.targets.insert(index, alert.target_cents)
+        self.alerts.insert(index, alert)
+
+    def remove(self, alert: PriceAlert):
+        index = bisect_left(self.targets, alert.target_cents)
+        while index < len(self.alerts) and self.targets[index] == alert.target_cents:
+            if self.alerts[index] is alert:
+                del self.targets[index]
+                del self.alerts[index]
+                return
+            index += 1
+
+    def pop_reached(self, price_cents: int) -> List[PriceAlert]:
+        """Remove and return every alert whose target is at or above the price."""
+        index = bisect_left(self.targets, price_cents)
+        reached = self.alerts[index:]
+        del self.targets[index:]
+        del self.alerts[index:]
+        return reached
+
+
+AlertCallback = Callable[[PriceAlert, int], Awaitable[None]]
+
+
+class PriceAlertIndex:
+    def __init__(self, on_fire: AlertCallback, interval: float = 60, min_interval: float = 15,
+                 max_interval: float = 300):
+        """Price alerts indexed per product and variant by target price.
+
+        All alerts on a product share one product feed subscription, which
+        keeps it polled and delivers its first snapshot; price changes and
+        added or removed variants arrive as events from the event bus. Each
+        variant has a book of alerts sorted by target, so a price update fires
+        every alert at or above the new price with one bisect, O(log n + k),
+        no matter how many alerts are waiting. Prices are integer cents.
+
+        Args:
+            on_fire: Coroutine called with the alert and the price (cents) that reached it
+            interval: Polling interval requested from the feed, in seconds
+            min_interval: Fastest polling interval requested from the feed
+            max_interval: Slowest polling interval requested from the feed
+        """
+        self.on_fire = on_fire
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._alerts: Dict[str, PriceAlert] = {}
+        # product key -> variant id (None for the first variant) -> book
+        self._books: Dict[str, Dict[Optional[int], _ThresholdBook]] = {}
+        self._subscriptions: Dict[str, FeedSubscription] = {}
+        # product key -> id of the variant listed first, which alerts without a variant follow
+        self._first_variants: Dict[str, Optional[int]] = {}
+        # Price and variant events of the products with alerts; a missed one could be a missed alert
+        self._events = KeyRouter((PRICE_TOPIC, STOCK_TOPIC), "price-alerts",
+                                 route=lambda event: event.key, policy=BLOCK)
+
+    def add(self, alert: PriceAlert):
+        """Start watching an alert; the product is subscribed on its first alert."""
+        self.remove(alert.alert_id)
+        self._alerts[alert.alert_id] = alert
+        books = self._books.setdefault(alert.key, {})
+        books.setdefault(alert.variant_id, _ThresholdBook()).add(alert)
+
+        if alert.key in self._subscriptions:
+            # Evaluate the new alert against the price already known
+            state = product_feed.get_state(alert.key)
+            fired = self._evaluate(alert.key, alert.variant_id, state) if state else []
+            if fired:
+                asyncio.get_running_loop().create_task(self._fire(fired))
+        else:
+            self._events.add(alert.key, self._on_event)
+            self._subscriptions[alert.key] = product_feed.subscribe(
+                alert.product_url, self._on_update, self.interval,
+                min_interval=self.min_interval, max_interval=self.max_interval
+            )
+
+    def remove(self, alert_id: str) -> Optional[PriceAlert]:
+        """Stop watching an alert; the product is unsubscribed with its last alert."""
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        books = self._books.get(alert.key, {})
+        book = books.get(alert.variant_id)
+        if book is not None:
+            book.remove(alert)
+            if not book.alerts:
+                del books[alert.variant_id]
+        self._release(alert.key)
+        return alert
+
+    def _release(self, key: str):
+        if self._books.get(key):
+            return
+        self._books.pop(key, None)
+        self._first_variants.pop(key, None)
+        subscription = self._subscriptions.pop(key, None)
+        if subscription is not None:
+            self._events.remove(key, self._on_event)
+            product_feed.unsubscribe(subscription)
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    async def _on_update(self, update: ProductUpdate):
+        """Product feed callback; evaluates the first snapshot and changes of the first variant."""
+        state = update.state
+        if not state:
+            return
+        first = state.ids[0] if state.ids else None
+        previous_first = self._first_variants.get(update.key)
+        self._first_variants[update.key] = first
+        if update.initial:
+            variants = list(self._books.get(update.key, {}))
+        elif first != previous_first:
+            # Alerts without a variant follow whichever variant is listed first, which
+            # changes without a price event when the variants are only reordered
+            variants = [None]
+        else:
+            return
+        fired = []
+        for variant_id in variants:
+            fired += self._evaluate(update.key, variant_id, state)
+        await self._fire(fired)
+
+    async def _on_event(self, event: VariantEvent):
+        """Event bus handler; evaluates the alerts a price or variant change may have reached."""
+        if event.kind == STOCK_CHANGED:
+            return
+        state = product_feed.get_state(event.key)
+        if not state:
+            return
+        # An added, removed or repriced variant may also be the one listed first
+        variants = [None]
+        if event.kind in (PRICE_CHANGED, VARIANT_ADDED):
+            variants.append(event.variant_id)
+        fired = []
+        for variant_id in variants:
+            fired += self._evaluate(event.key, variant_id, state)
+        await self._fire(fired)
+
+    def _evaluate(self, key: str, variant_id: Optional[int], state: VariantState) -> List[Tuple[PriceAlert, int]]:
+        """Pop the alerts of one variant reached by its current price."""
+        books = self._books.get(key)
+        book = books.get(variant_id) if books else None
+        if book is None:
+            return []
+        position = 0 if variant_id is None else state.index_of(variant_id)
+        if position is None or position >= len(state):
+            return []
+
+        price = state.prices[position]
+        fired = [(alert, price) for alert in book.pop_reached(price)]
+        if fired:
+            for alert, _ in fired:
+                del self._alerts[alert.alert_id]
+            if not book.alerts:
+                del books[variant_id]
+            self._release(key)
+            if len(fired) > 1:
+                logger.info(f"Price update on {key} fired {len(fired)} alerts")
+        return fired
+
+    async def _fire(self, fired: List[Tuple[PriceAlert, int]]):
+        if not fired:
+            return
+        results = await asyncio.gather(
+            *(self.on_fire(alert, price) for alert, price in fired),
+            return_exceptions=True
+        )
+        for (alert, _), result in zip(fired, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error delivering price alert {alert.alert_id}: {result}")
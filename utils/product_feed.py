@@ -0,0 +1,637 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from utils.adaptive_interval import AdaptiveInterval
+from utils.circuit_breaker import CircuitOpenError, circuit_breakers
+from utils.event_bus import PRICE_TOPIC, STOCK_TOPIC, event_bus
+from utils.http_client import session_registry
+from utils.poll_scheduler import PollScheduler, poll_scheduler
+from utils.rate_limiter import rate_limiter, store_of
+from utils.variant_events import PRICE_CHANGED, ProductUpdate, VariantEvent
+from utils.variant_state import VariantState
+from utils.variant_tracker import VariantTracker
+
+logger = logging.getLogger(__name__)
+
+ProductCallback = Callable[[ProductUpdate], Awaitable[None]]
+
+# Shopify caps /products.json pages at 250 products
+PRODUCTS_PAGE_LIMIT = 250
+
+
+def canonical_product_url(product_url: str) -> str:
+    """Normalise a Shopify product URL so every variant of it maps to one key.
+
+    Collection prefixes, query strings, fragments, trailing slashes and a
+    trailing ``.json``/``.js`` are dropped and the host is lower-cased, so
+    ``https://Shop.com/collections/x/products/foo?variant=1`` and
+    ``https://shop.com/products/foo.json`` share the same feed.
+
+    Args:
+        product_url: Any URL pointing at a Shopify product
+
+    Returns:
+        str: ``https://<host>/products/<handle>`` or the cleaned URL if no handle is found
+    """
+    parts = urlsplit(product_url.strip())
+    host = parts.netloc.lower()
+    path = parts.path.rstrip("/")
+    for suffix in (".json", ".js"):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+
+    marker = "/products/"
+    index = path.find(marker)
+    if index != -1:
+        handle = path[index + len(marker):].split("/")[0]
+        path = f"{marker}{handle}"
+
+    return f"{parts.scheme or 'https'}://{host}{path}"
+
+
+async def publish_events(events: List[VariantEvent]):
+    """Put variant events on the event bus: price changes on ``PRICE_TOPIC``, the rest on ``STOCK_TOPIC``."""
+    for event in events:
+        await event_bus.publish(PRICE_TOPIC if event.kind == PRICE_CHANGED else STOCK_TOPIC, event)
+
+
+def _split_key(key: str):
+    """Split a canonical product URL into ``(store base URL, handle)``."""
+    base, _, handle = key.rpartition("/products/")
+    return base, handle
+
+
+class FeedSubscription:
+    def __init__(self, key: str, callback: Optional[ProductCallback], interval: float,
+                 min_interval: float, max_interval: float):
+        """A single subscriber's interest in a product feed.
+
+        Args:
+            key: Canonical product URL
+            callback: Coroutine called with a ``ProductUpdate`` whenever variants change,
+                None for subscribers that take the variant events from the event bus
+            interval: Polling interval the subscriber asked for, in seconds
+            min_interval: Fastest the subscriber wants the product polled
+            max_interval: Slowest the subscriber tolerates the product being polled
+        """
+        self.key = key
+        self.callback = callback
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.active = True
+        # Set once the subscriber has received a first snapshot
+        self.primed = False
+        # Id of the mirrored subscription when polling runs in worker processes
+        self.remote_id: Optional[int] = None
+
+
+class _StorePoller:
+    def __init__(self, feed: "ProductFeed", store: str):
+        """Polls every subscribed product of a single store.
+
+        When enough products on the store are due at once they are refreshed
+        with a walk over the store's paginated ``/products.json`` instead of one
+        ``<product>.json`` request each. The poller is a single job on the
+        feed's scheduler rather than a coroutine of its own.
+        """
+        self.feed = feed
+        self.store = store
+        self.products: Dict[str, List[FeedSubscription]] = {}
+        self.next_due: Dict[str, float] = {}
+        self.intervals: Dict[str, AdaptiveInterval] = {}
+
+    def add(self, subscription: FeedSubscription):
+        self.products.setdefault(subscription.key, []).append(subscription)
+        self.next_due.setdefault(subscription.key, 0)
+        self._configure_interval(subscription.key)
+
+    def _configure_interval(self, key: str):
+        # The most demanding subscriber sets every bound
+        subscriptions = self.products[key]
+        base = min(sub.interval for sub in subscriptions)
+        floor = min(sub.min_interval for sub in subscriptions)
+        ceiling = min(sub.max_interval for sub in subscriptions)
+        controller = self.intervals.get(key)
+        if controller is None:
+            self.intervals[key] = AdaptiveInterval(base, floor, ceiling, hot_window=self.feed.hot_window)
+        else:
+            controller.configure(base, floor, ceiling)
+
+    def remove(self, subscription: FeedSubscription):
+        subscriptions = self.products.get(subscription.key)
+        if subscriptions and subscription in subscriptions:
+            subscriptions.remove(subscription)
+            if not subscriptions:
+                del self.products[subscription.key]
+                del self.next_due[subscription.key]
+                del self.intervals[subscription.key]
+                self.feed._forget(subscription.key)
+            else:
+                self._configure_interval(subscription.key)
+
+    def interval_for(self, key: str) -> float:
+        return self.intervals[key].current
+
+    def boost(self, key: str, duration: float):
+        """Poll a product at its floor interval for ``duration`` seconds."""
+        controller = self.intervals[key]
+        controller.boost(duration)
+        self.next_due[key] = min(self.next_due[key], time.monotonic() + controller.floor)
+        self.feed.scheduler.reschedule(self.store, controller.floor)
+
+    def relax(self, key: str, duration: float):
+        """Poll a product at its ceiling interval for ``duration`` seconds unless it changes."""
+        self.intervals[key].relax(duration)
+
+    async def run_once(self) -> Optional[float]:
+        """Poll due products of the store and fan the results out.
+
+        Returns:
+            Optional[float]: Seconds until the next product is due, or None once
+            the store has no subscribers left
+        """
+        if not self.products:
+            return None
+
+        # Don't spend a worker waiting out a store's Retry-After or a tripped breaker
+        host = store_of(self.store)
+        paused = max(rate_limiter.throttled_for(host), circuit_breakers.retry_in(host))
+        if paused > 0:
+            return paused
+
+        now = time.monotonic()
+        due = [key for key, at in self.next_due.items() if at <= now]
+        if due and not circuit_breakers.is_closed(host):
+            # Recovering store: a single product is polled as the probe
+            due = due[:1]
+        if due:
+            await self._poll(due)
+            finished = time.monotonic()
+            for key in due:
+                if key in self.products:
+                    self.next_due[key] = finished + self.interval_for(key)
+
+        if not self.products:
+            return None
+        return max(0, min(self.next_due.values()) - time.monotonic())
+
+    async def _poll(self, due: List[str]):
+        found = {}
+        if len(due) >= self.feed.bulk_threshold:
+            found = await self.feed.fetch_store(self.store, set(due))
+
+        missing = [key for key in due if key not in found]
+        if missing:
+            results = await asyncio.gather(*(self.feed._fetch_shared(key) for key in missing))
+            found.update((key, result) for key, result in zip(missing, results) if result[0] is not None)
+
+        for key in found:
+            if key in self.intervals:
+                # Only this product's own variant events count as activity, not a new page or body
+                self.intervals[key].record(bool(self.feed._pending_events.get(key)))
+
+        await asyncio.gather(*(
+            self._dispatch(key, product, changed) for key, (product, changed) in found.items()
+        ))
+
+    async def _dispatch(self, key: str, product: Dict, changed: bool):
+        # Changes are computed once per product; subscribers only get called for
+        # variant events, or when they are still waiting for a first snapshot
+        events = self.feed._pending_events.pop(key, None)
+        if events:
+            await publish_events(events)
+        # An empty list means the variants were only reordered, which subscribers
+        # following the first variant still need to hear about
+        subscriptions = [
+            sub for sub in self.products.get(key, [])
+            if sub.active and (events is not None or not sub.primed)
+        ]
+        events = events or []
+        if not subscriptions:
+            return
+        state = self.feed.variants.get_state(key)
+        update = ProductUpdate(key, product, state, events)
+        initial = ProductUpdate(key, product, state, events, initial=True)
+        calls = []
+        for sub in subscriptions:
+            if sub.callback is not None:
+                calls.append(sub.callback(update if sub.primed else initial))
+            sub.primed = True
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error in product feed subscriber for {key}: {result}")
+
+
+class ProductFeed:
+    def __init__(self, default_interval: float = 10, bulk_threshold: int = 3, max_pages: int = 20,
+                 min_interval: float = 2, max_interval: float = 120, hot_window: float = 600,
+                 scheduler: Optional[PollScheduler] = None):
+        """Shared product polling layer.
+
+        Every monitor, price alert and checkout task watching the same product
+        subscribes here instead of polling on its own. Each product is fetched
+        once per interval (the shortest any subscriber asked for) and the parsed
+        JSON is handed to every subscriber. Products are grouped per store so a
+        store with many watched products is refreshed through ``/products.json``.
+        Requests are conditional. Every new body is diffed once against the last
+        variant snapshot and subscribers receive the resulting typed events, so
+        they are only called again when a variant was added, removed, repriced or
+        changed stock. Each product's interval adapts to how recently it
+        changed, between the subscribers' floor and ceiling.
+
+        Args:
+            default_interval: Interval used when a subscriber does not give one
+            bulk_threshold: Minimum number of due products on one store that
+                triggers a bulk ``/products.json`` walk
+            max_pages: Maximum number of ``/products.json`` pages walked per cycle
+            min_interval: Default floor for adaptive polling, in seconds
+            max_interval: Default ceiling for products that stay static
+            hot_window: Seconds after a change during which a product is polled at its floor
+            scheduler: Scheduler that runs the store pollers, defaults to the shared one
+        """
+        self.scheduler = scheduler or poll_scheduler
+        # Set by use_workers() to poll in worker processes instead of this loop
+        self.workers = None
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hot_window = hot_window
+        self.bulk_threshold = bulk_threshold
+        self.max_pages = max_pages
+        self._stores: Dict[str, _StorePoller] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._latest: Dict[str, Dict] = {}
+        self._fetched_at: Dict[str, float] = {}
+        # Which /products.json page each product was last seen on, and page sizes
+        self._page_of: Dict[str, int] = {}
+        self._page_sizes: Dict[Tuple[str, int], int] = {}
+        # Body fingerprints of the last decoded product / page responses
+        self._digests: Dict[str, int] = {}
+        self._page_digests: Dict[Tuple[str, int], int] = {}
+        # Variant snapshots and the events not yet delivered to subscribers
+        self.variants = VariantTracker()
+        self._pending_events: Dict[str, List[VariantEvent]] = {}
+        # Last known products from a checkpoint, applied when the product is subscribed again
+        self._seeds: Dict[str, Dict] = {}
+        self.fetch_count = 0
+        self.unchanged_bodies = 0
+        self.bulk_fetch_count = 0
+
+    def subscribe(self, product_url: str, callback: Optional[ProductCallback],
+                  interval: Optional[float] = None, min_interval: Optional[float] = None,
+                  max_interval: Optional[float] = None) -> FeedSubscription:
+        """Register a callback for a product and start polling it if needed.
+
+        Args:
+            product_url: URL of the product to watch
+            callback: Coroutine called with each ``ProductUpdate``, or None to only
+                keep the product polled for the events published on the event bus
+            interval: Desired polling interval in seconds
+            min_interval: Floor override for this subscriber
+            max_interval: Ceiling override for this subscriber
+
+        Returns:
+            FeedSubscription: Handle to pass to ``unsubscribe``
+        """
+        key = canonical_product_url(product_url)
+        store, _ = _split_key(key)
+        interval = interval or self.default_interval
+        subscription = FeedSubscription(
+            key, callback, interval,
+            min_interval or min(self.min_interval, interval),
+            max_interval or max(self.max_interval, interval)
+        )
+
+        seed = self._apply_seed(key)
+        if self.workers is not None:
+            self.workers.subscribe(subscription, seed)
+            return subscription
+
+        poller = self._stores.get(store)
+        if poller is None:
+            poller = _StorePoller(self, store)
+            self._stores[store] = poller
+            poller.add(subscription)
+            self.scheduler.schedule(store, poller.run_once)
+        else:
+            poller.add(subscription)
+            # New products are due straight away, with jitter against bursts
+            self.scheduler.reschedule(store, random.uniform(0, self.scheduler.start_jitter))
+
+        logger.info(f"Product feed {key} now has {len(poller.products[key])} subscriber(s)")
+        return subscription
+
+    def restore(self, products: Dict[str, Dict]):
+        """Seed the last known state of products, e.g. from a checkpoint.
+
+        A seeded product is the diff baseline once it is subscribed again, so
+        its first poll only reports what changed while the bot was down
+        instead of treating the whole product as new.
+
+        Args:
+            products: Canonical product URL -> product object
+        """
+        self._seeds.update(products)
+
+    def _apply_seed(self, key: str) -> Optional[Dict]:
+        seed = self._seeds.pop(key, None)
+        if seed is None or key in self._latest:
+            return None
+        self._latest[key] = seed
+        # Cached but stale: fetch_now never mistakes it for a fresh poll
+        self._fetched_at[key] = float("-inf")
+        self.variants.record(key, seed.get("variants", []))
+        return seed
+
+    def unsubscribe(self, subscription: FeedSubscription):
+        """Remove a subscription; a store stops polling once it has no subscribers."""
+        subscription.active = False
+        if self.workers is not None:
+            self.workers.unsubscribe(subscription)
+            return
+        store, _ = _split_key(subscription.key)
+        poller = self._stores.get(store)
+        if poller:
+            poller.remove(subscription)
+            if not poller.products:
+                self._cleanup(store)
+
+    def _cleanup(self, store: str):
+        poller = self._stores.get(store)
+        if poller is None or poller.products:
+            return
+        del self._stores[store]
+        self.scheduler.cancel(store)
+
+    def request_snapshot(self, subscription: FeedSubscription):
+        """Deliver the product to a subscriber on the next poll even if it is unchanged."""
+        subscription.primed = False
+        if self.workers is not None:
+            self.workers.request_snapshot(subscription)
+
+    def use_workers(self, pool):
+        """Hand polling to a ``FeedWorkerPool``; call before anything subscribes.
+
+        Subscribers keep the same API: updates are produced in the worker
+        processes and delivered on this loop.
+        """
+        self.workers = pool
+        pool.feed = self
+
+    def _store_remote(self, update: ProductUpdate):
+        """Cache a product update that arrived from a worker process."""
+        self._latest[update.key] = update.product
+        self._fetched_at[update.key] = time.monotonic()
+        if update.state is not None:
+            self.variants.variants_cache[update.key] = update.state
+
+    def _forget(self, key: str):
+        self._latest.pop(key, None)
+        self._fetched_at.pop(key, None)
+        self._page_of.pop(key, None)
+        self._digests.pop(key, None)
+        self._pending_events.pop(key, None)
+        self.variants.forget(key)
+        session_registry.forget(f"{key}.json")
+
+    def _is_subscribed(self, key: str) -> bool:
+        if self.workers is not None:
+            # The workers own the cache; fetch_now results are not kept here
+            return False
+        poller = self._stores.get(_split_key(key)[0])
+        return poller is not None and key in poller.products
+
+    def _remember(self, key: str, product: Dict, digest: Optional[int] = None):
+        if self._is_subscribed(key):
+            self._latest[key] = product
+            self._fetched_at[key] = time.monotonic()
+            if digest is not None:
+                self._digests[key] = digest
+            else:
+                # Fingerprint no longer describes the cached product
+                self._digests.pop(key, None)
+            previous = self.variants.get_state(key)
+            events = self.variants.record(key, product.get("variants", []))
+            if events:
+                self._pending_events.setdefault(key, []).extend(events)
+            elif previous is not None and previous.ids != self.variants.get_state(key).ids:
+                self._pending_events.setdefault(key, [])
+
+    def boost(self, product_url: str, duration: float, preconnect: bool = False):
+        """Poll a product at its fastest allowed rate for a while, e.g. around a drop.
+
+        Args:
+            product_url: Watched product
+            duration: Seconds to poll at the floor interval
+            preconnect: Also open a connection to the store right away, so the
+                first boosted poll does not pay for DNS and TLS
+        """
+        key = canonical_product_url(product_url)
+        if self.workers is not None:
+            self.workers.boost(key, duration, preconnect)
+            return
+        poller = self._stores.get(_split_key(key)[0])
+        if poller is not None and key in poller.products:
+            poller.boost(key, duration)
+            if preconnect:
+                asyncio.get_running_loop().create_task(session_registry.preconnect(key))
+
+    def relax(self, product_url: str, duration: float):
+        """Poll a product at its slowest allowed rate for a while, e.g. outside its usual restock times."""
+        key = canonical_product_url(product_url)
+        if self.workers is not None:
+            self.workers.relax(key, duration)
+            return
+        poller = self._stores.get(_split_key(key)[0])
+        if poller is not None and key in poller.products:
+            poller.relax(key, duration)
+
+    def watched(self) -> List[str]:
+        """Return the canonical URL of every product with at least one subscriber."""
+        if self.workers is not None:
+            return self.workers.watched()
+        return [key for poller in self._stores.values() for key in poller.products]
+
+    def get_interval(self, product_url: str) -> Optional[float]:
+        """Return the current adaptive polling interval of a product, if it is watched."""
+        key = canonical_product_url(product_url)
+        poller = self._stores.get(_split_key(key)[0])
+        if poller is None or key not in poller.intervals:
+            return None
+        return poller.intervals[key].current
+
+    def get_cached(self, product_url: str) -> Optional[Dict]:
+        """Return the most recently fetched product, if any."""
+        return self._latest.get(canonical_product_url(product_url))
+
+    def get_state(self, product_url: str) -> Optional[VariantState]:
+        """Return the latest variant snapshot of a watched product, if any."""
+        return self.variants.get_state(canonical_product_url(product_url))
+
+    async def fetch_now(self, product_url: str, max_age: float = 0) -> Optional[Dict]:
+        """Fetch a product immediately, sharing any request already in flight.
+
+        Args:
+            product_url: URL of the product
+            max_age: Return the cached product if it is at most this many seconds old
+
+        Returns:
+            Optional[Dict]: The ``product`` object from ``<product>.json`` or None on failure
+        """
+        key = canonical_product_url(product_url)
+        if max_age and key in self._latest and time.monotonic() - self._fetched_at[key] <= max_age:
+            return self._latest[key]
+        product, _ = await self._fetch_shared(key)
+        return product
+
+    async def _fetch_shared(self, key: str) -> Tuple[Optional[Dict], bool]:
+        """Fetch a product, joining a request already in flight for it.
+
+        Returns:
+            Tuple[Optional[Dict], bool]: The product (None on failure) and whether
+            it changed since the previous fetch
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        result = (None, False)
+        try:
+            result = await self._fetch_product(key)
+        except CircuitOpenError as e:
+            logger.debug(f"Skipped product feed {key}: {e}")
+        except Exception as e:
+            logger.error(f"Error fetching product feed {key}: {e}")
+        finally:
+            del self._in_flight[key]
+            future.set_result(result)
+
+        return result
+
+    async def fetch_store(self, store: str, keys: Set[str]) -> Dict[str, Tuple[Dict, bool]]:
+        """Refresh several products of one store through ``/products.json``.
+
+        Pages are walked until every requested product has been seen, the
+        catalogue ends or ``max_pages`` is reached.
+
+        Args:
+            store: Store base URL, e.g. ``https://shop.example.com``
+            keys: Canonical URLs of the products to refresh
+
+        Returns:
+            Dict[str, Tuple[Dict, bool]]: ``(product, changed)`` for every product
+            found, keyed by canonical URL; a product counts as changed only if
+            its own JSON differs from the cached copy
+        """
+        wanted = {_split_key(key)[1]: key for key in keys}
+        found = {}
+
+        try:
+            for page in range(1, self.max_pages + 1):
+                self.bulk_fetch_count += 1
+                params = {"limit": PRODUCTS_PAGE_LIMIT, "page": page}
+                result = await session_registry.fetch(f"{store}/products.json", params=params)
+
+                unchanged = result.status == 200 and self._page_digests.get((store, page)) == result.digest
+                if unchanged:
+                    self.unchanged_bodies += 1
+
+                if result.not_modified or unchanged:
+                    # Same page as last time: the products we saw on it are unchanged
+                    for key in keys:
+                        if self._page_of.get(key) == page and key in self._latest:
+                            found[key] = (self._latest[key], False)
+                    page_size = self._page_sizes.get((store, page), PRODUCTS_PAGE_LIMIT)
+                elif result.status != 200:
+                    logger.warning(f"Failed to fetch {store}/products.json page {page}, status code: {result.status}")
+                    break
+                else:
+                    products = json.loads(result.body).get("products", [])
+                    for product in products:
+                        key = wanted.get(product.get("handle"))
+                        if key:
+                            self._page_of[key] = page
+                            cached = self._latest.get(key)
+                            if cached is not None and cached == product:
+                                # The page changed because of other products; this one did not
+                                found[key] = (cached, False)
+                                self._fetched_at[key] = time.monotonic()
+                            else:
+                                found[key] = (product, True)
+                                self._remember(key, product)
+                    page_size = len(products)
+                    self._page_sizes[(store, page)] = page_size
+                    self._page_digests[(store, page)] = result.digest
+
+                if len(found) == len(wanted) or page_size < PRODUCTS_PAGE_LIMIT:
+                    break
+        except CircuitOpenError as e:
+            logger.debug(f"Stopped {store}/products.json walk: {e}")
+        except Exception as e:
+            logger.error(f"Error fetching {store}/products.json: {e}")
+
+        return found
+
+    async def _fetch_product(self, key: str) -> Tuple[Optional[Dict], bool]:
+        self.fetch_count += 1
+        cached = self._latest.get(key)
+        result = await session_registry.fetch(f"{key}.json", conditional=cached is not None)
+        if result.not_modified:
+            return cached, False
+        if result.status != 200:
+            logger.warning(f"Failed to fetch product feed {key}, status code: {result.status}")
+            return None, False
+
+        digest = result.digest
+        if cached is not None and self._digests.get(key) == digest:
+            # Identical bytes to the last poll, skip decoding
+            self.unchanged_bodies += 1
+            self._fetched_at[key] = time.monotonic()
+            return cached, False
+
+        product = json.loads(result.body).get("product", {})
+        self._remember(key, product, digest)
+        return product, True
+
+    def close(self):
+        """Drop every subscription and stop polling.
+
+        A worker pool is detached but not stopped; ``await pool.close()`` does that.
+        """
+        self.workers = None
+        for store in list(self._stores):
+            self.scheduler.cancel(store)
+        self._stores.clear()
+        self._latest.clear()
+        self._fetched_at.clear()
+        self._page_of.clear()
+        self._digests.clear()
+        self._page_digests.clear()
+        self._pending_events.clear()
+        self._seeds.clear()
+        self.variants = VariantTracker()
+
+    def get_stats(self) -> Dict:
+        """Return feed statistics for the dashboard."""
+        if self.workers is not None:
+            return self.workers.get_stats()
+        return {
+            "stores": len(self._stores),
+            "products": sum(len(p.products) for p in self._stores.values()),
+            "subscribers": sum(len(subs) for p in self._stores.values() for subs in p.products.values()),
+            "fetches": self.fetch_count,
+            "bulkFetches": self.bulk_fetch_count,
+            "unchangedBodies": self.unchanged_bodies
+        }
+
+
+# Shared bot-wide feed
+product_feed = ProductFeed()
@@ -0,0 +1,109 @@
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_META_MARKER = "var meta = "
+_decoder = json.JSONDecoder()
+
+
+def scan_meta_json(html: str) -> Optional[Dict]:
+    """Pull the ``var meta = {...}`` object out of a product page without a DOM parse.
+
+    The page is searched once for the marker and the object is decoded in place
+    with ``raw_decode``, which stops at the matching closing brace. Nothing else
+    in the page is parsed.
+
+    Args:
+        html: Product page HTML
+
+    Returns:
+        Optional[Dict]: The decoded meta object, or None if it is missing or malformed
+    """
+    index = html.find(_META_MARKER)
+    if index == -1:
+        return None
+    start = html.find("{", index + len(_META_MARKER))
+    if start == -1:
+        return None
+
+    try:
+        meta, _ = _decoder.raw_decode(html, start)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing product meta: {e}")
+        return None
+    return meta if isinstance(meta, dict) else None
+
+
+def _format_price(price) -> Optional[str]:
+    # Theme meta reports integer cents, the JSON endpoints a decimal string
+    if isinstance(price, int):
+        return f"{price / 100:.2f}"
+    return str(price) if price is not None else None
+
+
+def extract_product_metadata(product: Dict, product_url: str) -> Dict:
+    """Build the product summary used by monitors.
+
+    Accepts the ``product`` object of ``<product>.json``, ``/products.json`` or
+    the theme's ``var meta``.
+
+    Args:
+        product: Product object from any of the sources above
+        product_url: URL the product was requested with
+
+    Returns:
+        Dict: title, handle, vendor, type and url
+    """
+    return {
+        "title": product.get("title", "Unknown"),
+        "handle": product.get("handle", ""),
+        "vendor": product.get("vendor", ""),
+        "type": product.get("product_type", product.get("type", "")),
+        "url": product_url
+    }
+
+
+def extract_variants(product: Dict) -> List[Dict]:
+    """Reduce a product's variants to the fields monitors use.
+
+    Args:
+        product: Product object from any of the sources accepted by ``extract_product_metadata``
+
+    Returns:
+        List[Dict]: id, title, price (decimal string), availability and options per variant
+    """
+    return [
+        {
+            "id": variant.get("id"),
+            "title": variant.get("title") or variant.get("public_title"),
+            "price": _format_price(variant.get("price")),
+            "available": variant.get("available", False),
+            "option1": variant.get("option1"),
+            "option2": variant.get("option2"),
+            "option3": variant.get("option3")
+        }
+        for variant in product.get("variants", [])
+    ]
+
+
+def slim_product(product: Dict) -> Dict:
+    """Keep only the product fields subscribers read.
+
+    Used wherever products leave the process: worker IPC and checkpoints.
+
+    Args:
+        product: Product object from any of the sources accepted by ``extract_product_metadata``
+
+    Returns:
+        Dict: id, title, handle, vendor, product_type and the reduced variants
+    """
+    return {
+        "id": product.get("id"),
+        "title": product.get("title"),
+        "handle": product.get("handle"),
+        "vendor": product.get("vendor"),
+        "product_type": product.get("product_type", product.get("type")),
+        "variants": extract_variants(product)
+    }
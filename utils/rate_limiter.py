@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+def store_of(url: str) -> str:
+    """Return the lower-cased host a URL points at, used as the rate limit key."""
+    return urlsplit(url).netloc.lower()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given either as seconds or as an HTTP date.
+
+    Returns:
+        Optional[float]: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Take one token and return how long the caller must wait before using it.
+
+        Tokens may go negative; each caller reserves its slot in order, so
+        concurrent callers are spaced out instead of all waking at once.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+
+class StoreRateLimiter:
+    def __init__(self, rate: float = 2.0, burst: float = 4, default_retry_after: float = 5,
+                 max_retry_after: float = 300):
+        """Per-store token buckets shared by every outbound Shopify request.
+
+        Every monitor, checkout and variant lookup on a store draws from the same
+        bucket, so one user's tasks cannot get the whole store throttled. A 429 or
+        503 blocks the store until its ``Retry-After`` has passed.
+
+        Args:
+            rate: Requests per second allowed per store
+            burst: Bucket capacity, the number of requests that may go out back to back
+            default_retry_after: Block applied when a 429/503 has no usable Retry-After
+            max_retry_after: Upper bound on any single block, in seconds
+        """
+        self.rate = rate
+        self.burst = burst
+        self.default_retry_after = default_retry_after
+        self.max_retry_after = max_retry_after
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.throttle_count = 0
+
+    def _bucket(self, store: str) -> TokenBucket:
+        bucket = self._buckets.get(store)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[store] = bucket
+        return bucket
+
+    async def acquire(self, store: str):
+        """Wait until a request to ``store`` may be sent."""
+        wait = self._bucket(store).reserve(time.monotonic())
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled_for(self, store: str) -> float:
+        """Seconds until ``store`` accepts requests again, 0 if it is not throttled."""
+        bucket = self._buckets.get(store)
+        if bucket is None:
+            return 0.0
+        return max(0.0, bucket.blocked_until - time.monotonic())
+
+    def penalize(self, store: str, retry_after: Optional[str] = None):
+        """Block a store after a 429/503 response.
+
+        Args:
+            store: Store host
+            retry_after: Raw ``Retry-After`` header of the response, if any
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.default_retry_after
+        delay = min(delay, self.max_retry_after)
+
+        bucket = self._bucket(store)
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+        bucket.tokens = min(bucket.tokens, 0)
+        self.throttle_count += 1
+        logger.warning(f"Store {store} is throttling us, pausing requests for {delay:.0f}s")
+
+    def get_stats(self) -> Dict:
+        """Return the stores currently throttled and until when (Unix time)."""
+        now = time.monotonic()
+        wall = time.time()
+        return {
+            "throttleEvents": self.throttle_count,
+            "throttledUntil": {
+                store: round(wall + bucket.blocked_until - now)
+                for store, bucket in self._buckets.items()
+                if bucket.blocked_until > now
+            }
+        }
+
+
+# Shared bot-wide limiter
+rate_limiter = StoreRateLimiter()
@@ -0,0 +1,434 @@
+import asyncio
+import bisect
+import logging
+import math
+import os
+import random
+import sqlite3
+import time
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils.rate_limiter import store_of
+from utils.stock_history import HISTORY_PATH, KIND_CODES, REMOVED_CODE, STOCK_CODE
+from utils.variant_events import VARIANT_ADDED
+
+logger = logging.getLogger(__name__)
+
+WEEK = 7 * 86400
+# 1970-01-01 was a Thursday; shifts Unix time so weeks start on Monday 00:00 UTC
+WEEK_OFFSET = 3 * 86400
+
+# Polling states of a product at a point of the week
+HOT = "hot"
+NORMAL = "normal"
+QUIET = "quiet"
+
+RESTOCK_FILTER = f"available = 1 AND kind IN ({STOCK_CODE}, {KIND_CODES[VARIANT_ADDED]})"
+
+
+class RestockProfile:
+    __slots__ = ("offsets", "states")
+
+    def __init__(self, offsets: array, states: List[str]):
+        """Weekly polling states of a product or store.
+
+        Args:
+            offsets: Seconds into the week at which each state starts, ascending
+                and starting at 0
+            states: State from each offset up to the next one
+        """
+        self.offsets = offsets
+        self.states = states
+
+    def segment(self, now: float) -> Tuple[str, float]:
+        """Return the state at ``now`` (Unix time) and the Unix time it ends."""
+        offset = (now + WEEK_OFFSET) % WEEK
+        index = bisect.bisect_right(self.offsets, offset) - 1
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else WEEK
+        return self.states[index], now + end - offset
+
+
+class RestockPredictor:
+    def __init__(self, db_path: str = HISTORY_PATH, slot: int = 900, lookback: float = 28 * 86400,
+                 spread: int = 1, min_restocks: int = 4, drop_share: float = 0.1, high: float = 0.5,
+                 low: float = 0.05, lead: float = 120, tick: float = 30, refresh_interval: float = 6 * 3600):
+        """Learns when stores and products restock and polls harder around those times.
+
+        Restocks recorded in the stock history over ``lookback`` are binned
+        into ``slot``-second slots of the week (UTC). A slot's probability is
+        the share of observed weeks with a restock in it, counting ``spread``
+        neighbouring slots either side so a drop that drifts by a few minutes
+        still lands in the same slot. A product uses its own restocks once it
+        has ``min_restocks`` of them; otherwise, and in addition, its store's
+        drops apply, where a drop is a slot in which at least ``drop_share`` of
+        the store's products restocked in the same week.
+
+        Every ``tick`` seconds each watched product is checked: from ``lead``
+        seconds before a slot with probability ``high`` or more until the slot
+        ends, it is boosted to its floor interval and a connection to the store
+        is opened ahead of time. Through slots at or below ``low`` it is
+        relaxed to its ceiling. Anything in between is left to the feed's own
+        adaptive interval. The model is relearned every ``refresh_interval``.
+
+        Args:
+            db_path: Stock history database
+            slot: Slot width in seconds; must divide a week
+            lookback: Seconds of history learned from
+            spread: Neighbouring slots counted either side of a restock
+            min_restocks: Restocks a product or store needs before it gets a profile
+            drop_share: Share of a store's products restocking together that makes a drop
+            high: Slot probability from which a product is boosted
+            low: Slot probability up to which a product is relaxed
+            lead: Seconds before a likely slot that boosting starts
+            tick: Seconds between checks of the watched products
+            refresh_interval: Seconds between relearning the model
+        """
+        if WEEK % slot:
+            raise ValueError(f"Slot width {slot}s does not divide a week")
+        self.db_path = db_path
+        self.slot = slot
+        self.slots = WEEK // slot
+        self.lookback = lookback
+        self.spread = spread
+        self.min_restocks = min_restocks
+        self.drop_share = drop_share
+        self.high = high
+        self.low = low
+        self.lead = lead
+        self.tick = tick
+        self.refresh_interval = refresh_interval
+        self._products: Dict[str, RestockProfile] = {}
+        self._stores: Dict[str, RestockProfile] = {}
+        # key -> Unix time the last boost / relaxation sent for it ends
+        self._boosted: Dict[str, float] = {}
+        self._relaxed: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.learned_at: Optional[float] = None
+        self.boosts = 0
+        self.relaxations = 0
+
+    def fit(self, restocks: Dict[str, Iterable[float]], since: float,
+            until: float) -> Tuple[Dict[str, RestockProfile], Dict[str, RestockProfile]]:
+        """Build product and store profiles from restock times.
+
+        Args:
+            restocks: Canonical product URL -> Unix times its variants came back in stock
+            since: Start of the observed period
+            until: End of the observed period
+
+        Returns:
+            Tuple: Product profiles and store profiles, keyed by URL and host
+        """
+        weeks = max(1, round((until - since) / WEEK))
+        # Distinct (week, slot) restocks per product, grouped by store
+        moments: Dict[str, set] = {}
+        stores: Dict[str, List[str]] = defaultdict(list)
+        for key, times in restocks.items():
+            seen = {int((ts + WEEK_OFFSET) // self.slot) for ts in times if since <= ts < until}
+            if seen:
+                moments[key] = seen
+                stores[store_of(key)].append(key)
+
+        store_probabilities = {}
+        for store, keys in stores.items():
+            if sum(len(moments[key]) for key in keys) < self.min_restocks:
+                continue
+            together = defaultdict(int)
+            for key in keys:
+                for moment in moments[key]:
+                    together[moment] += 1
+            needed = max(2, math.ceil(len(keys) * self.drop_share)) if len(keys) > 1 else 1
+            store_probabilities[store] = self._probabilities(
+                (moment for moment, count in together.items() if count >= needed), weeks
+            )
+
+        store_profiles = {
+            store: self._profile(probabilities) for store, probabilities in store_probabilities.items()
+        }
+        product_profiles = {}
+        for key, seen in moments.items():
+            if len(seen) < self.min_restocks:
+                continue
+            probabilities = self._probabilities(seen, weeks)
+            store = store_probabilities.get(store_of(key))
+            if store is not None:
+                probabilities = array("d", map(max, probabilities, store))
+            product_profiles[key] = self._profile(probabilities)
+        return product_profiles, store_profiles
+
+    def _probabilities(self, moments: Iterable[int], weeks: int) -> array:
+        hits = [set() for _ in range(self.slots)]
+        for moment in moments:
+            week, slot = divmod(moment, self.slots)
+            for neighbour in range(slot - self.spread, slot + self.spread + 1):
+                hits[neighbour % self.slots].add(week)
+        return array("d", (min(1.0, len(weeks_hit) / weeks) for weeks_hit in hits))
+
+    def _profile(self, probabilities: array) -> RestockProfile:
+        hot = [probability >= self.high for probability in probabilities]
+        # A state can change at a slot boundary or ``lead`` before one
+        points = sorted({
+            point % WEEK for index in range(self.slots)
+            for point in (index * self.slot, index * self.slot - self.lead)
+        })
+        offsets = array("d")
+        states = []
+        for point in points:
+            index = int(point // self.slot)
+            upcoming = int(((point + self.lead) % WEEK) // self.slot)
+            if hot[index] or hot[upcoming]:
+                state = HOT
+            elif probabilities[index] <= self.low:
+                state = QUIET
+            else:
+                state = NORMAL
+            if not states or states[-1] != state:
+                offsets.append(point)
+                states.append(state)
+        return RestockProfile(offsets, states)
+
+    def profile_for(self, key: str) -> Optional[RestockProfile]:
+        """Return the profile used for a product: its own, else its store's, if either was learned."""
+        profile = self._products.get(key)
+        return profile if profile is not None else self._stores.get(store_of(key))
+
+    def segment(self, key: str, now: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """Return a product's polling state and the Unix time it ends, or None without a profile."""
+        profile = self.profile_for(key)
+        if profile is None:
+            return None
+        return profile.segment(time.time() if now is None else now)
+
+    def load_restocks(self, since: float, until: float) -> Dict[str, List[float]]:
+        """Read restock times from the stock history; blocking, run it in an executor."""
+        if not os.path.exists(self.db_path):
+            return {}
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            urls = dict(conn.execute("SELECT id, url FROM products"))
+            restocks = defaultdict(list)
+            for product_id, ts in conn.execute(
+                f"SELECT product_id, ts FROM stock_events WHERE ts >= ? AND ts < ? AND {RESTOCK_FILTER}",
+                (since, until)
+            ):
+                url = urls.get(product_id)
+                if url is not None:
+                    restocks[url].append(ts)
+            return restocks
+        finally:
+            conn.close()
+
+    def learn(self, now: Optional[float] = None):
+        """Relearn every profile from the stock history; blocking, run it in an executor."""
+        now = time.time() if now is None else now
+        since = now - self.lookback
+        restocks = self.load_restocks(since, now)
+        first = min((min(times) for times in restocks.values()), default=now)
+        self._products, self._stores = self.fit(restocks, max(since, first), now)
+        self.learned_at = now
+        logger.info(f"Learned restock windows for {len(self._products)} products and {len(self._stores)} stores")
+
+    def apply(self, feed, now: Optional[float] = None):
+        """Boost or relax every watched product according to its current state."""
+        now = time.time() if now is None else now
+        self._boosted = {key: until for key, until in self._boosted.items() if until > now}
+        self._relaxed = {key: until for key, until in self._relaxed.items() if until > now}
+        for key in feed.watched():
+            segment = self.segment(key, now)
+            if segment is None:
+                continue
+            state, until = segment
+            if state == HOT and self._boosted.get(key, 0) < until:
+                feed.boost(key, until - now, preconnect=True)
+                self._boosted[key] = until
+                self._relaxed.pop(key, None)
+                self.boosts += 1
+            elif state == QUIET and self._relaxed.get(key, 0) < until:
+                # Renewed after each relearn rather than trusted for days
+                until = min(until, now + self.refresh_interval)
+                feed.relax(key, until - now)
+                self._relaxed[key] = until
+                self.relaxations += 1
+
+    def start(self, feed):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(feed))
+
+    async def _run(self, feed):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if self.learned_at is None or time.time() - self.learned_at >= self.refresh_interval:
+                    await loop.run_in_executor(None, self.learn)
+                self.apply(feed)
+            except Exception as e:
+                logger.error(f"Restock predictor failed: {e}")
+            await asyncio.sleep(self.tick)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "products": len(self._products),
+            "stores": len(self._stores),
+            "boosted": len(self._boosted),
+            "relaxed": len(self._relaxed),
+            "boosts": self.boosts,
+            "relaxations": self.relaxations,
+            "learnedAt": self.learned_at
+        }
+
+    def evaluate(self, test_days: float = 7, interval: float = 10, floor: float = 2, ceiling: float = 120,
+                 until: Optional[float] = None) -> Dict[str, Dict]:
+        """Replay the stock history and compare predictive with fixed-interval polling.
+
+        The last ``test_days`` of history are held out. Profiles are learned
+        from the ``lookback`` before them, then every product seen in either
+        period is polled through the held-out period: at ``interval`` under
+        fixed polling, and at ``floor`` / ``interval`` / ``ceiling`` in hot /
+        normal / quiet slots under predictive polling. A second fixed run uses
+        the interval that spends the same number of requests as predictive
+        polling. A restock counts as missed when the variant sold out again
+        before the next poll. The feed's own change-driven interval is left
+        out of every run. Blocking; reads the whole period.
+
+        Returns:
+            Dict[str, Dict]: Per policy, ``requests``, ``detected``, ``missed``
+            and detection latency ``latencyAvg``/``latencyP50``/``latencyP95`` in seconds
+        """
+        if not os.path.exists(self.db_path):
+            return {}
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            end = until or conn.execute("SELECT MAX(ts) FROM stock_events").fetchone()[0]
+            if end is None:
+                return {}
+            start = end - test_days * 86400
+            urls = dict(conn.execute("SELECT id, url FROM products"))
+            train = defaultdict(list)
+            for product_id, ts in conn.execute(
+                f"SELECT product_id, ts FROM stock_events WHERE ts >= ? AND ts < ? AND {RESTOCK_FILTER}",
+                (start - self.lookback, start)
+            ):
+                train[urls[product_id]].append(ts)
+            # Restocks to detect, each with the time its variant sold out again
+            targets = defaultdict(list)
+            opened = {}
+            for product_id, variant_id, ts, kind, available in conn.execute(
+                "SELECT product_id, variant_id, ts, kind, available FROM stock_events WHERE ts >= ? AND ts < ? "
+                f"AND kind IN ({STOCK_CODE}, {KIND_CODES[VARIANT_ADDED]}, {REMOVED_CODE}) ORDER BY variant_id, ts",
+                (start, end)
+            ):
+                if available and kind != REMOVED_CODE:
+                    if variant_id not in opened:
+                        opened[variant_id] = (product_id, ts)
+                elif variant_id in opened:
+                    restocked_product, restocked_at = opened.pop(variant_id)
+                    targets[urls[restocked_product]].append((restocked_at, ts))
+            for variant_id, (product_id, restocked_at) in opened.items():
+                targets[urls[product_id]].append((restocked_at, math.inf))
+        finally:
+            conn.close()
+
+        first = min((min(times) for times in train.values()), default=start)
+        products, stores = self.fit(train, max(start - self.lookback, first), start)
+        keys = set(train) | set(targets)
+        for entries in targets.values():
+            entries.sort()
+        phases = {key: random.random() for key in keys}
+
+        def run(interval_for) -> Dict:
+            requests, latencies, missed = 0, [], 0
+            for key in keys:
+                polls, found, lost = _replay(interval_for(key), targets.get(key, []), start, end,
+                                             phases[key])
+                requests += polls
+                latencies.extend(found)
+                missed += lost
+            return _summarize(requests, latencies, missed)
+
+        def predictive(key):
+            profile = products.get(key)
+            if profile is None:
+                profile = stores.get(store_of(key))
+            if profile is None:
+                return lambda now: (interval, end)
+            intervals = {HOT: floor, NORMAL: interval, QUIET: ceiling}
+
+            def interval_at(now):
+                state, state_end = profile.segment(now)
+                return intervals[state], state_end
+            return interval_at
+
+        results = {"predictive": run(predictive)}
+        results["fixed"] = run(lambda key: lambda now: (interval, end))
+        matched = (end - start) * len(keys) / max(1, results["predictive"]["requests"])
+        results["fixedSameRequests"] = run(lambda key: lambda now: (matched, end))
+        results["fixedSameRequests"]["interval"] = round(matched, 2)
+        return results
+
+
+def _replay(interval_at, targets: List[Tuple[float, float]], start: float, end: float,
+            phase: float) -> Tuple[int, List[float], int]:
+    """Poll one product from ``start`` to ``end`` and time the detection of each restock.
+
+    Args:
+        interval_at: Unix time -> (polling interval, Unix time it stays in effect until)
+        targets: (restocked at, sold out at) pairs, sorted
+        phase: Fraction of the first interval before the first poll
+
+    Returns:
+        Tuple: Polls made, detection latencies, restocks missed
+    """
+    polls, latencies, missed = 0, [], 0
+    cursor = start
+    following = None
+    index = 0
+    while cursor < end and (following is None or following < end):
+        interval, state_end = interval_at(cursor)
+        state_end = min(state_end, end)
+        if following is None:
+            following = start + phase * interval
+        else:
+            # A shorter interval takes effect straight away, as the feed reschedules on a boost
+            following = min(following, cursor + interval)
+        if following < state_end:
+            count = math.ceil((state_end - following) / interval)
+            last = following + (count - 1) * interval
+            while index < len(targets) and targets[index][0] <= last:
+                restocked_at, sold_out_at = targets[index]
+                poll = following + max(0, math.ceil((restocked_at - following) / interval)) * interval
+                if poll > sold_out_at:
+                    missed += 1
+                else:
+                    latencies.append(poll - restocked_at)
+                index += 1
+            polls += count
+            following = last + interval
+        cursor = state_end
+    return polls, latencies, missed
+
+
+def _summarize(requests: int, latencies: List[float], missed: int) -> Dict:
+    latencies.sort()
+
+    def percentile(share):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))], 2) if latencies else None
+
+    return {
+        "requests": requests,
+        "detected": len(latencies),
+        "missed": missed,
+        "latencyAvg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "latencyP50": percentile(0.5),
+        "latencyP95": percentile(0.95)
+    }
+
+
+# Shared predictor over the bot's stock history
+restock_predictor = RestockPredictor()
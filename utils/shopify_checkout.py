@@ -1,17 +1,26 @@
 import asyncio
+import contextlib
 import logging
-import aiohttp
 import json
 import re
-import discord
 import time
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Awaitable, Callable
 from bs4 import BeautifulSoup
+from utils.event_bus import BLOCK, STOCK_TOPIC, KeyRouter
+from utils.http_client import StoreRequest, session_registry
+from utils.notifier import INFO, URGENT, notify
+from utils.product_feed import canonical_product_url, product_feed
+from utils.variant_events import ProductUpdate, VariantEvent
 
 logger = logging.getLogger(__name__)
 
+# Stock events for every product with a checkout task; none may be dropped,
+# a missed restock is a missed checkout
+restock_events = KeyRouter((STOCK_TOPIC,), "checkout", route=lambda event: event.key, policy=BLOCK)
+
 class ShopifyCheckout:
-    def __init__(self, product_url: str, profile: Dict[str, Any], quantity: int, bot, user_id: int):
+    def __init__(self, product_url: str, profile: Dict[str, Any], quantity: int, bot, user_id: int,
+                 on_success: Optional[Callable[[], Awaitable[None]]] = None):
         """Initialize the Shopify checkout client.
         
         Args:
@@ -20,12 +29,15 @@ class ShopifyCheckout:
             quantity: The quantity to purchase
             bot: The Discord bot instance for notifications
             user_id: Discord user ID to notify
+            on_success: Awaited once a monitored checkout succeeds, before monitoring stops
         """
         self.product_url = product_url
+        self.key = canonical_product_url(product_url)
         self.profile = profile
         self.quantity = quantity
         self.bot = bot
         self.user_id = user_id
+        self.on_success = on_success
         self.running = False
         self.store_domain = self._extract_domain(product_url)
         self.headers = {
@@ -40,6 +52,9 @@ class ShopifyCheckout:
         self.session = None
         self.product_info = None
         self.variant_id = None
+        self.check_interval = 5  # seconds between availability checks
+        self._subscription = None
+        self._attempt: Optional[asyncio.Task] = None
     
     def _extract_domain(self, url: str) -> str:
         """Extract the store domain from a Shopify URL."""
@@ -48,47 +63,112 @@ class ShopifyCheckout:
             return match.group(1)
         return ""
     
+    @contextlib.asynccontextmanager
+    async def _request(self, method: str, url: str, **kwargs):
+        """Send a checkout request within the store's shared rate limit and circuit breaker."""
+        async with StoreRequest(self.store_domain.lower()) as request:
+            async with self.session.request(method, url, headers=self.headers, **kwargs) as response:
+                request.record(response)
+                yield response
+    
     async def monitor_and_checkout(self):
-        """Monitor a product and automatically checkout when in stock."""
+        """Monitor a product and automatically checkout when in stock.
+        
+        Returns once the task is subscribed to the shared product feed and to
+        its restock events; an in-stock first snapshot or any restock starts a
+        checkout attempt until one succeeds.
+        """
         if self.running:
             return
         
         self.running = True
         logger.info(f"Starting monitoring for checkout: {self.product_url}")
         
-        # Create a persistent session
-        self.session = aiohttp.ClientSession()
-        
-        # Main monitoring loop
-        while self.running:
-            try:
-                # Fetch product info
-                in_stock = await self._check_product_availability()
-                
-                if in_stock:
-                    # Product is in stock, attempt checkout
-                    success = await self.checkout()
-                    if success:
-                        # Checkout succeeded, stop monitoring
-                        self.running = False
-                        break
-                
-                # Wait before checking again
-                await asyncio.sleep(5)
-                
-            except Exception as e:
-                logger.error(f"Error in monitor_and_checkout: {e}")
-                await asyncio.sleep(10)  # Wait longer on error
+        # Create a persistent session on the shared connection pool
+        self.session = session_registry.create_session()
         
-        # Close the session
-        await self.session.close()
-        self.session = None
+        # Availability polling is shared with every other watcher of this product
+        restock_events.add(self.key, self._on_stock_event)
+        self._subscription = product_feed.subscribe(
+            self.product_url, self._on_product_update, self.check_interval
+        )
     
     def stop(self):
         """Stop the checkout task."""
         self.running = False
+        if self._subscription:
+            restock_events.remove(self.key, self._on_stock_event)
+            product_feed.unsubscribe(self._subscription)
+            self._subscription = None
+        # A running attempt releases the session itself when it finishes
+        if self._attempt is None and self.session:
+            asyncio.create_task(self._close_session())
         logger.info(f"Stopped checkout task for {self.product_url}")
     
+    async def _close_session(self):
+        session, self.session = self.session, None
+        if session:
+            await session.close()
+    
+    async def _on_product_update(self, update: ProductUpdate):
+        """Product feed callback; starts a checkout attempt if the first snapshot is in stock."""
+        if not self.running or self._attempt is not None:
+            return
+        # Past the first snapshot only a restock event can make the product buyable, and
+        # a restock in this update reaches _on_stock_event, which must not race a second attempt
+        if not update.initial or any(event.is_restock for event in update.events):
+            return
+        if self._update_from_product(update.product):
+            self._attempt = asyncio.create_task(self._attempt_checkout())
+    
+    async def _on_stock_event(self, event: VariantEvent):
+        """Event bus handler; starts a checkout attempt for a restocked variant."""
+        if not self.running or self._attempt is not None or not event.is_restock:
+            return
+        self.product_info = product_feed.get_cached(event.key) or self.product_info
+        self.variant_id = event.variant_id
+        self._attempt = asyncio.create_task(self._attempt_checkout())
+    
+    async def _attempt_checkout(self):
+        """Run one checkout attempt and decide whether to keep watching."""
+        try:
+            success = await self.checkout()
+        except Exception as e:
+            logger.error(f"Error in monitor_and_checkout: {e}")
+            success = False
+        finally:
+            self._attempt = None
+        
+        if success and self.on_success is not None:
+            try:
+                await self.on_success()
+            except Exception as e:
+                logger.error(f"Error recording completed checkout for {self.product_url}: {e}")
+        if success or not self.running:
+            # Checkout succeeded or the task was cancelled, stop monitoring
+            self.stop()
+        elif self._subscription:
+            # The feed only reports changes, so ask for the next poll to retry
+            product_feed.request_snapshot(self._subscription)
+    
+    def _update_from_product(self, product: Dict) -> bool:
+        """Record product data and pick the first in-stock variant.
+        
+        Returns:
+            bool: True if any variant is in stock, False otherwise
+        """
+        # Store product information
+        self.product_info = product
+        
+        # Check each variant for availability
+        for variant in product.get("variants", []):
+            if variant.get("available", False):
+                # Found an in-stock variant
+                self.variant_id = variant.get("id")
+                return True
+        
+        return False
+    
     async def _check_product_availability(self) -> bool:
         """Check if the product is available.
         
@@ -96,37 +176,10 @@ class ShopifyCheckout:
             bool: True if the product is in stock, False otherwise
         """
         try:
-            # Create a new session if necessary
-            if self.session is None:
-                self.session = aiohttp.ClientSession()
-            
-            # Construct the .json URL for the product
-            json_url = self.product_url
-            if json_url.endswith("/"):
-                json_url = json_url[:-1]
-            if not json_url.endswith(".json"):
-                json_url += ".json"
-            
-            async with self.session.get(json_url, headers=self.headers) as response:
-                if response.status != 200:
-                    logger.warning(f"Failed to check product availability, status code: {response.status}")
-                    return False
-                
-                data = await response.json()
-                product = data.get("product", {})
-                
-                # Store product information
-                self.product_info = product
-                
-                # Check each variant for availability
-                variants = product.get("variants", [])
-                for variant in variants:
-                    if variant.get("available", False):
-                        # Found an in-stock variant
-                        self.variant_id = variant.get("id")
-                        return True
-                
+            product = await product_feed.fetch_now(self.product_url, max_age=self.check_interval)
+            if product is None:
                 return False
+            return self._update_from_product(product)
             
         except Exception as e:
             logger.error(f"Error checking product availability: {e}")
@@ -138,13 +191,14 @@ class ShopifyCheckout:
         Returns:
             bool: True if checkout was successful, False otherwise
         """
+        # Create a new session if necessary
+        owns_session = self.session is None
+        if owns_session:
+            self.session = session_registry.create_session()
+        
         try:
-            # Create a new session if necessary
-            if self.session is None:
-                self.session = aiohttp.ClientSession()
-            
             # Notify user that checkout is starting
-            await self._notify_user(f"Starting checkout for {self.product_url}")
+            await self._notify_user(f"Starting checkout for {self.product_url}", INFO)
             
             # 1. Check product availability and get variant ID if not already set
             if not self.variant_id:
@@ -160,17 +214,17 @@ class ShopifyCheckout:
                 "quantity": self.quantity
             }
             
-            async with self.session.post(cart_url, headers=self.headers, json=cart_data) as response:
+            async with self._request("POST", cart_url, json=cart_data) as response:
                 if response.status != 200:
                     logger.error(f"Failed to add to cart, status code: {response.status}")
                     await self._notify_user("Failed to add product to cart.")
                     return False
                 
-                await self._notify_user("Product added to cart successfully!")
+                await self._notify_user("Product added to cart successfully!", INFO)
             
             # 3. Begin checkout
             checkout_url = f"https://{self.store_domain}/checkout"
-            async with self.session.get(checkout_url, headers=self.headers) as response:
+            async with self._request("GET", checkout_url) as response:
                 if response.status != 200:
                     logger.error(f"Failed to begin checkout, status code: {response.status}")
                     await self._notify_user("Failed to begin checkout process.")
@@ -220,13 +274,13 @@ class ShopifyCheckout:
                 "button": ""
             }
             
-            async with self.session.post(customer_url, headers=self.headers, data=customer_data) as response:
+            async with self._request("POST", customer_url, data=customer_data) as response:
                 if response.status != 200:
                     logger.error(f"Failed to submit customer information, status code: {response.status}")
                     await self._notify_user("Failed to submit shipping information.")
                     return False
                 
-                await self._notify_user("Shipping information submitted successfully!")
+                await self._notify_user("Shipping information submitted successfully!", INFO)
             
             # 5. Select shipping method (typically this would detect and select a shipping option)
             # This is a simplified implementation - in a real bot, you'd parse available shipping options
@@ -241,13 +295,13 @@ class ShopifyCheckout:
                 "button": ""
             }
             
-            async with self.session.post(shipping_url, headers=self.headers, data=shipping_data) as response:
+            async with self._request("POST", shipping_url, data=shipping_data) as response:
                 if response.status != 200:
                     logger.error(f"Failed to select shipping method, status code: {response.status}")
                     await self._notify_user("Failed to select shipping method.")
                     return False
                 
-                await self._notify_user("Shipping method selected!")
+                await self._notify_user("Shipping method selected!", INFO)
             
             # 6. Submit payment information (simplified - in a real implementation this would be more complex)
             # Note: This is where actual payment processing would occur, which is complex and varies by store
@@ -266,20 +320,13 @@ class ShopifyCheckout:
             return False
         finally:
             # Only close the session if we created it here
-            if self.session and self.session._created_here:
+            if owns_session and self.session:
                 await self.session.close()
                 self.session = None
     
-    async def _notify_user(self, message: str):
-        """Send a notification message to the user."""
-        user = self.bot.get_user(self.user_id)
-        if not user:
-            logger.warning(f"Could not find user with ID {self.user_id}")
-            return
-        
-        try:
-            await user.send(message)
-        except discord.errors.Forbidden:
-            logger.warning(f"Cannot send DM to user {self.user_id}")
-        except Exception as e:
-            logger.error(f"Error sending notification: {e}")
+    async def _notify_user(self, message: str, priority: int = URGENT):
+        """Queue a notification message to the user without holding up the checkout.
+
+        Results and failures are urgent; progress updates pass ``INFO``.
+        """
+        await notify(self.user_id, message, priority=priority)
@@ -1,26 +1,35 @@
-import asyncio
 import logging
-import aiohttp
-import json
-import re
 import discord
-import time
-from typing import Dict, Optional, List, Union
-from bs4 import BeautifulSoup
+from typing import Dict, Optional
+from utils.event_bus import COALESCE, STOCK_TOPIC, KeyRouter
+from utils.http_client import PAGE_HEADERS, session_registry
+from utils.notifier import INFO, NORMAL, notify, restock_coalescer
+from utils.product_feed import canonical_product_url, product_feed
+from utils.product_metadata import extract_product_metadata, scan_meta_json
+from utils.user_resolver import user_resolver
+from utils.variant_events import STOCK_CHANGED, VariantEvent
 
 logger = logging.getLogger(__name__)
 
+# Stock events for every monitored product; a queued event is replaced by a
+# newer one for the same variant, so a backlog never replays stale stock
+stock_events = KeyRouter(
+    (STOCK_TOPIC,), "monitor", route=lambda event: event.key, policy=COALESCE,
+    key=lambda event: (event.key, event.variant_id), maxsize=10000
+)
+
 async def send_restock_notification(bot, user_id, product_url, quantity):
-    user = await bot.fetch_user(user_id)
+    channel = await user_resolver.get_dm_channel(user_id)
     embed = discord.Embed(
         title="Product Restocked!",
         description=f"Product {product_url} is back in stock!\nQuantity: {quantity}",
         color=discord.Color.green()
     )
-    await user.send(embed=embed)
+    await channel.send(embed=embed)
 
 class ShopifyMonitor:
-    def __init__(self, product_url: str, bot, user_id: int, notify: bool = True):
+    def __init__(self, product_url: str, bot, user_id: int, notify: bool = True,
+                 min_interval: Optional[float] = None, max_interval: Optional[float] = None):
         """Initialize the Shopify product monitor.
         
         Args:
@@ -28,27 +37,27 @@ class ShopifyMonitor:
             bot: The Discord bot instance
             user_id: Discord user ID to notify
             notify: Whether to send notifications when product status changes
+            min_interval: Fastest polling interval while the product is active
+            max_interval: Slowest polling interval once the product goes quiet
         """
         self.product_url = product_url
+        self.key = canonical_product_url(product_url)
         self.bot = bot
         self.user_id = user_id
         self.notify = notify
         self.running = False
-        self.check_interval = 10  # seconds between checks
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Cache-Control": "max-age=0"
-        }
+        self.check_interval = 10  # seconds between checks, adapted by the feed
+        self.min_interval = min_interval
+        self.max_interval = max_interval
         self.product_info = None
-        self.variants = []
-        self.last_stock_status = {}
+        self._subscription = None
     
     async def start_monitoring(self):
-        """Start monitoring the Shopify product."""
+        """Start monitoring the Shopify product.
+        
+        Returns once the monitor is subscribed to the shared product feed; the
+        feed's scheduler does the polling from then on.
+        """
         if self.running:
             return
         
@@ -63,172 +72,113 @@ class ShopifyMonitor:
             return
         
         # Initial notification with product details
-        await self._notify_user(f"Started monitoring: {self.product_info.get('title', 'Unknown Product')}")
+        await self._notify_user(f"Started monitoring: {self.product_info.get('title', 'Unknown Product')}", INFO)
+        
+        # Polling is shared with every other watcher of this product
+        if not self.running:
+            return
+        self._subscribe()
+    
+    async def resume_monitoring(self):
+        """Resume a monitor that was active before a restart.
+        
+        Product details come from the feed's checkpoint when available, so no
+        page is fetched and no "Started monitoring" message is sent again.
+        """
+        if self.running:
+            return
         
-        # Main monitoring loop
-        while self.running:
-            try:
-                await self._check_product_availability()
-                await asyncio.sleep(self.check_interval)
-            except Exception as e:
-                logger.error(f"Error in monitoring loop: {e}")
-                await asyncio.sleep(self.check_interval * 2)  # Wait longer on error
+        self.running = True
+        # Subscribing applies the checkpointed product as the feed's baseline
+        self._subscribe()
+        product = product_feed.get_cached(self.product_url)
+        if product is not None:
+            self.product_info = extract_product_metadata(product, self.product_url)
+        elif not await self._fetch_product_info():
+            logger.warning(f"No product details yet for resumed monitor {self.product_url}")
+        logger.info(f"Resumed monitor for {self.product_url}")
+    
+    def _subscribe(self):
+        """Keep the product polled by the feed and take its stock events from the event bus."""
+        stock_events.add(self.key, self._on_stock_event)
+        self._subscription = product_feed.subscribe(
+            self.product_url, None, self.check_interval,
+            min_interval=self.min_interval, max_interval=self.max_interval
+        )
     
     def stop_monitoring(self):
         """Stop monitoring the product."""
         self.running = False
+        if self._subscription:
+            stock_events.remove(self.key, self._on_stock_event)
+            product_feed.unsubscribe(self._subscription)
+            self._subscription = None
         logger.info(f"Stopped monitor for {self.product_url}")
     
     async def _fetch_product_info(self) -> bool:
         """Fetch product information from the Shopify store.
         
+        Uses the product's JSON endpoint through the shared feed and only falls
+        back to scanning the product page's ``var meta`` object when that fails.
+        
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.product_url, headers=self.headers) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to fetch product, status code: {response.status}")
-                        return False
-                    
-                    html = await response.text()
-                    
-                    # Parse the JSON data from the page
-                    json_match = re.search(r'var meta = (.*?);\n', html)
-                    if not json_match:
-                        logger.error("Could not find product metadata in the page")
-                        return False
-                    
-                    product_json = json.loads(json_match.group(1))
-                    
-                    # Extract product info
-                    self.product_info = {
-                        "title": product_json.get("product", {}).get("title", "Unknown"),
-                        "handle": product_json.get("product", {}).get("handle", ""),
-                        "vendor": product_json.get("product", {}).get("vendor", ""),
-                        "type": product_json.get("product", {}).get("type", ""),
-                        "url": self.product_url
-                    }
-                    
-                    # Get variant information
-                    soup = BeautifulSoup(html, 'html.parser')
-                    variants_json = None
-                    
-                    # Look for variants in JSON data
-                    variants_match = re.search(r'var meta = ({.*?"variants":\s*\[.*?\]})', html)
-                    if variants_match:
-                        try:
-                            variants_data = json.loads(variants_match.group(1))
-                            variants_json = variants_data.get("product", {}).get("variants", [])
-                        except (json.JSONDecodeError, KeyError) as e:
-                            logger.error(f"Error parsing variants JSON: {e}")
-                    
-                    # If we found variants JSON, extract details
-                    if variants_json:
-                        self.variants = []
-                        for variant in variants_json:
-                            self.variants.append({
-                                "id": variant.get("id"),
-                                "title": variant.get("title"),
-                                "price": variant.get("price"),
-                                "available": variant.get("available", False),
-                                "option1": variant.get("option1"),
-                                "option2": variant.get("option2"),
-                                "option3": variant.get("option3")
-                            })
-                            
-                            # Initialize last stock status
-                            if variant.get("id"):
-                                self.last_stock_status[variant.get("id")] = variant.get("available", False)
-                    
-                    return True
+            product = await product_feed.fetch_now(self.product_url)
+            if product is None:
+                product = await self._fetch_page_meta()
+            if not product:
+                logger.error("Could not find product metadata")
+                return False
+            
+            # Extract product info; stock changes come from the feed's events
+            self.product_info = extract_product_metadata(product, self.product_url)
+            return True
             
         except Exception as e:
             logger.error(f"Error fetching product info: {e}")
             return False
     
-    async def _check_product_availability(self):
-        """Check the current availability of the product and its variants."""
+    async def _fetch_page_meta(self) -> Optional[Dict]:
+        """Fetch the product page and scan it for the theme's ``var meta`` product."""
+        session = session_registry.get_session()
+        async with session.get(self.product_url, headers=PAGE_HEADERS) as response:
+            if response.status != 200:
+                logger.error(f"Failed to fetch product, status code: {response.status}")
+                return None
+            
+            meta = scan_meta_json(await response.text())
+            return meta.get("product") if meta else None
+    
+    async def _on_stock_event(self, event: VariantEvent):
+        """Notify the user about a stock change published for the product.
+        
+        Args:
+            event: Variant added, removed or changed stock since the last poll
+        """
         try:
-            # Construct the .json URL for the product
-            json_url = self.product_url
-            if json_url.endswith("/"):
-                json_url = json_url[:-1]
-            if not json_url.endswith(".json"):
-                json_url += ".json"
+            if not self.notify:
+                return
+            product = product_feed.get_cached(event.key) or self.product_info or {}
+            product_title = product.get("title", "Unknown Product")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(json_url, headers=self.headers) as response:
-                    if response.status != 200:
-                        logger.warning(f"Failed to check product availability, status code: {response.status}")
-                        return
-                    
-                    data = await response.json()
-                    product = data.get("product", {})
-                    
-                    # Check each variant for stock changes
-                    variants = product.get("variants", [])
-                    product_title = product.get("title", "Unknown Product")
-                    
-                    for variant in variants:
-                        variant_id = variant.get("id")
-                        variant_title = variant.get("title")
-                        available = variant.get("available", False)
-                        
-                        # If this is a new variant or the availability has changed
-                        if variant_id not in self.last_stock_status or self.last_stock_status[variant_id] != available:
-                            self.last_stock_status[variant_id] = available
-                            
-                            if available and self.notify:
-                                # Product is now in stock
-                                await self._notify_restock(product_title, variant_title, variant_id)
-                            elif not available and self.notify and variant_id in self.last_stock_status:
-                                # Product is now out of stock
-                                await self._notify_user(f"{product_title} ({variant_title}) is now out of stock.")
+            if event.is_restock:
+                self._notify_restock(event.key, product_title, event.title, event.variant_id)
+            elif event.kind == STOCK_CHANGED:
+                # A restock still waiting in its batch is simply withdrawn
+                if not restock_coalescer.discard(self.user_id, event.key, event.variant_id):
+                    await self._notify_user(f"{product_title} ({event.title}) is now out of stock.")
         
         except Exception as e:
             logger.error(f"Error checking product availability: {e}")
     
-    async def _notify_restock(self, product_title: str, variant_title: str, variant_id: str):
-        """Send a restock notification to the user."""
-        user = self.bot.get_user(self.user_id)
-        if not user:
-            logger.warning(f"Could not find user with ID {self.user_id}")
-            return
-        
-        # Create an embed with product details
-        embed = discord.Embed(
-            title="🚨 Product In Stock!",
-            description=f"**{product_title}**\nVariant: {variant_title}",
-            color=discord.Color.green(),
-            url=self.product_url
-        )
-        
-        embed.add_field(name="Status", value="In Stock!", inline=True)
-        embed.add_field(name="Action", value="Use `/add_task` to checkout", inline=True)
-        embed.set_footer(text=f"Monitored by Shopify Bot | {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        try:
-            await user.send(embed=embed)
-        except discord.errors.Forbidden:
-            logger.warning(f"Cannot send DM to user {self.user_id}")
-        except Exception as e:
-            logger.error(f"Error sending restock notification: {e}")
+    def _notify_restock(self, key: str, product_title: str, variant_title: str, variant_id: int):
+        """Add a restocked variant to the user's coalesced restock notification."""
+        restock_coalescer.add(self.user_id, key, product_title, self.product_url, variant_id, variant_title)
     
-    async def _notify_user(self, message: str):
-        """Send a notification message to the user."""
+    async def _notify_user(self, message: str, priority: int = NORMAL):
+        """Queue a notification message to the user."""
         if not self.notify:
             return
-        
-        user = self.bot.get_user(self.user_id)
-        if not user:
-            logger.warning(f"Could not find user with ID {self.user_id}")
-            return
-        
-        try:
-            await user.send(message)
-        except discord.errors.Forbidden:
-            logger.warning(f"Cannot send DM to user {self.user_id}")
-        except Exception as e:
-            logger.error(f"Error sending notification: {e}")
+        await notify(self.user_id, message, priority=priority)
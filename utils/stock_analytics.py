@@ -0,0 +1,207 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional
+from utils.stock_history import HISTORY_PATH
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+HOUR = 3600
+# 1970-01-01 was a Thursday; shifts epoch days so Monday is 0
+EPOCH_WEEKDAY = 3
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+class StockAnalytics:
+    def __init__(self, db_path: str = HISTORY_PATH, cache_bucket: float = 300, cache_size: int = 64,
+                 top_products: int = 10):
+        """Restock patterns computed from the stock history's aggregates.
+
+        Reads the per-store hourly and per-product daily tables the history
+        writer maintains, so the cost depends on stores x hours in the window,
+        not on the number of raw events. SQLite groups them down to stores x
+        days, which is pulled into arrays and folded into the histograms in a
+        single pass. Results are cached per ``cache_bucket`` seconds of wall
+        time: every request inside the same bucket is served from memory.
+
+        Times are UTC.
+
+        Args:
+            db_path: Stock history database
+            cache_bucket: Seconds a computed summary is served for
+            cache_size: Summaries kept, one per window and store filter
+            top_products: Number of most frequently restocked products listed
+        """
+        self.db_path = db_path
+        self.cache_bucket = cache_bucket
+        self.cache_size = cache_size
+        self.top_products = top_products
+        self._cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        # Flask serves requests from several threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self, days: int = 30, store: Optional[str] = None, now: Optional[float] = None) -> Dict:
+        """Return restock analytics for the last ``days`` days.
+
+        Args:
+            days: Window length in whole days, ending today
+            store: Restrict to one store host
+            now: Unix time the window ends, defaults to now
+
+        Returns:
+            Dict: ``totals``, ``dailyRestocks``, ``hourOfDay``, ``dayOfWeek``,
+            ``stores`` (with a per-day drop calendar each) and ``topProducts``
+        """
+        now = time.time() if now is None else now
+        key = (days, store, int(now // self.cache_bucket))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        started = time.perf_counter()
+        result = self._compute(days, store, now)
+        result["computeMs"] = round((time.perf_counter() - started) * 1000, 1)
+
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not os.path.exists(self.db_path):
+            return None
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+
+    def _compute(self, days: int, store: Optional[str], now: float) -> Dict:
+        first_day = int(now // DAY) * DAY - (days - 1) * DAY
+        result = {
+            "days": days,
+            "since": first_day,
+            "store": store,
+            "totals": {"restocks": 0, "sellouts": 0, "priceChanges": 0, "restocksPerDay": 0.0,
+                       "meanTimeInStock": None},
+            "dailyRestocks": [0] * days,
+            "hourOfDay": [0] * 24,
+            "dayOfWeek": dict.fromkeys(WEEKDAYS, 0),
+            "stores": [],
+            "topProducts": []
+        }
+        conn = self._connect()
+        if conn is None:
+            return result
+
+        try:
+            condition = "bucket >= ?"
+            params = [first_day]
+            if store:
+                row = conn.execute("SELECT id FROM stores WHERE host = ?", (store,)).fetchone()
+                if row is None:
+                    return result
+                condition += " AND store_id = ?"
+                params.append(row[0])
+            # SQLite does the heavy grouping in C; Python only folds stores x days rows
+            rows = conn.execute(
+                f"SELECT store_id, CAST((bucket - ?) / {DAY} AS INTEGER), SUM(restocks), SUM(sellouts), "
+                f"SUM(price_changes), SUM(stock_seconds), SUM(periods) FROM store_hourly WHERE {condition} "
+                f"GROUP BY 1, 2", [first_day] + params
+            ).fetchall()
+            hours = conn.execute(
+                f"SELECT bucket / {HOUR} % 24, SUM(restocks) FROM store_hourly WHERE {condition} GROUP BY 1",
+                params
+            ).fetchall()
+            hosts = dict(conn.execute("SELECT id, host FROM stores"))
+            top = conn.execute(
+                "SELECT p.url, t.restocks, t.sellouts FROM (SELECT product_id, SUM(restocks) AS restocks, "
+                "SUM(sellouts) AS sellouts FROM product_daily WHERE day >= ? GROUP BY product_id) t "
+                "JOIN products p ON p.id = t.product_id "
+                + ("WHERE p.store_id = ? " if store else "")
+                + "ORDER BY t.restocks DESC LIMIT ?",
+                [first_day] + params[1:] + [self.top_products]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        # Columns as typed arrays; the histograms are one pass over them
+        store_ids = array("q", (row[0] for row in rows))
+        day_index = array("q", (row[1] for row in rows))
+        restocks = array("q", (row[2] for row in rows))
+        sellouts = array("q", (row[3] for row in rows))
+        price_changes = array("q", (row[4] for row in rows))
+        stock_seconds = array("d", (row[5] for row in rows))
+        periods = array("q", (row[6] for row in rows))
+
+        daily = array("q", bytes(8 * days))
+        hour_of_day = array("q", bytes(8 * 24))
+        day_of_week = array("q", bytes(8 * 7))
+        for hour, count in hours:
+            hour_of_day[hour] = count
+        # store id -> [restocks, sellouts, stock seconds, periods, calendar]
+        per_store: Dict[int, list] = {}
+        weekday_offset = first_day // DAY + EPOCH_WEEKDAY
+        for index in range(len(store_ids)):
+            store_id = store_ids[index]
+            totals = per_store.get(store_id)
+            if totals is None:
+                totals = per_store[store_id] = [0, 0, 0.0, 0, array("q", bytes(8 * days))]
+            totals[1] += sellouts[index]
+            totals[2] += stock_seconds[index]
+            totals[3] += periods[index]
+            count = restocks[index]
+            day = day_index[index]
+            if not count or day >= days:
+                continue
+            daily[day] += count
+            day_of_week[(day + weekday_offset) % 7] += count
+            totals[0] += count
+            totals[4][day] += count
+
+        total_seconds = sum(stock_seconds)
+        total_periods = sum(periods)
+        result["totals"] = {
+            "restocks": sum(restocks),
+            "sellouts": sum(sellouts),
+            "priceChanges": sum(price_changes),
+            "restocksPerDay": round(sum(restocks) / days, 2),
+            "meanTimeInStock": round(total_seconds / total_periods, 1) if total_periods else None
+        }
+        result["dailyRestocks"] = daily.tolist()
+        result["hourOfDay"] = hour_of_day.tolist()
+        result["dayOfWeek"] = dict(zip(WEEKDAYS, day_of_week.tolist()))
+        result["stores"] = sorted(
+            (
+                {
+                    "store": hosts.get(store_id, str(store_id)),
+                    "restocks": totals[0],
+                    "sellouts": totals[1],
+                    "restocksPerDay": round(totals[0] / days, 2),
+                    "meanTimeInStock": round(totals[2] / totals[3], 1) if totals[3] else None,
+                    "calendar": totals[4].tolist()
+                }
+                for store_id, totals in per_store.items()
+            ),
+            key=lambda entry: entry["restocks"], reverse=True
+        )
+        result["topProducts"] = [
+            {"url": url, "restocks": product_restocks, "sellouts": product_sellouts}
+            for url, product_restocks, product_sellouts in top
+        ]
+        return result
+
+    def get_stats(self) -> Dict:
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+# Shared analytics over the bot's stock history
+stock_analytics = StockAnalytics()
@@ -1,14 +1,484 @@
-
+import asyncio
+import logging
+import os
 import sqlite3
-from datetime import datetime
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from utils.event_bus import DROP_OLDEST, PRICE_TOPIC, STOCK_TOPIC, event_bus
+from utils.rate_limiter import store_of
+from utils.variant_events import (PRICE_CHANGED, STOCK_CHANGED, VARIANT_ADDED, VARIANT_REMOVED,
+                                  VariantEvent)
+from utils.variant_state import cents_to_price
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PATH = os.path.join("instance", "stock_history.db")
+
+# Event kinds as stored, so rows stay small
+KIND_CODES = {VARIANT_ADDED: 1, VARIANT_REMOVED: 2, PRICE_CHANGED: 3, STOCK_CHANGED: 4}
+KIND_NAMES = {code: kind for kind, code in KIND_CODES.items()}
+
+PRICE_CODE = KIND_CODES[PRICE_CHANGED]
+STOCK_CODE = KIND_CODES[STOCK_CHANGED]
+REMOVED_CODE = KIND_CODES[VARIANT_REMOVED]
+
+# Width of a downsampled bucket, in seconds
+ROLLUP_BUCKET = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stores (
+    id INTEGER PRIMARY KEY,
+    host TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    store_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS stock_events (
+    product_id INTEGER NOT NULL,
+    variant_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    kind INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    price_cents INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stock_events_product_ts ON stock_events (product_id, ts);
+CREATE INDEX IF NOT EXISTS stock_events_ts ON stock_events (ts);
+CREATE TABLE IF NOT EXISTS stock_rollups (
+    product_id INTEGER NOT NULL,
+    variant_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    events INTEGER NOT NULL,
+    restocks INTEGER NOT NULL,
+    sellouts INTEGER NOT NULL,
+    price_changes INTEGER NOT NULL,
+    min_price_cents INTEGER,
+    max_price_cents INTEGER,
+    PRIMARY KEY (product_id, variant_id, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stock_rollups_bucket ON stock_rollups (bucket);
+CREATE TABLE IF NOT EXISTS store_hourly (
+    store_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    restocks INTEGER NOT NULL,
+    sellouts INTEGER NOT NULL,
+    price_changes INTEGER NOT NULL,
+    stock_seconds REAL NOT NULL,
+    periods INTEGER NOT NULL,
+    PRIMARY KEY (store_id, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS store_hourly_bucket ON store_hourly (bucket);
+CREATE TABLE IF NOT EXISTS product_daily (
+    product_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    restocks INTEGER NOT NULL,
+    sellouts INTEGER NOT NULL,
+    PRIMARY KEY (product_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS product_daily_day ON product_daily (day);
+CREATE TABLE IF NOT EXISTS open_stock (
+    variant_id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL,
+    since REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+STORE_HOURLY_SQL = """
+INSERT INTO store_hourly (store_id, bucket, restocks, sellouts, price_changes, stock_seconds, periods)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (store_id, bucket) DO UPDATE SET
+    restocks = restocks + excluded.restocks,
+    sellouts = sellouts + excluded.sellouts,
+    price_changes = price_changes + excluded.price_changes,
+    stock_seconds = stock_seconds + excluded.stock_seconds,
+    periods = periods + excluded.periods
+"""
+
+PRODUCT_DAILY_SQL = """
+INSERT INTO product_daily (product_id, day, restocks, sellouts) VALUES (?, ?, ?, ?)
+ON CONFLICT (product_id, day) DO UPDATE SET
+    restocks = restocks + excluded.restocks,
+    sellouts = sellouts + excluded.sellouts
+"""
+
+ROLLUP_SQL = f"""
+INSERT INTO stock_rollups (product_id, variant_id, bucket, events, restocks, sellouts, price_changes,
+                           min_price_cents, max_price_cents)
+SELECT product_id, variant_id, CAST(ts / {ROLLUP_BUCKET} AS INTEGER) * {ROLLUP_BUCKET},
+       COUNT(*),
+       SUM((kind = {KIND_CODES[STOCK_CHANGED]} OR kind = {KIND_CODES[VARIANT_ADDED]}) AND available),
+       SUM(kind = {KIND_CODES[STOCK_CHANGED]} AND NOT available),
+       SUM(kind = {KIND_CODES[PRICE_CHANGED]}),
+       MIN(price_cents), MAX(price_cents)
+FROM stock_events WHERE ts < ?
+GROUP BY 1, 2, 3
+ON CONFLICT (product_id, variant_id, bucket) DO UPDATE SET
+    events = events + excluded.events,
+    restocks = restocks + excluded.restocks,
+    sellouts = sellouts + excluded.sellouts,
+    price_changes = price_changes + excluded.price_changes,
+    min_price_cents = MIN(min_price_cents, excluded.min_price_cents),
+    max_price_cents = MAX(max_price_cents, excluded.max_price_cents)
+"""
+
 
 class StockHistory:
-    def __init__(self, db_path):
+    def __init__(self, db_path: str = HISTORY_PATH, flush_interval: float = 1.0, batch_size: int = 5000,
+                 max_buffer: int = 200000, raw_retention: float = 30 * 86400,
+                 rollup_retention: float = 365 * 86400, retention_interval: float = 3600):
+        """Time series of every variant availability and price transition.
+
+        Events arrive from the event bus and are only appended to an
+        in-memory buffer on the loop. A background task hands the buffer to a
+        dedicated writer thread every ``flush_interval`` seconds, or as soon as
+        ``batch_size`` events are waiting, which inserts it in one transaction
+        on a WAL-mode database. Raw events older than ``raw_retention`` are
+        folded into hourly per-variant rollups and deleted; rollups are kept
+        for ``rollup_retention``.
+
+        The writer also keeps the aggregates analytics read, so they never
+        scan raw events: restocks, sell-outs, price changes and completed
+        in-stock periods per store and hour, and restocks per product and day.
+        Variants currently in stock are tracked in ``open_stock`` so periods
+        span restarts.
+
+        Args:
+            db_path: SQLite database file
+            flush_interval: Longest an event waits in memory, in seconds
+            batch_size: Buffered events that trigger an early flush
+            max_buffer: Events kept in memory when the disk falls behind; the
+                oldest are dropped beyond it
+            raw_retention: Seconds raw events are kept
+            rollup_retention: Seconds hourly rollups are kept
+            retention_interval: Seconds between retention passes
+        """
         self.db_path = db_path
-        
-    def log_stock_change(self, product_url, quantity):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO stock_history (product_url, quantity, timestamp)
-                VALUES (?, ?, ?)
-            """, (product_url, quantity, datetime.now()))
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.raw_retention = raw_retention
+        self.rollup_retention = rollup_retention
+        self.retention_interval = retention_interval
+        self._buffer = deque(maxlen=max_buffer)
+        # Every database call runs on this one thread, which owns the write connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stock-history")
+        self._conn: Optional[sqlite3.Connection] = None
+        # url -> (product id, store id)
+        self._product_ids: Dict[str, Tuple[int, int]] = {}
+        self._store_ids: Dict[str, int] = {}
+        # variant id -> Unix time it came back in stock
+        self._in_stock_since: Dict[int, float] = {}
+        self._consumers = []
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self.received = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.last_retention: Optional[Dict] = None
+
+    @property
+    def dropped(self) -> int:
+        return max(0, self.received - self.written - len(self._buffer))
+
+    async def start(self):
+        """Open the database and start consuming stock and price events."""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._open)
+        self._wake = asyncio.Event()
+        for topic in (STOCK_TOPIC, PRICE_TOPIC):
+            self._consumers.append(event_bus.subscribe(
+                topic, self._on_event, name=f"stock-history-{topic}", maxsize=10000, policy=DROP_OLDEST
+            ))
+        self._tasks = [loop.create_task(self._flush_loop()), loop.create_task(self._retention_loop())]
+        logger.info(f"Stock history recording to {self.db_path}")
+
+    def _open(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the database consistent on power loss at this level, losing at most the last commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(products)")]
+        if "store_id" not in columns:
+            conn.execute("ALTER TABLE products ADD COLUMN store_id INTEGER")
+        conn.commit()
+        self._conn = conn
+        self._store_ids = {host: store_id for store_id, host in conn.execute("SELECT id, host FROM stores")}
+        self._product_ids = {}
+        for product_id, url, store_id in conn.execute("SELECT id, url, store_id FROM products").fetchall():
+            if store_id is None:
+                store_id = self._store_id(store_of(url))
+                conn.execute("UPDATE products SET store_id = ? WHERE id = ?", (store_id, product_id))
+            self._product_ids[url] = (product_id, store_id)
+        self._in_stock_since = dict(conn.execute("SELECT variant_id, since FROM open_stock"))
+        conn.commit()
+
+    async def _on_event(self, event: VariantEvent):
+        self.record(event)
+
+    def record(self, event: VariantEvent):
+        """Buffer one event for the next batch; never blocks."""
+        self.received += 1
+        self._buffer.append((
+            event.key, event.variant_id, event.timestamp, KIND_CODES[event.kind],
+            1 if event.available else 0, event.price
+        ))
+        if len(self._buffer) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Recording must outlive any single bad batch
+                logger.error(f"Stock history flush failed: {e}")
+
+    async def flush(self):
+        """Write everything buffered so far.
+
+        A batch the database refuses, e.g. while it is locked, goes back to
+        the front of the buffer and is retried on the next flush. A batch that
+        fails for any other reason is written row by row, so only the rows
+        that cannot be written are dropped.
+        """
+        if self._buffer:
+            # Swap buffers so the loop never copies rows
+            rows, self._buffer = self._buffer, deque(maxlen=self._buffer.maxlen)
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self._write, rows)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write {len(rows)} stock history events, retrying: {e}")
+                self.failed_flushes += 1
+                self._requeue(rows)
+                return
+            except Exception as e:
+                logger.error(f"Failed to write {len(rows)} stock history events, writing them one by one: {e}")
+                self.failed_flushes += 1
+                written = await loop.run_in_executor(self._executor, self._write_each, rows)
+                self.written += written
+                if written < len(rows):
+                    logger.error(f"Dropped {len(rows) - written} stock history events that could not be written")
+                return
+            elapsed = time.perf_counter() - started
+            self.written += len(rows)
+            self.flushes += 1
+            self.flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def _requeue(self, rows: deque):
+        """Put rows back ahead of the events buffered since; the oldest go first beyond ``max_buffer``."""
+        buffer = deque(rows, maxlen=self._buffer.maxlen)
+        buffer.extend(self._buffer)
+        self._buffer = buffer
+
+    def _write_each(self, rows: deque) -> int:
+        written = 0
+        for row in rows:
+            try:
+                self._write(deque((row,)))
+                written += 1
+            except Exception as e:
+                logger.debug(f"Skipped stock history event {row}: {e}")
+        return written
+
+    def _store_id(self, host: str, added: Optional[Dict[str, int]] = None) -> int:
+        """Id of a store, inserting it if needed.
+
+        Args:
+            host: Store host
+            added: Where ids inserted inside an open transaction are kept until
+                it commits; None to cache them right away
+        """
+        store_id = self._store_ids.get(host)
+        if store_id is None and added is not None:
+            store_id = added.get(host)
+        if store_id is None:
+            self._conn.execute("INSERT OR IGNORE INTO stores (host) VALUES (?)", (host,))
+            store_id = self._conn.execute("SELECT id FROM stores WHERE host = ?", (host,)).fetchone()[0]
+            (self._store_ids if added is None else added)[host] = store_id
+        return store_id
+
+    def _product(self, url: str, added: Dict[str, Tuple[int, int]], added_stores: Dict[str, int]) -> Tuple[int, int]:
+        ids = self._product_ids.get(url) or added.get(url)
+        if ids is None:
+            store_id = self._store_id(store_of(url), added_stores)
+            self._conn.execute("INSERT OR IGNORE INTO products (url, store_id) VALUES (?, ?)", (url, store_id))
+            product_id = self._conn.execute("SELECT id FROM products WHERE url = ?", (url,)).fetchone()[0]
+            ids = added[url] = (product_id, store_id)
+        return ids
+
+    def _write(self, rows: deque):
+        events = []
+        # (store id, hour) -> [restocks, sellouts, price changes, stock seconds, periods]
+        hourly: Dict[Tuple[int, int], list] = {}
+        # (product id, day) -> [restocks, sellouts]
+        daily: Dict[Tuple[int, int], list] = {}
+        # The caches only learn about this batch once it is committed; a rolled
+        # back batch must not leave variants open or ids pointing at missing rows
+        opened: Dict[int, Tuple[int, float]] = {}
+        closed = set()
+        added_products: Dict[str, Tuple[int, int]] = {}
+        added_stores: Dict[str, int] = {}
+        in_stock_since = self._in_stock_since
+
+        with self._conn:
+            for url, variant_id, ts, kind, available, price_cents in rows:
+                product_id, store_id = self._product(url, added_products, added_stores)
+                events.append((product_id, variant_id, ts, kind, available, price_cents))
+                if variant_id in opened:
+                    since = opened[variant_id][1]
+                elif variant_id in closed:
+                    since = None
+                else:
+                    since = in_stock_since.get(variant_id)
+                if kind == PRICE_CODE:
+                    hourly.setdefault((store_id, int(ts // 3600) * 3600), [0, 0, 0, 0.0, 0])[2] += 1
+                elif available and kind != REMOVED_CODE:
+                    if since is not None:
+                        continue
+                    opened[variant_id] = (product_id, ts)
+                    closed.discard(variant_id)
+                    hourly.setdefault((store_id, int(ts // 3600) * 3600), [0, 0, 0, 0.0, 0])[0] += 1
+                    daily.setdefault((product_id, int(ts // 86400) * 86400), [0, 0])[0] += 1
+                else:
+                    if since is None:
+                        continue
+                    opened.pop(variant_id, None)
+                    closed.add(variant_id)
+                    hour = hourly.setdefault((store_id, int(ts // 3600) * 3600), [0, 0, 0, 0.0, 0])
+                    hour[3] += ts - since
+                    hour[4] += 1
+                    if kind == STOCK_CODE:
+                        hour[1] += 1
+                        daily.setdefault((product_id, int(ts // 86400) * 86400), [0, 0])[1] += 1
+
+            self._conn.executemany(
+                "INSERT INTO stock_events (product_id, variant_id, ts, kind, available, price_cents) "
+                "VALUES (?, ?, ?, ?, ?, ?)", events
+            )
+            self._conn.executemany(STORE_HOURLY_SQL, [(*key, *values) for key, values in hourly.items()])
+            self._conn.executemany(PRODUCT_DAILY_SQL, [(*key, *values) for key, values in daily.items()])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO open_stock (variant_id, product_id, since) VALUES (?, ?, ?)",
+                [(variant_id, *opening) for variant_id, opening in opened.items()]
+            )
+            self._conn.executemany("DELETE FROM open_stock WHERE variant_id = ?", [(v,) for v in closed])
+
+        self._store_ids.update(added_stores)
+        self._product_ids.update(added_products)
+        for variant_id in closed:
+            in_stock_since.pop(variant_id, None)
+        for variant_id, (_, since) in opened.items():
+            in_stock_since[variant_id] = since
+
+    async def _retention_loop(self):
+        while True:
+            await asyncio.sleep(self.retention_interval)
+            await self.apply_retention()
+
+    async def apply_retention(self, now: Optional[float] = None):
+        """Downsample raw events past ``raw_retention`` and drop expired rollups."""
+        try:
+            self.last_retention = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._apply_retention, now or time.time()
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Stock history retention failed: {e}")
+
+    def _apply_retention(self, now: float) -> Dict:
+        # Whole buckets only, so a bucket is never rolled up twice from partial data
+        cutoff = (now - self.raw_retention) // ROLLUP_BUCKET * ROLLUP_BUCKET
+        with self._conn:
+            self._conn.execute(ROLLUP_SQL, (cutoff,))
+            downsampled = self._conn.execute("DELETE FROM stock_events WHERE ts < ?", (cutoff,)).rowcount
+            expired = self._conn.execute(
+                "DELETE FROM stock_rollups WHERE bucket < ?", (now - self.rollup_retention,)
+            ).rowcount
+            self._conn.execute("DELETE FROM store_hourly WHERE bucket < ?", (now - self.rollup_retention,))
+            self._conn.execute("DELETE FROM product_daily WHERE day < ?", (now - self.rollup_retention,))
+        if downsampled or expired:
+            logger.info(f"Stock history downsampled {downsampled} events and expired {expired} rollups")
+        return {"at": now, "downsampled": downsampled, "expired": expired}
+
+    def query(self, product_url: str, since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 10000) -> List[Dict]:
+        """Return a product's raw events, oldest first.
+
+        Blocking; opens its own read connection, so it may be called from any
+        thread (WAL lets it read while the writer writes).
+
+        Args:
+            product_url: Canonical product URL
+            since: Only events at or after this Unix time
+            until: Only events before this Unix time
+            limit: Most events returned
+        """
+        with sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True) as conn:
+            rows = conn.execute(
+                "SELECT e.variant_id, e.ts, e.kind, e.available, e.price_cents FROM stock_events e "
+                "JOIN products p ON p.id = e.product_id "
+                "WHERE p.url = ? AND e.ts >= ? AND e.ts < ? ORDER BY e.ts LIMIT ?",
+                (product_url, since or 0, until or float("inf"), limit)
+            ).fetchall()
+        return [
+            {
+                "variant_id": str(variant_id),
+                "timestamp": ts,
+                "kind": KIND_NAMES[kind],
+                "available": bool(available),
+                "price": cents_to_price(price_cents)
+            }
+            for variant_id, ts, kind, available, price_cents in rows
+        ]
+
+    def get_stats(self) -> Dict:
+        """Return ingest counters and flush latency."""
+        return {
+            "buffered": len(self._buffer),
+            "received": self.received,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failedFlushes": self.failed_flushes,
+            "flushAvgMs": round(self.flush_seconds / self.flushes * 1000, 1) if self.flushes else 0.0,
+            "flushMaxMs": round(self.max_flush_seconds * 1000, 1),
+            "lastRetention": self.last_retention
+        }
+
+    async def close(self):
+        """Stop consuming, write what is buffered and close the database."""
+        for consumer in self._consumers:
+            await event_bus.unsubscribe(consumer)
+        self._consumers = []
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._conn is not None:
+            await self.flush()
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+
+
+# Shared bot-wide stock history
+stock_history = StockHistory()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+class UserResolver:
+    def __init__(self, ttl: float = 6 * 3600, maxsize: int = 50000, prewarm_concurrency: int = 5):
+        """Cache of opened DM channels, so a notification costs one API call.
+
+        Without it every DM may need ``fetch_user`` (when the user is not in
+        the gateway cache) and ``create_dm`` before the message itself. Channels
+        are kept for ``ttl`` seconds and the least recently used are evicted
+        beyond ``maxsize``. Concurrent lookups of the same user share a single
+        request.
+
+        Args:
+            ttl: Seconds a resolved channel is trusted
+            maxsize: Most channels kept
+            prewarm_concurrency: Lookups run at the same time by ``prewarm``
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.prewarm_concurrency = prewarm_concurrency
+        self.bot = None
+        # user id -> (expires at, DM channel), least recently used first
+        self._channels: "OrderedDict[int, Tuple[float, discord.abc.Messageable]]" = OrderedDict()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def bind(self, bot):
+        """Use ``bot`` for lookups; cached channels belong to its connection."""
+        if bot is not self.bot:
+            self._channels.clear()
+        self.bot = bot
+
+    async def get_dm_channel(self, user_id: int) -> discord.abc.Messageable:
+        """Return the DM channel of a user, opening it if needed.
+
+        Raises:
+            discord.NotFound: The user does not exist
+            discord.HTTPException: The channel could not be opened
+        """
+        user_id = int(user_id)
+        entry = self._channels.get(user_id)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._channels.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            del self._channels[user_id]
+
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = self._pending[user_id] = asyncio.get_running_loop().create_future()
+        try:
+            channel = await self._open(user_id)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(channel)
+            self._store(user_id, channel)
+            return channel
+        finally:
+            del self._pending[user_id]
+
+    async def _open(self, user_id: int) -> discord.abc.Messageable:
+        user = self.bot.get_user(user_id)
+        if user is None:
+            self.api_calls += 1
+            user = await self.bot.fetch_user(user_id)
+        if user.dm_channel is not None:
+            return user.dm_channel
+        self.api_calls += 1
+        return await user.create_dm()
+
+    def _store(self, user_id: int, channel: discord.abc.Messageable):
+        self._channels[user_id] = (time.monotonic() + self.ttl, channel)
+        self._channels.move_to_end(user_id)
+        while len(self._channels) > self.maxsize:
+            self._channels.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """Forget a user's channel, e.g. after Discord rejected a message to it."""
+        self._channels.pop(int(user_id), None)
+
+    async def prewarm(self, user_ids: Iterable):
+        """Resolve many users ahead of time, a few at a time.
+
+        Args:
+            user_ids: Discord user ids; failures are logged and skipped
+        """
+        user_ids = [int(user_id) for user_id in user_ids]
+        semaphore = asyncio.Semaphore(self.prewarm_concurrency)
+        failed = 0
+
+        async def resolve(user_id: int):
+            nonlocal failed
+            async with semaphore:
+                try:
+                    await self.get_dm_channel(user_id)
+                except discord.HTTPException as e:
+                    failed += 1
+                    logger.debug(f"Could not open DM channel for user {user_id}: {e}")
+
+        started = time.monotonic()
+        await asyncio.gather(*(resolve(user_id) for user_id in user_ids))
+        logger.info(f"Prewarmed DM channels for {len(user_ids) - failed}/{len(user_ids)} users "
+                    f"in {time.monotonic() - started:.1f}s")
+
+    def get_stats(self) -> Dict:
+        """Return cache size, hit rate and how many lookups reached the API."""
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._channels),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "apiCalls": self.api_calls
+        }
+
+
+# Shared bot-wide resolver
+user_resolver = UserResolver()
@@ -0,0 +1,123 @@
+import time
+from typing import Dict, List, Optional
+from utils.variant_state import VariantState, cents_to_price
+
+VARIANT_ADDED = "variant_added"
+VARIANT_REMOVED = "variant_removed"
+PRICE_CHANGED = "price_changed"
+STOCK_CHANGED = "stock_changed"
+
+
+class VariantEvent:
+    __slots__ = ("kind", "variant_id", "title", "price", "available", "old", "new", "timestamp", "key")
+
+    def __init__(self, kind: str, variant_id: int, title: str, price: int, available: bool,
+                 old=None, new=None, timestamp: Optional[float] = None, key: str = ""):
+        """A single change to one variant of a product.
+
+        Args:
+            kind: One of ``VARIANT_ADDED``, ``VARIANT_REMOVED``, ``PRICE_CHANGED``, ``STOCK_CHANGED``
+            variant_id: Shopify variant id
+            title: Variant title
+            price: Current price in cents (last known price for a removed variant)
+            available: Current availability (last known for a removed variant)
+            old: Previous value of the changed field: cents for a price change,
+                a bool for a stock change, None otherwise
+            new: New value of the changed field
+            timestamp: Unix time the change was observed
+            key: Canonical URL of the product the variant belongs to
+        """
+        self.kind = kind
+        self.variant_id = variant_id
+        self.title = title
+        self.price = price
+        self.available = available
+        self.old = old
+        self.new = new
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.key = key
+
+    @property
+    def is_restock(self) -> bool:
+        """True when the event puts an in-stock variant on sale."""
+        if self.kind == STOCK_CHANGED:
+            return bool(self.new)
+        return self.kind == VARIANT_ADDED and self.available
+
+    def to_dict(self) -> Dict:
+        return {
+            "product": self.key,
+            "kind": self.kind,
+            "variant_id": str(self.variant_id),
+            "title": self.title,
+            "price": cents_to_price(self.price),
+            "available": self.available,
+            "old": cents_to_price(self.old) if self.kind == PRICE_CHANGED else self.old,
+            "new": cents_to_price(self.new) if self.kind == PRICE_CHANGED else self.new,
+            "timestamp": self.timestamp
+        }
+
+    def __repr__(self) -> str:
+        return f"VariantEvent({self.kind}, {self.variant_id}, {self.old!r} -> {self.new!r})"
+
+
+class ProductUpdate:
+    __slots__ = ("key", "product", "state", "events", "initial")
+
+    def __init__(self, key: str, product: Dict, state: Optional[VariantState],
+                 events: List[VariantEvent], initial: bool = False):
+        """What a product feed subscriber receives.
+
+        Args:
+            key: Canonical product URL
+            product: Latest parsed ``product`` object
+            state: Compact variant snapshot matching ``product``
+            events: Variant changes since the previous delivery, oldest first
+            initial: True for a subscriber's first delivery, or one it asked for
+                with ``request_snapshot``; ``events`` may be empty then
+        """
+        self.key = key
+        self.product = product
+        self.state = state
+        self.events = events
+        self.initial = initial
+
+
+def diff_states(previous: VariantState, current: VariantState,
+                timestamp: Optional[float] = None, key: str = "") -> List[VariantEvent]:
+    """Turn the difference between two snapshots into typed events.
+
+    Work is proportional to the number of changed variants whenever the
+    variant list itself is unchanged.
+
+    Args:
+        previous: Older snapshot
+        current: Newer snapshot of the same product
+        timestamp: Unix time of the newer snapshot, defaults to now
+        key: Product key stamped on every event
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    diff = current.diff(previous)
+    events = []
+    for position in diff["new"]:
+        events.append(VariantEvent(
+            VARIANT_ADDED, current.ids[position], current.titles[position], current.prices[position],
+            current.is_available(position), timestamp=timestamp, key=key
+        ))
+    for position in diff["removed"]:
+        events.append(VariantEvent(
+            VARIANT_REMOVED, previous.ids[position], previous.titles[position], previous.prices[position],
+            previous.is_available(position), timestamp=timestamp, key=key
+        ))
+    for position, old, new in diff["price"]:
+        events.append(VariantEvent(
+            PRICE_CHANGED, current.ids[position], current.titles[position], new,
+            current.is_available(position), old, new, timestamp, key
+        ))
+    for position in diff["stock"]:
+        available = current.is_available(position)
+        events.append(VariantEvent(
+            STOCK_CHANGED, current.ids[position], current.titles[position], current.prices[position],
+            available, not available, available, timestamp, key
+        ))
+    return events
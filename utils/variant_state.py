@@ -0,0 +1,146 @@
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def price_to_cents(price) -> int:
+    """Convert a Shopify price to integer cents.
+
+    Theme ``var meta`` objects already report integer cents; the JSON
+    endpoints return a decimal string such as ``"129.99"``.
+    """
+    if price is None:
+        return 0
+    if isinstance(price, int):
+        return price
+    whole, _, fraction = str(price).partition(".")
+    return int(whole or 0) * 100 + int((fraction + "00")[:2])
+
+
+def cents_to_price(cents: int) -> str:
+    """Format integer cents as the decimal string Shopify uses."""
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def _bits(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits of ``mask``, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class VariantState:
+    __slots__ = ("ids", "prices", "available", "titles", "_index")
+
+    def __init__(self, ids: array, prices: array, available: int, titles: Tuple[str, ...]):
+        """Compact snapshot of a product's variants.
+
+        Variant ids and prices live in parallel ``array('q')`` columns, prices in
+        integer cents, and availability is a single int used as a bitset where
+        bit ``i`` belongs to ``ids[i]``. A 100-variant product costs a few
+        hundred bytes instead of a hundred dicts.
+
+        Args:
+            ids: Variant ids in storefront order
+            prices: Price of each variant in cents
+            available: Availability bitset
+            titles: Variant titles, interned so equal titles share one string
+        """
+        self.ids = ids
+        self.prices = prices
+        self.available = available
+        self.titles = titles
+        self._index: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def from_variants(cls, variants: List[Dict]) -> "VariantState":
+        """Build a state from the ``variants`` list of any product source."""
+        ids = array("q")
+        prices = array("q")
+        titles = []
+        available = 0
+        for position, variant in enumerate(variants):
+            ids.append(int(variant.get("id") or 0))
+            prices.append(price_to_cents(variant.get("price")))
+            titles.append(sys.intern(variant.get("title") or variant.get("public_title") or ""))
+            if variant.get("available"):
+                available |= 1 << position
+        return cls(ids, prices, available, tuple(titles))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, VariantState):
+            return NotImplemented
+        return (self.available == other.available and self.ids == other.ids
+                and self.prices == other.prices and self.titles == other.titles)
+
+    def index_of(self, variant_id: int) -> Optional[int]:
+        """Return the position of a variant, or None if the product does not have it."""
+        if self._index is None:
+            self._index = {variant_id: position for position, variant_id in enumerate(self.ids)}
+        return self._index.get(int(variant_id))
+
+    def is_available(self, position: int) -> bool:
+        return bool(self.available >> position & 1)
+
+    def available_ids(self) -> List[int]:
+        return [self.ids[position] for position in _bits(self.available)]
+
+    def any_available(self) -> bool:
+        return self.available != 0
+
+    def variant(self, position: int) -> Dict:
+        """Expand one variant back into the dict shape monitors expect."""
+        return {
+            "id": self.ids[position],
+            "title": self.titles[position],
+            "price": cents_to_price(self.prices[position]),
+            "available": self.is_available(position)
+        }
+
+    def diff(self, previous: "VariantState") -> Dict[str, List]:
+        """Compare with an older snapshot of the same product.
+
+        When the variant list is unchanged, which is nearly always, stock
+        changes come from one XOR of the two bitsets and prices from a C-level
+        array comparison; only differing positions are looked at.
+
+        Args:
+            previous: Snapshot from the previous poll
+
+        Returns:
+            Dict[str, List]: ``new`` and ``removed`` variant positions (into this
+            and the previous state respectively), ``price`` as
+            ``(position, old_cents, new_cents)`` and ``stock`` as positions whose
+            availability flipped
+        """
+        changes = {"new": [], "removed": [], "price": [], "stock": []}
+        if self.ids == previous.ids:
+            flipped = self.available ^ previous.available
+            changes["stock"] = list(_bits(flipped))
+            if self.prices != previous.prices:
+                changes["price"] = [
+                    (position, old, new)
+                    for position, (old, new) in enumerate(zip(previous.prices, self.prices))
+                    if old != new
+                ]
+            return changes
+
+        # Variants were added, removed or reordered: match them up by id
+        for position, variant_id in enumerate(self.ids):
+            old_position = previous.index_of(variant_id)
+            if old_position is None:
+                changes["new"].append(position)
+                continue
+            if previous.prices[old_position] != self.prices[position]:
+                changes["price"].append((position, previous.prices[old_position], self.prices[position]))
+            if previous.is_available(old_position) != self.is_available(position):
+                changes["stock"].append(position)
+        changes["removed"] = [
+            position for position, variant_id in enumerate(previous.ids)
+            if self.index_of(variant_id) is None
+        ]
+        return changes
@@ -1,10 +1,12 @@
 
-import aiohttp
 import logging
 import json
-import asyncio
 from typing import Dict, List, Optional
 from datetime import datetime
+from utils.circuit_breaker import CircuitOpenError
+from utils.http_client import session_registry
+from utils.variant_events import VariantEvent, diff_states
+from utils.variant_state import VariantState
 
 logger = logging.getLogger(__name__)
 
@@ -12,105 +14,119 @@ class VariantTracker:
     def __init__(self):
         self.variants_cache = {}
         self.last_check = {}
-        self.rate_limit_delay = 1  # seconds between requests
+        self.not_modified = set()  # URLs whose last fetch returned 304 or identical bytes
+        self.body_digests = {}
         
-    async def fetch_variants(self, product_url: str) -> Optional[List[Dict]]:
-        """Fetch variants for a product with rate limiting."""
-        # Respect rate limiting
-        now = datetime.now()
-        if product_url in self.last_check:
-            time_diff = (now - self.last_check[product_url]).total_seconds()
-            if time_diff < self.rate_limit_delay:
-                await asyncio.sleep(self.rate_limit_delay - time_diff)
-        
-        try:
-            # Convert URL to .json if needed
-            if not product_url.endswith('.json'):
-                product_url = product_url.rstrip('/') + '.json'
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(product_url) as response:
-                    if response.status == 429:  # Rate limited
-                        logger.warning(f"Rate limited while fetching variants for {product_url}")
-                        await asyncio.sleep(5)  # Wait longer when rate limited
-                        return None
-                        
-                    if response.status != 200:
-                        logger.error(f"Failed to fetch variants: {response.status}")
-                        return None
-                        
-                    data = await response.json()
-                    variants = data.get('product', {}).get('variants', [])
-                    
-                    # Update cache
-                    self.variants_cache[product_url] = variants
-                    self.last_check[product_url] = now
-                    
-                    return variants
-                    
-        except Exception as e:
-            logger.error(f"Error fetching variants: {e}")
-            return None
-            
-    async def track_changes(self, product_url: str) -> Optional[Dict]:
-        """Track changes in variants compared to last check."""
-        current_variants = await self.fetch_variants(product_url)
-        if not current_variants:
-            return None
-            
-        changes = {
-            'new_variants': [],
-            'removed_variants': [],
-            'price_changes': [],
-            'stock_changes': []
-        }
+    def record(self, key: str, variants: List[Dict], timestamp: Optional[float] = None) -> List[VariantEvent]:
+        """Store a new snapshot of a product's variants and diff it against the last one.
         
-        # Get previous variants
-        previous_variants = self.variants_cache.get(product_url, [])
+        Used by the product feed, which already has the decoded product. The
+        first snapshot of a product is the baseline and produces no events.
         
-        # Convert to dict for easier comparison
-        current_dict = {str(v['id']): v for v in current_variants}
-        previous_dict = {str(v['id']): v for v in previous_variants}
+        Args:
+            key: Product key, e.g. its canonical URL
+            variants: ``variants`` list of the product
+            timestamp: Unix time the snapshot was taken, defaults to now
         
-        # Check for new and removed variants
-        current_ids = set(current_dict.keys())
-        previous_ids = set(previous_dict.keys())
+        Returns:
+            List[VariantEvent]: Changes since the previous snapshot, possibly empty
+        """
+        state = VariantState.from_variants(variants)
+        previous = self.variants_cache.get(key)
+        self.variants_cache[key] = state
+        self.last_check[key] = datetime.now()
+        if previous is None or previous == state:
+            return []
+        return diff_states(previous, state, timestamp, key)
+    
+    def get_state(self, key: str) -> Optional[VariantState]:
+        """Return the latest snapshot recorded for a product."""
+        return self.variants_cache.get(key)
+    
+    def forget(self, key: str):
+        """Drop everything stored for a product."""
+        self.variants_cache.pop(key, None)
+        self.last_check.pop(key, None)
+        self.body_digests.pop(key, None)
+        self.not_modified.discard(key)
         
-        new_ids = current_ids - previous_ids
-        removed_ids = previous_ids - current_ids
+    @staticmethod
+    def _json_url(product_url: str) -> str:
+        """Return the ``.json`` endpoint for a product URL."""
+        if product_url.endswith('.json'):
+            return product_url
+        return product_url.rstrip('/') + '.json'
         
-        changes['new_variants'] = [current_dict[id] for id in new_ids]
-        changes['removed_variants'] = [previous_dict[id] for id in removed_ids]
+    async def fetch_variants(self, product_url: str) -> Optional[VariantState]:
+        """Fetch variants for a product.
         
-        # Check for price and stock changes
-        for variant_id in current_ids & previous_ids:
-            current = current_dict[variant_id]
-            previous = previous_dict[variant_id]
+        Rate limiting, including 429 Retry-After handling, is done per store by
+        the shared fetch layer. Only the compact ``VariantState`` is cached, not
+        the raw variant JSON.
+        """
+        now = datetime.now()
+        try:
+            # Convert URL to .json if needed
+            product_url = self._json_url(product_url)
             
-            if current.get('price') != previous.get('price'):
-                changes['price_changes'].append({
-                    'variant_id': variant_id,
-                    'old_price': previous.get('price'),
-                    'new_price': current.get('price')
-                })
+            cached = self.variants_cache.get(product_url)
+            result = await session_registry.fetch(product_url, conditional=cached is not None)
+            if result.not_modified:
+                # Unchanged since the last check, nothing to decode
+                self.not_modified.add(product_url)
+                self.last_check[product_url] = now
+                return cached
+            self.not_modified.discard(product_url)
+            
+            if result.status == 429:  # Rate limited, the store is now throttled
+                logger.warning(f"Rate limited while fetching variants for {product_url}")
+                return None
                 
-            if current.get('available') != previous.get('available'):
-                changes['stock_changes'].append({
-                    'variant_id': variant_id,
-                    'title': current.get('title'),
-                    'available': current.get('available')
-                })
+            if result.status != 200:
+                logger.error(f"Failed to fetch variants: {result.status}")
+                return None
                 
-        return changes if any(changes.values()) else None
+            if cached is not None and self.body_digests.get(product_url) == result.digest:
+                # Identical bytes to the last check, skip decoding
+                self.not_modified.add(product_url)
+                self.last_check[product_url] = now
+                return cached
+            
+            data = json.loads(result.body)
+            state = VariantState.from_variants(data.get('product', {}).get('variants', []))
+            
+            # Update cache
+            self.variants_cache[product_url] = state
+            self.body_digests[product_url] = result.digest
+            self.last_check[product_url] = now
+            
+            return state
+                
+        except CircuitOpenError as e:
+            logger.debug(f"Skipped variant check: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching variants: {e}")
+            return None
+            
+    async def track_changes(self, product_url: str) -> Optional[List[VariantEvent]]:
+        """Fetch a product and return the variant events since the last check.
+        
+        Returns:
+            Optional[List[VariantEvent]]: The events, or None if nothing changed
+            or there is no earlier snapshot to compare with
+        """
+        previous = self.variants_cache.get(self._json_url(product_url))
+        current = await self.fetch_variants(product_url)
+        if not current or previous is None or current is previous:
+            return None
+        return diff_states(previous, current, key=self._json_url(product_url)) or None
 
     async def get_variant_details(self, product_url: str, variant_id: str) -> Optional[Dict]:
         """Get detailed information about a specific variant."""
-        variants = await self.fetch_variants(product_url)
-        if not variants:
+        state = await self.fetch_variants(product_url)
+        if not state:
             return None
             
-        for variant in variants:
-            if str(variant.get('id')) == str(variant_id):
-                return variant
-                
-        return None
+        position = state.index_of(int(variant_id))
+        return state.variant(position) if position is not None else None
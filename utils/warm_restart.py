@@ -0,0 +1,153 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from utils.product_metadata import slim_product
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.path.join("instance", "feed_checkpoint.json")
+CHECKPOINT_VERSION = 1
+
+# A job restored at startup: starts one monitor, alert or checkout task
+RestoreJob = Callable[[], Union[Awaitable[None], None]]
+
+
+class FeedCheckpoint:
+    def __init__(self, feed, path: str = CHECKPOINT_PATH, interval: float = 30, max_age: float = 24 * 3600):
+        """Periodically saves the last known state of every watched product.
+
+        The checkpoint holds the slimmed product (and so every variant's price
+        and availability) last seen by the feed. At startup it is handed to
+        ``ProductFeed.restore`` so resumed monitors diff against what they
+        already announced rather than starting from nothing.
+
+        Args:
+            feed: ``ProductFeed`` to checkpoint
+            path: File the checkpoint is written to, atomically
+            interval: Seconds between checkpoints
+            max_age: Checkpoints older than this are ignored at startup
+        """
+        self.feed = feed
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self._task: Optional[asyncio.Task] = None
+        self.saves = 0
+        self.last_saved: Optional[float] = None
+        self.last_size = 0
+
+    def load(self) -> Dict[str, Dict]:
+        """Read the checkpoint; blocking, run it in an executor.
+
+        Returns:
+            Dict[str, Dict]: Canonical product URL -> product, empty when there
+            is no usable checkpoint
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read feed checkpoint {self.path}: {e}")
+            return {}
+
+        if data.get("version") != CHECKPOINT_VERSION:
+            logger.warning(f"Ignoring feed checkpoint with version {data.get('version')}")
+            return {}
+        age = time.time() - data.get("savedAt", 0)
+        if age > self.max_age:
+            logger.warning(f"Ignoring feed checkpoint saved {age / 3600:.1f}h ago")
+            return {}
+        products = data.get("products", {})
+        logger.info(f"Loaded feed checkpoint with {len(products)} products, {age:.0f}s old")
+        return products
+
+    def snapshot(self) -> Dict:
+        """Collect the current state on the loop; cheap, no I/O."""
+        return {
+            "version": CHECKPOINT_VERSION,
+            "savedAt": time.time(),
+            "products": {key: slim_product(product) for key, product in self.feed._latest.items()}
+        }
+
+    def write(self, data: Dict):
+        """Write a snapshot to disk atomically; blocking, run it in an executor."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self.saves += 1
+        self.last_saved = data["savedAt"]
+        self.last_size = len(data["products"])
+
+    async def save(self):
+        """Checkpoint now without blocking the loop on disk I/O."""
+        data = self.snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, data)
+        except OSError as e:
+            logger.error(f"Could not write feed checkpoint {self.path}: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    async def stop(self):
+        """Stop checkpointing and write a final checkpoint.
+
+        Does nothing if checkpointing never started, so a bot stopped before
+        its jobs were restored does not overwrite the checkpoint with less.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.save()
+
+    def get_stats(self) -> Dict:
+        return {
+            "saves": self.saves,
+            "lastSaved": self.last_saved,
+            "products": self.last_size
+        }
+
+
+async def restore_staggered(jobs: List[RestoreJob], spread: float):
+    """Start restored jobs spread randomly over ``spread`` seconds.
+
+    Restarting thousands of monitors at once would poll every store in the
+    same instant; jitter keeps the first cycle as smooth as steady state.
+
+    Args:
+        jobs: Callables starting one job each, sync or async
+        spread: Seconds over which the jobs are started
+    """
+    async def start(job: RestoreJob):
+        await asyncio.sleep(random.uniform(0, spread))
+        try:
+            result = job()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Failed to restore job: {e}")
+
+    started = time.monotonic()
+    await asyncio.gather(*(start(job) for job in jobs))
+    logger.info(f"Restored {len(jobs)} jobs in {time.monotonic() - started:.1f}s")